@@ -0,0 +1,200 @@
+# Материализованные агрегаты для статистики: функции читают готовый результат, обновление по расписанию
+import argparse
+import re
+
+from psycopg2 import errors
+
+from db import Database
+
+# Функции без аргументов, чей результат хранится в материализованном представлении
+AGGREGATED_FUNCTIONS = (
+    'get_course_statistics',
+    'get_school_course_stats',
+    'get_order_counts_rollup',
+    'get_course_counts_by_district',
+)
+# Естественный ключ результата — столбцы группировки. По уникальному индексу на нём
+# REFRESH ... CONCURRENTLY переписывает только изменившиеся строки; для функции без
+# записи здесь ключом берутся все нечисловые столбцы результата
+AGGREGATE_KEYS = {
+    'get_order_counts_rollup': ('district_name', 'driving_school_name'),
+    'get_course_counts_by_district': ('district_name',),
+}
+_NUMERIC = ('smallint', 'integer', 'bigint', 'numeric', 'real', 'double precision', 'money')
+LIVE_SUFFIX = '_live'  # исходная функция после установки, считает агрегат заново
+VIEW_PREFIX = 'mv_'
+
+# Версия источников — счётчики изменений из pg_stat_user_tables, как в ResultCache:
+# триггеры на таблицах фактов не нужны, и запись в них ничем не блокируется.
+# У секционированной таблицы счётчики суммируются по всем секциям
+_VERSION = """array(SELECT coalesce((SELECT sum(s.n_tup_ins + s.n_tup_upd + s.n_tup_del)
+                                   FROM pg_partition_tree(to_regclass('public.' || t.name)) p
+                                   JOIN pg_stat_user_tables s ON s.relid = p.relid), 0)::bigint
+                 FROM unnest({tables}) WITH ORDINALITY t(name, i)
+                ORDER BY t.i)"""
+
+STATE_DDL = f"""
+CREATE TABLE IF NOT EXISTS aggregate_state (
+  function_name  text PRIMARY KEY,
+  view_name      text NOT NULL,
+  source_tables  text[] NOT NULL,
+  source_version bigint[],
+  refreshed_at   timestamptz
+);
+CREATE OR REPLACE FUNCTION public.aggregate_status()
+ RETURNS TABLE(function_name text, refreshed_at timestamptz, stale boolean)
+ LANGUAGE sql STABLE AS $$
+  SELECT a.function_name, a.refreshed_at,
+         a.source_version IS DISTINCT FROM {_VERSION.format(tables='a.source_tables')}
+    FROM aggregate_state AS a;
+$$;
+"""
+
+_IDENT = re.compile(r'[a-z_][a-z0-9_]*')
+
+
+class MaterializedAggregates:
+    """Материализованные представления для тяжёлых агрегатов статистики.
+
+    install() переименовывает функцию f в f_live, сохраняет её результат в
+    mv_f и создаёт f с той же сигнатурой, читающую mv_f в порядке ключа, —
+    вызывающий код не меняется, а время ответа не зависит от размера
+    таблиц фактов.
+    refresh() обновляет устаревшие представления через REFRESH ... CONCURRENTLY
+    (чтение во время обновления не блокируется); устаревание определяется
+    по счётчикам изменений таблиц, упомянутых в теле f_live.
+    """
+
+    def __init__(self, db, functions=AGGREGATED_FUNCTIONS):
+        self.db = db
+        self.functions = tuple(functions)
+
+    def installed(self):
+        return self.db.fetch_all(
+            "SELECT to_regclass('public.aggregate_state') IS NOT NULL AS ok;")[0]['ok']
+
+    def install(self):
+        """Материализует функции из self.functions; возвращает установленные."""
+        self.db.execute_autocommit(STATE_DDL)
+        done = []
+        for func in self.functions:
+            try:
+                with self.db.transaction():
+                    if self._install(func):
+                        done.append(func)
+            except errors.UniqueViolation:
+                # ключ не уникален в результате: функция остаётся как была
+                print(f"{func}: строки результата не различаются по ключу, пропуск")
+        return done
+
+    def key(self, func, columns):
+        """Столбцы уникального индекса mv_func; columns — [(имя, тип)] результата."""
+        if func in AGGREGATE_KEYS:
+            return list(AGGREGATE_KEYS[func])
+        names = [n for n, t in columns if t.split('(')[0] not in _NUMERIC]
+        return names or [n for n, _ in columns]
+
+    def _install(self, func):
+        live, view = func + LIVE_SUFFIX, VIEW_PREFIX + func
+        if not self._exists(live):
+            if not self._exists(func):
+                return False
+            self.db.execute(f"ALTER FUNCTION public.{func}() RENAME TO {live};")
+        # прежняя версия нумеровала строки row_number() OVER (): номер не
+        # детерминирован, и CONCURRENTLY переписывал все строки
+        if self.db.fetch_all("SELECT 1 FROM pg_attribute WHERE attrelid = to_regclass(%s) "
+                             "AND attname = '_row';", [view]):
+            self.db.execute(f"DROP MATERIALIZED VIEW {view};")
+        self.db.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS SELECT * FROM {live}();")
+        info = self.db.fetch_all(
+            "SELECT pg_get_function_result(p.oid) AS result, p.prosrc FROM pg_proc p "
+            "JOIN pg_namespace n ON n.oid = p.pronamespace "
+            "WHERE n.nspname = 'public' AND p.proname = %s AND p.pronargs = 0;", [live])[0]
+        columns = [(r['attname'], r['type']) for r in self.db.fetch_all(
+            "SELECT attname, format_type(atttypid, atttypmod) AS type FROM pg_attribute "
+            "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped ORDER BY attnum;",
+            [view])]
+        key = self.key(func, columns)
+        self.db.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {view}_key ON {view} ({', '.join(key)});")
+        order = ', '.join(f"{k} NULLS LAST" for k in key)
+        self.db.execute(f"CREATE OR REPLACE FUNCTION public.{func}() RETURNS {info['result']} "
+                        f"LANGUAGE sql STABLE AS $$ SELECT {', '.join(n for n, _ in columns)} "
+                        f"FROM {view} ORDER BY {order} $$;")
+        tables = [r['relname'] for r in self.db.fetch_all(
+            "SELECT relname FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = 'public' AND c.relkind IN ('r','p') AND c.relname = ANY(%s) "
+            "ORDER BY relname;", [sorted(set(_IDENT.findall(info['prosrc'].lower())))])]
+        self.db.execute(
+            f"INSERT INTO aggregate_state (function_name, view_name, source_tables, "
+            f"source_version, refreshed_at) "
+            f"VALUES (%(f)s, %(v)s, %(t)s::text[], {_VERSION.format(tables='%(t)s::text[]')}, now()) "
+            f"ON CONFLICT (function_name) DO UPDATE SET view_name = EXCLUDED.view_name, "
+            f"source_tables = EXCLUDED.source_tables;", {'f': func, 'v': view, 't': tables})
+        return True
+
+    def uninstall(self):
+        """Возвращает исходные функции и удаляет представления."""
+        if not self.installed():
+            return
+        for r in self.db.fetch_all("SELECT function_name, view_name FROM aggregate_state;"):
+            func, live = r['function_name'], r['function_name'] + LIVE_SUFFIX
+            with self.db.transaction():
+                if self._exists(live):
+                    self.db.execute(f"DROP FUNCTION IF EXISTS public.{func}();")
+                    self.db.execute(f"ALTER FUNCTION public.{live}() RENAME TO {func};")
+                self.db.execute(f"DROP MATERIALIZED VIEW IF EXISTS {r['view_name']};")
+                self.db.execute("DELETE FROM aggregate_state WHERE function_name = %s;", [func])
+
+    def _exists(self, func):
+        return bool(self.db.fetch_all(
+            "SELECT 1 FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace "
+            "WHERE n.nspname = 'public' AND p.proname = %s AND p.pronargs = 0;", [func]))
+
+    def status(self):
+        """{функция: {'refreshed_at', 'stale'}}; пусто, если агрегаты не установлены."""
+        if not self.installed():
+            return {}
+        return {r['function_name']: {'refreshed_at': r['refreshed_at'], 'stale': r['stale']}
+                for r in self.db.fetch_all("SELECT * FROM aggregate_status();")}
+
+    def refresh(self, force=False):
+        """Обновляет устаревшие (или все при force) представления; возвращает их функции."""
+        done = []
+        for func, st in self.status().items():
+            if not (force or st['stale']):
+                continue
+            row = self.db.fetch_all(
+                f"SELECT view_name, {_VERSION.format(tables='source_tables')} AS version "
+                f"FROM aggregate_state WHERE function_name = %s;", [func])[0]
+            # версия снимается до обновления: изменения во время REFRESH дадут ещё один проход
+            self.db.execute_autocommit(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {row['view_name']};")
+            self.db.execute("UPDATE aggregate_state SET source_version = %s, refreshed_at = now() "
+                            "WHERE function_name = %s;", [row['version'], func])
+            done.append(func)
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Материализованные агрегаты статистики")
+    parser.add_argument('action', choices=['install', 'uninstall', 'refresh', 'status'])
+    parser.add_argument('--force', action='store_true', help="обновить все представления")
+    parser.add_argument('--dsn', default="host=localhost dbname=kurs_bd user=postgres password=admin2005")
+    args = parser.parse_args()
+    db = Database(args.dsn)
+    try:
+        agg = MaterializedAggregates(db)
+        if args.action == 'install':
+            print("установлено:", ', '.join(agg.install()) or "ничего")
+        elif args.action == 'uninstall':
+            agg.uninstall()
+        elif args.action == 'refresh':
+            print("обновлено:", ', '.join(agg.refresh(args.force)) or "ничего")
+        for func, st in agg.status().items():
+            print(f"{func:<35} {st['refreshed_at']:%Y-%m-%d %H:%M:%S} "
+                  f"{'устарело' if st['stale'] else 'актуально'}")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import asyncio
+import contextvars
+import time
+from contextlib import asynccontextmanager
+
+import asyncpg
+from psycopg2.extensions import parse_dsn
+
+from db import QueryEvent, numbered
+
+
+def _args(query, params):
+    if isinstance(params, dict):
+        sql, order = numbered(query)
+        return sql, [params[n] for n in order]
+    # как Database (params or ()): %% раскрывается и без параметров
+    return numbered(query)[0], list(params or ())
+
+
+def _connect_kwargs(dsn):
+    """Строка libpq (host=... dbname=...) в аргументы asyncpg."""
+    kw = parse_dsn(dsn)
+    if 'dbname' in kw:
+        kw['database'] = kw.pop('dbname')
+    if 'port' in kw:
+        kw['port'] = int(kw['port'])
+    return kw
+
+
+class AsyncDatabase:
+    """Асинхронный вариант Database на asyncpg.
+
+    Те же fetch_all/execute/call_function и тот же синтаксис параметров
+    (%s, %(имя)s), но корутины: составной экран запускает все запросы
+    сразу через gather()/call_functions(), и каждый идёт по своему
+    соединению пула — время загрузки равно времени самого долгого
+    запроса, а не их сумме. Строки возвращаются словарями, как у
+    RealDictCursor, хуки получают QueryEvent.
+    """
+
+    def __init__(self, dsn, pool_min=1, pool_max=10, idle_timeout=300.0):
+        self.dsn = dsn
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.idle_timeout = idle_timeout
+        self.pool = None
+        self.hooks = []
+        self._conn = contextvars.ContextVar('conn', default=None)
+        self._wait_ms = contextvars.ContextVar('wait_ms', default=0.0)
+
+    async def open(self):
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                min_size=self.pool_min, max_size=self.pool_max,
+                max_inactive_connection_lifetime=self.idle_timeout, **_connect_kwargs(self.dsn))
+        return self
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Как Database.transaction: вложенные вызовы в той же задаче используют
+        открытое соединение, фиксация при выходе из внешнего блока."""
+        conn = self._conn.get()
+        if conn is not None:
+            yield conn
+            return
+        start = time.perf_counter()
+        async with self.pool.acquire() as conn:
+            token = self._conn.set(conn)
+            self._wait_ms.set((time.perf_counter() - start) * 1000)
+            try:
+                async with conn.transaction():
+                    yield conn
+            finally:
+                self._conn.reset(token)
+
+    @asynccontextmanager
+    async def _traced(self, query, params):
+        if not self.hooks:
+            yield None
+            return
+        event = QueryEvent(query, params, self._wait_ms.get())
+        self._wait_ms.set(0.0)
+        start = time.perf_counter()
+        try:
+            yield event
+        except BaseException as e:
+            event.error = f"{type(e).__name__}: {e}".strip()
+            raise
+        finally:
+            event.duration_ms = (time.perf_counter() - start) * 1000
+            for hook in list(self.hooks):
+                hook(event)
+
+    async def fetch_all(self, query, params=None):
+        sql, args = _args(query, params)
+        async with self.transaction() as conn, self._traced(query, params) as ev:
+            rows = [dict(r) for r in await conn.fetch(sql, *args)]
+            if ev:
+                ev.rows = len(rows)
+            return rows
+
+    async def execute(self, query, params=None):
+        sql, args = _args(query, params)
+        async with self.transaction() as conn, self._traced(query, params) as ev:
+            status = await conn.execute(sql, *args)
+            if ev:
+                # 'UPDATE 3', 'INSERT 0 3' — число строк последним словом
+                tail = status.rsplit(' ', 1)[-1]
+                ev.rows = int(tail) if tail.isdigit() else 0
+            return status
+
+    async def execute_returning(self, query, params=None):
+        sql, args = _args(query, params)
+        async with self.transaction() as conn, self._traced(query, params):
+            row = await conn.fetchrow(sql, *args)
+            return tuple(row) if row is not None else None
+
+    async def call_function(self, func_name, params=None):
+        placeholders = ','.join(['%s'] * (len(params) if params else 0))
+        return await self.fetch_all(f"SELECT * FROM {func_name}({placeholders});", params)
+
+    async def gather(self, queries):
+        """[(query, params)] -> список результатов fetch_all, запросы идут одновременно."""
+        return await asyncio.gather(*(self.fetch_all(q, p) for q, p in queries))
+
+    async def call_functions(self, calls):
+        """{имя: параметры} -> {имя: строки}; все функции вызываются одновременно."""
+        names = list(calls)
+        results = await asyncio.gather(*(self.call_function(n, calls[n]) for n in names))
+        return dict(zip(names, results))
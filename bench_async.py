@@ -0,0 +1,63 @@
+# Загрузка составного экрана: последовательные запросы Database против одновременных AsyncDatabase
+import asyncio
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from async_db import AsyncDatabase
+from db import Database
+
+DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
+DASHBOARD = [
+    'get_course_statistics',
+    'get_review_summary',
+    'get_course_counts_by_district',
+    'get_school_course_stats',
+    'get_top_instructors',
+    'get_applications_by_school_and_district',
+]
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), max(times)
+
+
+def main(repeat=20):
+    db = Database(DSN, pool_max=len(DASHBOARD))
+    adb = AsyncDatabase(DSN, pool_min=len(DASHBOARD), pool_max=len(DASHBOARD))
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(adb.open())
+        calls = {f: None for f in DASHBOARD}
+        # прогрев: соединения пулов и планы на сервере
+        for f in DASHBOARD:
+            db.fetch_all(f"SELECT * FROM {f}();")
+        loop.run_until_complete(adb.call_functions(calls))
+
+        slowest = max(timed(lambda f=f: db.fetch_all(f"SELECT * FROM {f}();"), repeat)[0]
+                      for f in DASHBOARD)
+        seq = timed(lambda: [db.fetch_all(f"SELECT * FROM {f}();") for f in DASHBOARD], repeat)
+        with ThreadPoolExecutor(max_workers=len(DASHBOARD)) as ex:
+            threads = timed(lambda: list(ex.map(
+                lambda f: db.fetch_all(f"SELECT * FROM {f}();"), DASHBOARD)), repeat)
+        conc = timed(lambda: loop.run_until_complete(adb.call_functions(calls)), repeat)
+
+        print(f"запросов на экран: {len(DASHBOARD)}, повторов: {repeat}; мс, медиана / максимум")
+        print(f"Database, по очереди      {seq[0]:8.1f} / {seq[1]:8.1f}")
+        print(f"Database, потоки          {threads[0]:8.1f} / {threads[1]:8.1f}")
+        print(f"AsyncDatabase, gather     {conc[0]:8.1f} / {conc[1]:8.1f}  x{seq[0] / conc[0]:.1f}")
+        print(f"самый долгий запрос       {slowest:8.1f}")
+    finally:
+        loop.run_until_complete(adb.close())
+        loop.close()
+        db.close()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
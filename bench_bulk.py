@@ -0,0 +1,61 @@
+# Скорость наполнения: построчный INSERT против COPY и многострочного INSERT ... RETURNING
+import sys
+import time
+from datetime import date, timedelta
+
+from db import Database
+
+DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
+TABLE = "bench_bulk_lesson"
+COLS = ["lesson_date", "course_id", "instructor_id", "student_id", "car_id"]
+db = Database(DSN)
+
+
+def rows(n):
+    base = date.today() - timedelta(days=90)
+    for i in range(n):
+        yield (base + timedelta(days=i % 90), i % 97 + 1, i % 13 + 1, i % 1009 + 1, i % 31 + 1)
+
+
+def timed(label, n, fn):
+    db.execute(f"TRUNCATE {TABLE};")
+    start = time.perf_counter()
+    fn(n)
+    rate = n / (time.perf_counter() - start)
+    print(f"{label:<28} {n:>8} строк {rate:>12.0f} строк/с")
+    return rate
+
+
+def loop_insert(n):
+    # прежний путь generate_data.insert_batch: одно выражение и фиксация на строку
+    sql = f"INSERT INTO {TABLE} ({', '.join(COLS)}) VALUES ({', '.join(['%s'] * len(COLS))})"
+    for r in rows(n):
+        db.execute(sql, r)
+
+
+def copy_insert(n):
+    db.copy_rows(TABLE, COLS, rows(n))
+
+
+def returning_insert(n):
+    ids = db.insert_many_returning(TABLE, COLS, rows(n), "lesson_id")
+    assert len(ids) == n and ids == sorted(ids)
+
+
+def main(total=100000, loop_total=5000):
+    db.execute(f"DROP TABLE IF EXISTS {TABLE};")
+    db.execute(f"CREATE UNLOGGED TABLE {TABLE} (lesson_id serial PRIMARY KEY, lesson_date date, "
+               "course_id int, instructor_id int, student_id int, car_id int);")
+    try:
+        # построчная вставка 100k строк идёт минуты, поэтому меряем её на выборке
+        base = timed("построчный INSERT", loop_total, loop_insert)
+        copy = timed("COPY FROM STDIN", total, copy_insert)
+        ret = timed("INSERT ... RETURNING (пакет)", total, returning_insert)
+        print(f"COPY: x{copy / base:.0f}, INSERT ... RETURNING: x{ret / base:.0f}")
+    finally:
+        db.execute(f"DROP TABLE IF EXISTS {TABLE};")
+        db.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:3]))
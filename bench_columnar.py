@@ -0,0 +1,32 @@
+# Скорость генерации занятий: построчно (data_generator) против столбцовой (NumPy)
+import sys
+import time
+
+from columnar_generator import ColumnarGenerator, columns_to_rows
+from data_generator import generate_lessons
+
+COLS = ["lesson_date", "course_id", "instructor_id", "student_id", "car_id"]
+
+
+def timed(label, n, fn):
+    start = time.perf_counter()
+    fn(n)
+    rate = n / (time.perf_counter() - start)
+    print(f"{label:<34} {rate:>14.0f} строк/с")
+    return rate
+
+
+def main(n=1000000):
+    gen = ColumnarGenerator(seed=0)
+    row = timed("построчно (generate_lessons)", n, generate_lessons)
+    col = timed("столбцово (ColumnarGenerator)", n, lambda k: gen.lessons(k))
+    # вместе с переводом в кортежи для COPY
+    full = timed("столбцово + кортежи для COPY", n,
+                 lambda k: sum(1 for _ in columns_to_rows(gen.lessons(k), COLS)))
+    print(f"ускорение: x{col / row:.0f} (генерация), x{full / row:.0f} (с кортежами)")
+    text = ColumnarGenerator(seed=0, text_pool=1000)
+    timed("отзывы, пул текстов 1000", n // 10, lambda k: text.reviews(k))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
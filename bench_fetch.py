@@ -0,0 +1,47 @@
+# Память на строку и время построения DataFrame: RealDictCursor против столбцового fetch_arrays
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from db import Database
+
+DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
+QUERY = "SELECT * FROM lesson"
+
+
+def measured(label, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1000
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, size
+
+
+def main(query=QUERY):
+    db = Database(DSN)
+    try:
+        rows, t_rows, m_rows = measured("fetch_all", lambda: db.fetch_all(query))
+        cols, t_cols, m_cols = measured("fetch_arrays", lambda: db.fetch_arrays(query))
+        n = max(len(rows), 1)
+        print(f"строк: {len(rows)}")
+        print(f"fetch_all    {t_rows:>9.1f} мс  {m_rows / n:>7.0f} байт/строка")
+        print(f"fetch_arrays {t_cols:>9.1f} мс  {m_cols / n:>7.0f} байт/строка "
+              f"(x{m_rows / max(m_cols, 1):.1f} меньше)")
+        del rows
+        start = time.perf_counter()
+        pd.DataFrame(db.fetch_all(query))
+        df_rows = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        cols.to_pandas()
+        df_cols = (time.perf_counter() - start) * 1000
+        print(f"DataFrame из словарей {df_rows:.1f} мс (с выборкой), из столбцов {df_cols:.2f} мс")
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else QUERY)
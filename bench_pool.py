@@ -0,0 +1,39 @@
+# Сравнение пропускной способности Database с пулом соединений и без него
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from db import Database
+
+DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
+
+
+def run(db, statements, workers):
+    per_worker = statements // workers
+
+    def worker(_):
+        for _ in range(per_worker):
+            db.fetch_all("SELECT 1 AS one;")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(worker, range(workers)))
+    elapsed = time.perf_counter() - start
+    return per_worker * workers / elapsed
+
+
+def main(statements=2000):
+    for workers in (1, 8):
+        plain = Database(DSN, pooled=False)
+        pooled = Database(DSN, pool_max=workers)
+        try:
+            no_pool = run(plain, statements, workers)
+            with_pool = run(pooled, statements, workers)
+        finally:
+            pooled.close()
+        print(f"workers={workers}: без пула {no_pool:8.1f} stmt/s, "
+              f"с пулом {with_pool:8.1f} stmt/s, x{with_pool / no_pool:.1f}")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
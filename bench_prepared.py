@@ -0,0 +1,79 @@
+# Экономия на разборе и планировании: Database с кэшем подготовленных выражений и без него
+import json
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+from db import Database
+
+DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
+FUNCTIONS = [
+    'get_course_statistics',
+    'get_review_summary',
+    'get_course_counts_by_district',
+    'get_school_course_stats',
+    'get_top_instructors',
+]
+INSERT = ("INSERT INTO bench_review (review_text, reviewer_name, grade, review_date, course_id, likes) "
+          "VALUES (%s, %s, %s, %s, %s, %s);")
+
+
+def review_rows(n, seed=1):
+    rnd = random.Random(seed)
+    today = date.today()
+    return [(f"отзыв {i}", f"автор {i % 97}", round(rnd.uniform(1, 5), 1),
+             today - timedelta(days=rnd.randint(0, 365)), rnd.randint(1, 1000), rnd.randint(0, 100))
+            for i in range(n)]
+
+
+def planning_ms(db, query):
+    plan = db.fetch_all(f"EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) {query}")[0]['QUERY PLAN']
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Planning Time']
+
+
+def calls(db, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for f in FUNCTIONS:
+            db.call_function(f)
+    return (time.perf_counter() - start) * 1000
+
+
+def inserts(db, rows):
+    # построчные INSERT в одной транзакции; временная таблица исчезает при фиксации
+    start = time.perf_counter()
+    with db.transaction():
+        db.execute("CREATE TEMP TABLE bench_review (LIKE review INCLUDING DEFAULTS) ON COMMIT DROP;")
+        for r in rows:
+            db.execute(INSERT, r)
+    return (time.perf_counter() - start) * 1000
+
+
+def main(repeat=200, n=10000):
+    plain = Database(DSN, pool_max=1, prepared=0)
+    prepared = Database(DSN, pool_max=1)
+    rows = review_rows(n)
+    try:
+        print("планирование одного вызова, мс:")
+        for f in FUNCTIONS:
+            print(f"  {f:<32} {planning_ms(plain, f'SELECT * FROM {f}();'):8.3f}")
+        for db in (plain, prepared):
+            calls(db, 5)  # прогрев: соединение и переход на общий план
+        t_plain, t_prep = calls(plain, repeat), calls(prepared, repeat)
+        total = repeat * len(FUNCTIONS)
+        print(f"вызовы функций QueryTab ({total}): без подготовки {t_plain:9.1f} мс, "
+              f"с подготовкой {t_prep:9.1f} мс, экономия {(t_plain - t_prep) / total:.3f} мс/вызов")
+        i_plain, i_prep = inserts(plain, rows), inserts(prepared, rows)
+        print(f"INSERT по строке ({n}): без подготовки {i_plain:9.1f} мс, "
+              f"с подготовкой {i_prep:9.1f} мс, экономия {(i_plain - i_prep) / n:.3f} мс/строка")
+        print(f"подготовлено/выполнено: {prepared.prepare_stats}")
+    finally:
+        plain.close()
+        prepared.close()
+
+
+if __name__ == '__main__':
+    main(*(int(a) for a in sys.argv[1:3]))
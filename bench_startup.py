@@ -0,0 +1,29 @@
+# Время от создания окна до первой отрисовки: без кэша схемы и с ним
+import os
+import time
+
+from db import Database
+from main import App
+from schema_catalog import SchemaCatalog
+
+DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
+
+
+def first_paint():
+    app = App(DSN)
+    app.update()
+    ms = (time.perf_counter() - app.started) * 1000
+    source = "кэш" if app.catalog.from_cache else "каталог"
+    app.executor.shutdown()
+    app.destroy()
+    app.db.close()
+    return ms, source
+
+
+if __name__ == '__main__':
+    cache_path = SchemaCatalog(Database(DSN, pooled=False)).cache_path
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+    for run in ("холодный", "повторный", "повторный"):
+        ms, source = first_paint()
+        print(f"{run} запуск ({source}): {ms:.0f} мс")
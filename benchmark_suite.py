@@ -0,0 +1,375 @@
+# Воспроизводимый нагрузочный прогон: наполнение схемы в масштабе 1x/10x/100x и замеры запросов
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import numpy as np
+
+import data_generator
+from columnar_generator import ColumnarGenerator, columns_to_rows
+from db import Database
+from schema_catalog import SchemaCatalog
+from table_search import TableSearch
+from virtual_grid import relation_source
+
+QUERIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Запросы.md')
+
+# Размеры таблиц при масштабе 1x; справочники от масштаба не зависят
+BASE_ROWS = {
+    'driving_school': 20,
+    'instructor': 50,
+    'course': 200,
+    'student': 2000,
+    'stream': 10,
+    'student_group': 400,
+    'provided_course': 200,
+    'ordered_course': 500,
+    'car': 50,
+    'enrollment': 5000,
+    'lesson': 20000,
+    'review': 5000,
+}
+
+SEARCH_TERM = 'ов'
+GRID_ROWS = 40  # строк на первом экране VirtualGrid
+
+
+def bench_args():
+    """Аргументы для функций с параметрами (остальные вызываются без них)."""
+    today = date.today()
+    return {
+        'get_applications_income': [1, today.year],
+        'get_courses_above_price': [20000],
+        'get_lessons_by_date_range': [today - timedelta(days=30), today],
+        'get_reviews_by_date_range': [today - timedelta(days=90), today],
+        'get_students_by_name_mask': ['%ов%'],
+        'get_lessons_for_course': [1],
+        'get_students_for_stream': [1],
+    }
+
+
+def _find_bin(name):
+    path = shutil.which(name)
+    if path:
+        return path
+    try:
+        bindir = subprocess.check_output(['pg_config', '--bindir'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        raise SystemExit(f"Не найден {name}: установите PostgreSQL или передайте --dsn")
+    return os.path.join(bindir, name)
+
+
+@contextmanager
+def throwaway_postgres():
+    """Временный кластер PostgreSQL в каталоге /tmp; удаляется после прогона."""
+    root = tempfile.mkdtemp(prefix='bench_pg_')
+    data = os.path.join(root, 'data')
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    subprocess.run([_find_bin('initdb'), '-D', data, '-U', 'postgres', '-A', 'trust'],
+                   check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([_find_bin('pg_ctl'), '-D', data, '-w', '-l', os.path.join(root, 'log'),
+                    '-o', f"-p {port} -k {root} -c listen_addresses=''", 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"host={root} port={port} user=postgres dbname=postgres"
+    finally:
+        subprocess.run([_find_bin('pg_ctl'), '-D', data, '-m', 'fast', 'stop'],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def _with_dbname(dsn, dbname):
+    return re.sub(r'dbname=\S+', '', dsn).strip() + f" dbname={dbname}"
+
+
+def create_database(admin_dsn, dbname, schema_file):
+    admin = Database(admin_dsn, pooled=False)
+    admin.execute_autocommit(f"DROP DATABASE IF EXISTS {dbname};")
+    admin.execute_autocommit(f"CREATE DATABASE {dbname};")
+    db = Database(_with_dbname(admin_dsn, dbname))
+    with open(schema_file, encoding='utf-8') as f:
+        db.execute_autocommit(f.read())
+    with open(QUERIES_FILE, encoding='utf-8') as f:
+        db.execute_autocommit(f.read())
+    return db
+
+
+class Seeder:
+    """Наполняет схему детерминированно: один seed — одни и те же данные."""
+
+    def __init__(self, db, catalog, seed, scale):
+        self.db = db
+        self.catalog = catalog
+        self.scale = scale
+        self.gen = ColumnarGenerator(seed, text_pool=5000)
+        random.seed(seed)
+        data_generator.fake.seed_instance(seed)
+        self.ids = {}
+
+    def n(self, table):
+        return BASE_ROWS[table] * self.scale
+
+    def _columns(self, table, data):
+        have = set(self.catalog.columns(table))
+        return [c for c in data if c in have]
+
+    def insert(self, table, data, keep_ids=True):
+        if table not in self.catalog.relations:
+            print(f"  пропуск {table}: нет в схеме")
+            return
+        cols = self._columns(table, data)
+        rows = columns_to_rows(data, cols)
+        if keep_ids:
+            pk = self.catalog.primary_key(table)[0]
+            self.ids[table] = np.asarray(self.db.insert_many_returning(table, cols, rows, pk))
+        else:
+            self.db.copy_rows(table, cols, rows)
+
+    def reference(self, table, column, values):
+        self.insert(table, {column: np.array(values, dtype=object)})
+
+    def run(self):
+        g = self.gen
+        self.reference('driving_category', 'driving_category_name', data_generator.DRIVING_CATEGORIES)
+        self.reference('district', 'district_name', data_generator.DISTRICTS_DONETSK)
+        self.reference('car_brand', 'car_brand', data_generator.CAR_BRANDS)
+        self.reference('ownership_type', 'ownership_type_name', data_generator.OWNERSHIP_TYPES)
+        self.reference('car_type', 'car_type_name', data_generator.CAR_TYPES)
+
+        n = self.n('driving_school')
+        self.insert('driving_school', {
+            'driving_school_name': g.text('company', n),
+            'district_id': g.pick(self.ids['district'], n),
+            'ownership_type_id': g.pick(self.ids['ownership_type'], n),
+            'driving_school_adress': g.text('address', n),
+            'driving_school_url': g.text('url', n),
+        })
+        n = self.n('instructor')
+        self.insert('instructor', {
+            'instructor_fullname': g.text('name', n),
+            'driving_category_id': g.pick(self.ids['driving_category'], n),
+        })
+        self.insert('course', g.courses(self.n('course'), self.ids['driving_category'],
+                                        self.ids['instructor'], self.ids['driving_school']))
+        n = self.n('student')
+        self.insert('student', {
+            'full_name': g.text('name', n),
+            'born_date': g.dates(n, date.today() - timedelta(days=60 * 365), 42 * 365),
+            'social_status': g.pick(np.array(['Студент', 'Работающий', 'Пенсионер'], dtype=object), n),
+            'work_or_studying_place': g.text('company', n),
+            'phone': g.text('phone_number', n),
+            'non_cash': g.rng.random(n) < 0.5,
+        })
+        n = self.n('stream')
+        start = g.dates(n, date.today() - timedelta(days=365), 365)
+        self.insert('stream', {
+            'stream_name': np.array([f'Поток {i + 1}' for i in range(n)], dtype=object),
+            'start_stream_date': start,
+            'end_stream_date': start + g.ints(30, 180, n),
+        })
+        n = self.n('student_group')
+        self.insert('student_group', {
+            'course_id': g.pick(self.ids['course'], n),
+            'stream_id': g.pick(self.ids['stream'], n),
+        })
+        n = self.n('provided_course')
+        start = g.dates(n, date.today() - timedelta(days=180), 180)
+        self.insert('provided_course', {
+            'course_id': g.pick(self.ids['course'], n),
+            'instructor_id': g.pick(self.ids['instructor'], n),
+            'start_date': start,
+            'end_date': start + g.ints(30, 90, n),
+        })
+        n = self.n('ordered_course')
+        start = g.dates(n, date.today() - timedelta(days=120), 120)
+        self.insert('ordered_course', {
+            'student_count': g.ints(1, 30, n),
+            'stream_id': g.pick(self.ids['stream'], n),
+            'provided_course_id': g.pick(self.ids['provided_course'], n),
+            'start_date': start,
+            'end_date': start + g.ints(30, 60, n),
+        }, keep_ids=False)
+        self.insert('car', g.cars(self.n('car'), self.ids['car_brand'], self.ids['car_type']))
+
+        # пары (студент, группа) без повторов — на случай уникального ограничения
+        students, groups = self.ids['student'], self.ids['student_group']
+        n = min(self.n('enrollment'), len(students) * len(groups))
+        pairs = g.rng.choice(len(students) * len(groups), n, replace=False)
+        data = g.enrollments(n)
+        data['student_id'] = students[pairs // len(groups)]
+        data['student_group_id'] = groups[pairs % len(groups)]
+        self.insert('enrollment', data, keep_ids=False)
+
+        self.insert('lesson', g.lessons(self.n('lesson'), self.ids['course'], self.ids['instructor'],
+                                        students, self.ids['car']), keep_ids=False)
+        data = g.reviews(self.n('review'), self.ids['course'])
+        data['likes'] = g.ints(0, 100, self.n('review'))
+        self.insert('review', data, keep_ids=False)
+        self.db.execute_autocommit("VACUUM ANALYZE;")
+
+
+def query_functions():
+    with open(QUERIES_FILE, encoding='utf-8') as f:
+        return re.findall(r'CREATE OR REPLACE FUNCTION public\.(\w+)\(', f.read())
+
+
+def peak_alloc_kb(fn):
+    """Пик памяти Python-объектов за один вызов fn сверх уровня до него (tracemalloc).
+
+    Отдельный прогон: трассировка замедляет выделения и исказила бы время.
+    """
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        return round((tracemalloc.get_traced_memory()[1] - base) / 1024)
+    finally:
+        if started:
+            tracemalloc.stop()
+
+
+def measure(fn, repeat):
+    times, rows, error = [], 0, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            rows = fn()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}".strip()
+            break
+        times.append((time.perf_counter() - start) * 1000)
+    result = {'runs': len(times), 'rows': rows}
+    if times:
+        result['peak_alloc_kb'] = peak_alloc_kb(fn)
+    if error:
+        result['error'] = error
+    if times:
+        q = statistics.quantiles(times, n=100, method='inclusive') if len(times) > 1 else times * 99
+        mean = statistics.fmean(times)
+        result.update(p50_ms=round(q[49], 3), p95_ms=round(q[94], 3), p99_ms=round(q[98], 3),
+                      mean_ms=round(mean, 3),
+                      rows_per_sec=round(rows / mean * 1000, 1) if mean else None)
+    return result
+
+
+def run_targets(db, catalog, repeat):
+    from main import QueryTab
+    results = {}
+    args = bench_args()
+    funcs = list(dict.fromkeys(QueryTab.ALLOWED + query_functions()))
+    for func in funcs:
+        if func not in catalog.functions:
+            results[f"function:{func}"] = {'error': 'нет в схеме'}
+            continue
+        params = args.get(func)
+        results[f"function:{func}"] = measure(lambda: len(db.call_function(func, params)), repeat)
+
+    for table in catalog.tables():
+        pk = catalog.primary_key(table)
+
+        def first_screen():
+            source = relation_source(db, table, pk)
+            try:
+                return len(source.rows(0, GRID_ROWS))
+            finally:
+                source.close()
+        results[f"load_data:{table}"] = measure(first_screen, repeat)
+
+    searcher = TableSearch(db, catalog)
+    for table in catalog.tables():
+        if searcher.document(table) is None:
+            continue
+        searcher.build_index(table)
+
+        def search():
+            source = searcher.source(table, SEARCH_TERM)
+            try:
+                return len(source.rows(0, GRID_ROWS))
+            finally:
+                source.close()
+        results[f"search:{table}"] = measure(search, repeat)
+    return results
+
+
+def run(dsn, scales, seed, repeat, schema_file):
+    report = {'meta': {'seed': seed, 'repeat': repeat, 'scales': scales,
+                       'started': time.strftime('%Y-%m-%dT%H:%M:%S')}, 'results': {}}
+    for scale in scales:
+        print(f"масштаб {scale}x: наполнение")
+        db = create_database(dsn, f"bench_sf{scale}", schema_file)
+        try:
+            catalog = SchemaCatalog(db, cache_dir=None).load()
+            start = time.perf_counter()
+            Seeder(db, catalog, seed, scale).run()
+            seed_s = time.perf_counter() - start
+            catalog = SchemaCatalog(db, cache_dir=None).load()
+            report['meta'].setdefault('server_version', db.fetch_all("SHOW server_version;")[0]['server_version'])
+            print(f"масштаб {scale}x: замеры")
+            report['results'][f"{scale}x"] = {'seed_seconds': round(seed_s, 2),
+                                              'targets': run_targets(db, catalog, repeat)}
+        finally:
+            db.close()
+    # максимум за весь процесс (наполнение и все замеры) — не относится к отдельной цели
+    report['meta']['process_peak_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return report
+
+
+def diff(old_path, new_path):
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)['results']
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)['results']
+    for scale in sorted(set(old) & set(new)):
+        for target, b in sorted(new[scale]['targets'].items()):
+            a = old[scale]['targets'].get(target, {})
+            if 'p95_ms' in a and 'p95_ms' in b and a['p95_ms']:
+                change = (b['p95_ms'] - a['p95_ms']) / a['p95_ms'] * 100
+                print(f"{scale:>5} {target:<55} p95 {a['p95_ms']:>10.2f} -> {b['p95_ms']:>10.2f} мс ({change:+.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон схемы автошколы")
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--schema-file', help="DDL таблиц (pg_dump -s); функции берутся из Запросы.md")
+    parser.add_argument('--dsn', help="DSN служебной БД существующего сервера; "
+                                      "по умолчанию поднимается временный кластер")
+    parser.add_argument('--out', default='bench_report.json')
+    parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'))
+    args = parser.parse_args()
+
+    if args.diff:
+        diff(*args.diff)
+        return
+    if not args.schema_file:
+        parser.error("нужен --schema-file: каждый масштаб наполняется в новой пустой БД")
+    if args.dsn:
+        report = run(args.dsn, args.scale, args.seed, args.repeat, args.schema_file)
+    else:
+        with throwaway_postgres() as dsn:
+            report = run(dsn, args.scale, args.seed, args.repeat, args.schema_file)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True, default=str)
+    print(f"отчёт: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
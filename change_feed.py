@@ -0,0 +1,183 @@
+import json
+import queue
+import re
+
+CHANNEL_PREFIX = 'row_changes_'
+POLL_MS = 100          # период разбора уведомлений в потоке Tk
+MAX_PAYLOAD = 7900     # NOTIFY принимает до 8000 байт
+MAX_KEYS = 1000        # больше ключей в одном уведомлении не собирается
+FUNCTION_VERSION = 3   # метка в теле функции: старая версия в базе заменяется
+
+# Триггеры уровня выражения: одно уведомление на INSERT/UPDATE/DELETE с ключами
+# всех затронутых строк; если ключи не помещаются, keys = null (перечитать всё).
+# Ключи читаются из таблицы переходов с LIMIT: массовый COPY или UPDATE не
+# строит JSON на миллионы ключей, чтобы затем его выбросить. У UPDATE старые
+# и новые ключи идут через UNION ALL (без сортировки всей таблицы переходов),
+# поэтому в предел MAX_KEYS каждая строка входит дважды. Триггер секции
+# уведомляет канал корневой таблицы.
+NOTIFY_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION public.notify_row_changes() RETURNS trigger
+ LANGUAGE plpgsql AS $$
+DECLARE
+  cols text := (SELECT string_agg(format('%I', c), ', ') FROM unnest(TG_ARGV) AS c);
+  src text;
+  keys jsonb;
+  n bigint;
+  payload text;
+BEGIN
+  -- notify_row_changes v{FUNCTION_VERSION}
+  src := CASE TG_OP
+    WHEN 'INSERT' THEN format('SELECT %s FROM new_rows', cols)
+    WHEN 'DELETE' THEN format('SELECT %s FROM old_rows', cols)
+    ELSE format('SELECT %1$s FROM old_rows UNION ALL SELECT %1$s FROM new_rows', cols)
+  END;
+  EXECUTE format('SELECT jsonb_agg(DISTINCT jsonb_build_array(%s)), count(*) FROM (%s LIMIT %s) AS k',
+                 cols, src, {MAX_KEYS} + 1) INTO keys, n;
+  IF n = 0 THEN
+    RETURN NULL;
+  END IF;
+  payload := json_build_object('op', left(TG_OP, 1), 'keys', keys)::text;
+  IF n > {MAX_KEYS} OR octet_length(payload) > {MAX_PAYLOAD} THEN
+    payload := json_build_object('op', left(TG_OP, 1), 'keys', NULL)::text;
+  END IF;
+  PERFORM pg_notify('{CHANNEL_PREFIX}' || coalesce(
+    (SELECT relname FROM pg_class WHERE oid = pg_partition_root(TG_RELID)), TG_TABLE_NAME), payload);
+  RETURN NULL;
+END $$;
+"""
+
+_EVENTS = {
+    'ins': ('INSERT', 'NEW TABLE AS new_rows'),
+    'upd': ('UPDATE', 'OLD TABLE AS old_rows NEW TABLE AS new_rows'),
+    'del': ('DELETE', 'OLD TABLE AS old_rows'),
+}
+
+
+def channel(table):
+    return CHANNEL_PREFIX + table
+
+
+def _trigger_sql(table, suffix, args):
+    event, referencing = _EVENTS[suffix]
+    return (f"CREATE TRIGGER {table}_notify_{suffix} AFTER {event} ON {table} "
+            f"REFERENCING {referencing} FOR EACH STATEMENT "
+            f"EXECUTE FUNCTION notify_row_changes({args});")
+
+
+def ensure_triggers(db, table, key):
+    """Создаёт триггеры уведомлений для table, если их ещё нет; True при создании.
+
+    У секционированной таблицы триггеры ставятся и на каждую секцию: запись
+    прямо в секцию (PartitionManager.copy_rows) триггеры уровня выражения
+    родителя не вызывает.
+    """
+    rels = {}
+    for r in db.fetch_all(
+            "SELECT c.relname AS rel, t.tgname FROM pg_partition_tree(%s::regclass) p "
+            "JOIN pg_class c ON c.oid = p.relid "
+            "LEFT JOIN pg_trigger t ON t.tgrelid = p.relid AND NOT t.tgisinternal "
+            "WHERE p.level = 0 OR p.isleaf;", [table]):
+        rels.setdefault(r['rel'], set()).add(r['tgname'])
+    missing = [(rel, s) for rel, have in rels.items() for s in _EVENTS
+               if f"{rel}_notify_{s}" not in have]
+    if not missing:
+        if not db.fetch_all(
+                "SELECT 1 FROM pg_proc WHERE proname = 'notify_row_changes' AND prosrc LIKE %s;",
+                [f"%notify_row_changes v{FUNCTION_VERSION}%"]):
+            db.execute(NOTIFY_FUNCTION_SQL.replace('%', '%%'))
+        return False
+    args = ', '.join(f"'{k}'" for k in key)
+    with db.transaction():
+        db.execute(NOTIFY_FUNCTION_SQL.replace('%', '%%'))
+        for rel, suffix in missing:
+            db.execute(_trigger_sql(rel, suffix, args))
+    return True
+
+
+def clone_triggers(cur, table, partition):
+    """Ставит на новую секцию те же триггеры уведомлений, что у table
+    (триггеры уровня выражения секциям не наследуются); cur — курсор
+    транзакции, создающей секцию."""
+    cur.execute("SELECT tgname, pg_get_triggerdef(oid) FROM pg_trigger "
+                "WHERE tgrelid = %s::regclass AND tgname LIKE %s;",
+                [table, f"{table}\\_notify\\_%"])
+    for name, definition in cur.fetchall():
+        args = re.search(r"notify_row_changes\((.*)\)$", definition).group(1)
+        cur.execute(_trigger_sql(partition, name[len(f"{table}_notify_"):], args))
+
+
+def view_tables(db, view):
+    """Таблицы, на которых построено представление (по правилу перезаписи)."""
+    return [r['name'] for r in db.fetch_all(
+        "SELECT DISTINCT d.refobjid::regclass::text AS name FROM pg_rewrite r "
+        "JOIN pg_depend d ON d.classid = 'pg_rewrite'::regclass AND d.objid = r.oid "
+        "JOIN pg_class c ON c.oid = d.refobjid "
+        "WHERE r.ev_class = %s::regclass AND d.refobjid <> r.ev_class AND c.relkind IN ('r','p');",
+        [view])]
+
+
+def drop_triggers(db, table):
+    rels = [r['rel'] for r in db.fetch_all(
+        "SELECT c.relname AS rel FROM pg_partition_tree(%s::regclass) p "
+        "JOIN pg_class c ON c.oid = p.relid WHERE p.level = 0 OR p.isleaf;", [table])]
+    with db.transaction():
+        for rel in rels:
+            for suffix in _EVENTS:
+                db.execute(f"DROP TRIGGER IF EXISTS {rel}_notify_{suffix} ON {rel};")
+
+
+class ChangeFeed:
+    """Доставляет уведомления об изменении строк в поток Tk.
+
+    Слушатель Database кладёт уведомления в очередь, ChangeFeed разбирает
+    её по after() и вызывает подписчиков таблицы со сводкой за интервал:
+    [(op, keys)], где op — 'I', 'U' или 'D', а keys = None означает
+    «изменилось неизвестно что, перечитать».
+    """
+
+    def __init__(self, db, widget, poll_ms=POLL_MS):
+        self.db = db
+        self.widget = widget
+        self.poll_ms = poll_ms
+        self._watchers = {}  # таблица -> список callback
+        self._handlers = {}  # таблица -> обработчик слушателя
+        self._queue = queue.Queue()
+        widget.after(poll_ms, self._poll)
+
+    def watch(self, table, callback):
+        self._watchers.setdefault(table, []).append(callback)
+        if table not in self._handlers:
+            handler = self._handlers[table] = lambda payload, t=table: self._queue.put((t, payload))
+            self.db.listen(channel(table), handler)
+
+    def unwatch(self, table, callback):
+        callbacks = self._watchers.get(table, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+        if not callbacks and table in self._handlers:
+            self._watchers.pop(table, None)
+            self.db.unlisten(channel(table), self._handlers.pop(table))
+
+    def _poll(self):
+        try:
+            changes = {}
+            while True:
+                try:
+                    table, payload = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                merged = changes.setdefault(table, {})
+                note = json.loads(payload) if payload else {'op': None, 'keys': None}
+                if note['keys'] is None:
+                    merged[None] = None
+                    continue
+                merged.setdefault(note['op'], set()).update(tuple(k) for k in note['keys'])
+            for table, merged in changes.items():
+                if None in merged:
+                    batch = [(None, None)]
+                else:
+                    batch = [(op, sorted(merged[op], key=repr)) for op in 'DIU' if op in merged]
+                for callback in list(self._watchers.get(table, ())):
+                    callback(batch)
+        finally:
+            self.widget.after(self.poll_ms, self._poll)
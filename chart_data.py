@@ -0,0 +1,99 @@
+from datetime import timedelta
+
+import numpy as np
+
+# (подпись, таблица, столбец даты, единица date_trunc)
+TIME_SERIES = (
+    ('Занятия по дням', 'lesson', 'lesson_date', 'day'),
+    ('Отзывы по дням', 'review', 'review_date', 'day'),
+    ('Отзывы по месяцам', 'review', 'review_date', 'month'),
+)
+UNIT_DAYS = {'day': 1, 'week': 7, 'month': 30.4375}
+LTTB_FACTOR = 4    # до стольких точек на пиксель ряд читается целиком и прореживается LTTB
+MIN_BAR_PX = 6     # уже — столбцы сливаются, остаток показывается одним «прочие»
+
+
+def lttb(x, y, n):
+    """Индексы n точек, сохраняющих форму ряда (Largest-Triangle-Three-Buckets).
+
+    Первая и последняя точки остаются; из каждой из n - 2 корзин берётся
+    точка, образующая наибольший треугольник с уже выбранной и средним
+    следующей корзины — пики и провалы не теряются, в отличие от шага.
+    """
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, size - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt = slice(hi, edges[i + 2] if i + 2 < len(edges) else size)
+        cx, cy = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(area.argmax())
+        out[i + 1] = a
+    return out
+
+
+class Series:
+    """Точки ряда для графика; у свёрнутого на сервере — ещё огибающая min/max."""
+
+    def __init__(self, x, y, low=None, high=None, mode='raw'):
+        self.x, self.y, self.low, self.high, self.mode = x, y, low, high, mode
+
+    def __len__(self):
+        return len(self.x)
+
+
+def date_range(db, table, column):
+    """(первая дата, день после последней) — min/max по индексу, без чтения строк."""
+    r = db.fetch_all(f"SELECT min({column})::date AS lo, max({column})::date AS hi FROM {table};")[0]
+    if r['lo'] is None:
+        return None
+    return r['lo'], r['hi'] + timedelta(days=1)
+
+
+def load_series(db, table, column, unit, lo, hi, width):
+    """Счётчики строк по единицам времени на [lo, hi), не больше width точек.
+
+    Если единиц немного, сервер возвращает счётчик на каждую, а длинный
+    ряд прореживается LTTB до width. Если их больше LTTB_FACTOR * width,
+    сервер сам сворачивает единицы в width корзин с min/max/avg, и клиент
+    получает width строк при любом объёме таблицы.
+    """
+    if unit not in UNIT_DAYS:
+        raise ValueError(f"Неизвестная единица: {unit}")
+    width = max(int(width), 3)
+    days = max((hi - lo).days, 1)
+    units = f"""SELECT date_trunc('{unit}', {column})::date AS t, count(*) AS n FROM {table}
+                 WHERE {column} >= %(lo)s AND {column} < %(hi)s GROUP BY 1"""
+    if days / UNIT_DAYS[unit] <= width * LTTB_FACTOR:
+        res = db.fetch_arrays(units + " ORDER BY 1;", {'lo': lo, 'hi': hi})
+        x, y = res['t'], res['n'].astype(np.float64)
+        if len(x) <= width:
+            return Series(x, y)
+        idx = lttb(x.astype(np.int64), y, width)
+        return Series(x[idx], y[idx], mode='lttb')
+    res = db.fetch_arrays(
+        f"WITH u AS ({units}) "
+        "SELECT min(t) AS t, avg(n)::float8 AS avg, min(n) AS low, max(n) AS high FROM u "
+        "GROUP BY width_bucket((t - %(lo)s::date)::float8, 0, %(days)s, %(bins)s) ORDER BY 1;",
+        {'lo': lo, 'hi': hi, 'days': days, 'bins': width})
+    return Series(res['t'], res['avg'], res['low'].astype(np.float64),
+                  res['high'].astype(np.float64), mode='bins')
+
+
+def top_bars(labels, values, width_px):
+    """Не больше width_px // MIN_BAR_PX столбцов: крупнейшие, остальное — «прочие»."""
+    limit = max(width_px // MIN_BAR_PX, 2)
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= limit:
+        return list(labels), values
+    order = np.argsort(values)[::-1]
+    keep = np.sort(order[:limit - 1])
+    rest = values[order[limit - 1:]].sum()
+    return [labels[i] for i in keep] + ['прочие'], np.append(values[keep], rest)
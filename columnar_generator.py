@@ -0,0 +1,100 @@
+from datetime import date, timedelta
+
+import numpy as np
+from faker import Faker
+
+from data_generator import CAR_BRANDS, CAR_TYPES, DRIVING_CATEGORIES
+
+
+def _ids(n):
+    return np.arange(1, n + 1)
+
+
+class ColumnarGenerator:
+    """Столбцовая генерация: числа, даты и выбор FK — массивами NumPy за один вызов.
+
+    Через Faker идут только текстовые столбцы; при text_pool > 0 они
+    выбираются из заранее сгенерированного пула такого размера.
+    Значения и диапазоны те же, что в data_generator.
+    """
+
+    def __init__(self, seed=0, text_pool=0):
+        self.rng = np.random.default_rng(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.text_pool = text_pool
+        self._pools = {}
+
+    def ints(self, lo, hi, n):
+        return self.rng.integers(lo, hi + 1, n)
+
+    def money(self, lo, hi, n, digits=2):
+        return np.round(self.rng.uniform(lo, hi, n), digits)
+
+    def dates(self, n, start, days):
+        return np.datetime64(start, 'D') + self.rng.integers(0, days + 1, n)
+
+    def pick(self, ids, n):
+        ids = np.asarray(ids)
+        return ids[self.rng.integers(0, len(ids), n)]
+
+    def text(self, provider, n, **kwargs):
+        make = getattr(self.fake, provider)
+        if not self.text_pool:
+            return np.array([make(**kwargs) for _ in range(n)], dtype=object)
+        pool = self._pools.get(provider)
+        if pool is None:
+            pool = self._pools[provider] = np.array(
+                [make(**kwargs) for _ in range(self.text_pool)], dtype=object)
+        return self.pick(pool, n)
+
+    def courses(self, n, category_ids=None, instructor_ids=None, school_ids=None):
+        return {
+            'course_duration_month': self.ints(1, 12, n),
+            'course_price': self.money(10000, 50000, n),
+            'driving_hours': self.ints(20, 100, n),
+            'driving_category_id': self.pick(
+                _ids(len(DRIVING_CATEGORIES)) if category_ids is None else category_ids, n),
+            'instructor_id': self.pick(_ids(5) if instructor_ids is None else instructor_ids, n),
+            'driving_school_id': self.pick(_ids(3) if school_ids is None else school_ids, n),
+        }
+
+    def enrollments(self, n, student_ids=None, group_ids=None):
+        return {
+            'student_id': self.pick(_ids(10) if student_ids is None else student_ids, n),
+            'student_group_id': self.pick(_ids(10) if group_ids is None else group_ids, n),
+            'enrollment_date': self.dates(n, date.today() - timedelta(days=180), 180),
+        }
+
+    def lessons(self, n, course_ids=None, instructor_ids=None, student_ids=None, car_ids=None):
+        return {
+            'lesson_date': self.dates(n, date.today() - timedelta(days=90), 90),
+            'course_id': self.pick(_ids(10) if course_ids is None else course_ids, n),
+            'instructor_id': self.pick(_ids(5) if instructor_ids is None else instructor_ids, n),
+            'student_id': self.pick(_ids(10) if student_ids is None else student_ids, n),
+            'car_id': self.pick(_ids(10) if car_ids is None else car_ids, n),
+        }
+
+    def reviews(self, n, course_ids=None):
+        return {
+            'review_text': self.text('sentence', n),
+            'reviewer_name': self.text('name', n),
+            'grade': self.money(1, 5, n, digits=1),
+            'review_date': self.dates(n, date.today() - timedelta(days=365), 365),
+            'course_id': self.pick(_ids(10) if course_ids is None else course_ids, n),
+        }
+
+    def cars(self, n, brand_ids=None, car_type_ids=None):
+        return {
+            'brand_id': self.pick(_ids(len(CAR_BRANDS)) if brand_ids is None else brand_ids, n),
+            'car_type_id': self.pick(_ids(len(CAR_TYPES)) if car_type_ids is None else car_type_ids, n),
+            'year_of_production': self.ints(2000, 2025, n),
+            'year_of_exploitation': self.ints(1, 25, n),
+            'fuel_cost': self.money(5, 15, n),
+        }
+
+
+def columns_to_rows(chunk, columns):
+    """Строки-кортежи из столбцов для COPY; массивы переводятся в Python-типы разом."""
+    cols = [chunk[c].tolist() if hasattr(chunk[c], 'tolist') else chunk[c] for c in columns]
+    return zip(*cols)
@@ -0,0 +1,139 @@
+import datetime
+import re
+
+import numpy as np
+import psycopg2.extensions
+
+# OID типов PostgreSQL -> вид столбца
+_KINDS = {
+    20: 'int', 21: 'int', 23: 'int', 26: 'int',
+    700: 'float', 701: 'float', 1700: 'float', 790: 'float',
+    16: 'bool',
+    1082: 'date',
+    1114: 'timestamp',
+    1184: 'timestamptz',
+}
+_DTYPES = {'int': np.int64, 'float': np.float64, 'bool': np.bool_,
+           'date': 'datetime64[D]', 'timestamp': 'datetime64[us]',
+           'timestamptz': 'datetime64[us]', 'object': object}
+_MONEY_JUNK = re.compile(r'[^\d,.\-]')
+
+
+def _numeric(value, cur):
+    return None if value is None else float(value)
+
+
+def _money(value, cur):
+    # '$1,234.50', '1 234,50 ₽' и т. п. в зависимости от lc_monetary
+    if value is None:
+        return None
+    s = _MONEY_JUNK.sub('', value)
+    if len(s) > 3 and s[-3] in ',.':
+        s = s[:-3].replace(',', '').replace('.', '') + '.' + s[-2:]
+    else:
+        s = s.replace(',', '').replace('.', '')
+    return float(s)
+
+
+# numeric и money сразу в float: без промежуточных Decimal и строк
+NUMERIC_FLOAT = psycopg2.extensions.new_type((1700,), 'NUMERIC_FLOAT', _numeric)
+MONEY_FLOAT = psycopg2.extensions.new_type((790,), 'MONEY_FLOAT', _money)
+
+
+def register_types(cur):
+    psycopg2.extensions.register_type(NUMERIC_FLOAT, cur)
+    psycopg2.extensions.register_type(MONEY_FLOAT, cur)
+
+
+class ColumnarResult:
+    """Результат запроса по столбцам: имена один раз, значения — массивы NumPy.
+
+    Целые и логические столбцы с NULL хранят маску в masks (True — NULL),
+    у float и дат NULL — это NaN/NaT. to_pandas() и to_arrow() используют
+    массивы без копирования.
+    """
+
+    def __init__(self, names, arrays, masks=None):
+        self.names = list(names)
+        self.arrays = dict(zip(self.names, arrays))
+        self.masks = masks or {}
+
+    def __len__(self):
+        return len(self.arrays[self.names[0]]) if self.names else 0
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def nbytes(self):
+        """Память значений: буферы массивов плюс сами объекты в object-столбцах."""
+        total = sum(m.nbytes for m in self.masks.values())
+        for a in self.arrays.values():
+            total += a.nbytes
+            if a.dtype == object:
+                total += sum(v.__sizeof__() for v in a if v is not None)
+        return total
+
+    def to_pandas(self):
+        import pandas as pd
+        data = {}
+        for name in self.names:
+            values, mask = self.arrays[name], self.masks.get(name)
+            if mask is not None and values.dtype.kind == 'i':
+                values = pd.arrays.IntegerArray(values, mask)
+            elif mask is not None and values.dtype.kind == 'b':
+                values = pd.arrays.BooleanArray(values, mask)
+            data[name] = values
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self):
+        import pyarrow as pa
+        return pa.table({n: pa.array(self.arrays[n], mask=self.masks.get(n)) for n in self.names})
+
+    def rows(self):
+        """Строки-кортежи с None вместо NULL — для сеток и кода, ждущего строки."""
+        cols = []
+        for name in self.names:
+            values, mask = self.arrays[name].tolist(), self.masks.get(name)
+            if mask is not None:
+                values = [None if m else v for v, m in zip(values, mask.tolist())]
+            cols.append(values)
+        return zip(*cols)
+
+
+class ColumnarBuilder:
+    """Заполняет заранее выделенные массивы порциями строк курсора."""
+
+    def __init__(self, description, rowcount):
+        self.names = [d.name for d in description]
+        self.kinds = [_KINDS.get(d.type_code, 'object') for d in description]
+        self.size = max(rowcount, 0)
+        self.arrays = [np.empty(self.size, dtype=_DTYPES[k]) for k in self.kinds]
+        self.masks = {}
+        self.pos = 0
+
+    def add(self, rows):
+        start, n = self.pos, len(rows)
+        stop = start + n
+        for i, col in enumerate(zip(*rows)):
+            kind, out = self.kinds[i], self.arrays[i]
+            if kind in ('int', 'bool'):
+                if None in col:
+                    mask = self.masks.get(self.names[i])
+                    if mask is None:
+                        mask = self.masks[self.names[i]] = np.zeros(self.size, dtype=bool)
+                    mask[start:stop] = [v is None for v in col]
+                    col = [0 if v is None else v for v in col]
+                out[start:stop] = np.fromiter(col, out.dtype, n)
+            elif kind == 'timestamptz':
+                out[start:stop] = np.array(
+                    [None if v is None else v.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+                     for v in col], dtype=out.dtype)
+            elif kind == 'object':
+                out[start:stop] = np.fromiter(col, object, n)
+            else:
+                out[start:stop] = np.array(col, dtype=out.dtype)
+        self.pos = stop
+
+    def result(self):
+        masks = {n: m[:self.pos] for n, m in self.masks.items()}
+        return ColumnarResult(self.names, [a[:self.pos] for a in self.arrays], masks)
@@ -1,17 +1,22 @@
 # data_generator_batch.py
 
 from db import Database
-from faker import Faker
+from columnar_generator import ColumnarGenerator, columns_to_rows
+from partitioning import PartitionManager
+import itertools
 import random
-from datetime import date, timedelta
-from decimal import Decimal
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-fake = Faker('ru_RU')
+COURSE_COLUMNS = ['course_duration_month', 'course_price', 'driving_hours',
+                  'driving_category_id', 'instructor_id', 'driving_school_id']
+REVIEW_COLUMNS = ['review_text', 'reviewer_name', 'grade', 'review_date', 'course_id', 'likes']
 
 class BatchGenerator:
-    def __init__(self, dsn):
+    def __init__(self, dsn, seed=None):
         self.db = Database(dsn)
+        self.partitions = PartitionManager(self.db)
+        # у каждой порции свой ColumnarGenerator: генераторы NumPy и Faker не потокобезопасны
+        self._seeds = itertools.count(random.randrange(1 << 32) if seed is None else seed)
 
         # Preload reference IDs
         self.driving_category_ids = [r['driving_category_id']
@@ -24,110 +29,93 @@ class BatchGenerator:
             for r in self.db.fetch_all("SELECT course_id FROM course;")]
         self.student_group_ids = [r['student_group_id']
             for r in self.db.fetch_all("SELECT student_group_id FROM student_group;")]
+        self.student_ids = [r['student_id']
+            for r in self.db.fetch_all("SELECT student_id FROM student;")]
+
+    def _run_chunks(self, fn, chunks, workers):
+        inserted = 0
+        with ThreadPoolExecutor(max_workers=workers) as ex:
+            futures = [ex.submit(fn, c) for c in chunks]
+            for f in as_completed(futures):
+                inserted += f.result()
+        return inserted
+
+    @staticmethod
+    def _split(total, workers):
+        base = total // workers
+        rem  = total % workers
+        return [base+1 if i<rem else base for i in range(workers)]
 
     # --- Courses ---
 
     def _insert_courses_chunk(self, chunk_size):
-        inserted = 0
-        attempts = 0
-        max_attempts = chunk_size * 2
-        while inserted < chunk_size and attempts < max_attempts:
-            attempts += 1
-            duration = random.randint(1, 12)
-            price    = Decimal(f"{random.uniform(10000,50000):.2f}")
-            hours    = random.randint(20, 100)
-            cat      = random.choice(self.driving_category_ids)
-            instr    = random.choice(self.instructor_ids)
-            school   = random.choice(self.driving_school_ids)
-            try:
-                self.db.execute(
-                    "INSERT INTO course (course_duration_month, course_price, driving_hours, "
-                    "driving_category_id, instructor_id, driving_school_id) "
-                    "VALUES (%s, %s, %s, %s, %s, %s);",
-                    (duration, price, hours, cat, instr, school)
-                )
-                inserted += 1
-            except Exception:
-                continue
-        if inserted < chunk_size:
-            print(f"⚠ Only inserted {inserted}/{chunk_size} courses after {attempts} attempts")
+        # все FK берутся из предзагруженных id, поэтому нарушений не бывает
+        chunk = ColumnarGenerator(next(self._seeds)).courses(
+            chunk_size, self.driving_category_ids, self.instructor_ids, self.driving_school_ids)
+        return self.db.execute_many(
+            f"INSERT INTO course ({', '.join(COURSE_COLUMNS)}) VALUES %s;",
+            columns_to_rows(chunk, COURSE_COLUMNS)
+        )
 
     def insert_courses(self, total=10000, workers=8):
-        base = total // workers
-        rem  = total % workers
-        chunks = [base+1 if i<rem else base for i in range(workers)]
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futures = [ex.submit(self._insert_courses_chunk, c) for c in chunks]
-            for f in as_completed(futures):
-                f.result()
-        print(f"Finished inserting up to {total} courses.")
+        inserted = self._run_chunks(self._insert_courses_chunk, self._split(total, workers), workers)
+        print(f"Inserted {inserted}/{total} courses.")
+        return inserted
 
     # --- Reviews ---
 
     def _insert_reviews_chunk(self, chunk_size):
-        inserted = 0
-        attempts = 0
-        max_attempts = chunk_size * 2
-        while inserted < chunk_size and attempts < max_attempts:
-            attempts += 1
-            text     = fake.sentence(nb_words=10)
-            reviewer = fake.name()
-            grade    = round(random.uniform(1.0, 5.0), 1)
-            dt       = date.today() - timedelta(days=random.randint(0,365))
-            course   = random.choice(self.course_ids)
-            likes    = random.randint(0,100)
-            try:
-                self.db.execute(
-                    "INSERT INTO review (review_text, reviewer_name, grade, review_date, course_id, likes) "
-                    "VALUES (%s, %s, %s, %s, %s, %s);",
-                    (text, reviewer, grade, dt, course, likes)
-                )
-                inserted += 1
-            except Exception:
-                continue
-        if inserted < chunk_size:
-            print(f"⚠ Only inserted {inserted}/{chunk_size} reviews after {attempts} attempts")
+        gen = ColumnarGenerator(next(self._seeds))
+        chunk = gen.reviews(chunk_size, self.course_ids)
+        chunk['likes'] = gen.ints(0, 100, chunk_size)
+        # review секционирована по review_date — строки уходят прямо в свои секции
+        return self.partitions.insert_many(
+            'review', REVIEW_COLUMNS, columns_to_rows(chunk, REVIEW_COLUMNS)
+        )
 
     def insert_reviews(self, total=10000, workers=8):
-        base = total // workers
-        rem  = total % workers
-        chunks = [base+1 if i<rem else base for i in range(workers)]
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futures = [ex.submit(self._insert_reviews_chunk, c) for c in chunks]
-            for f in as_completed(futures):
-                f.result()
-        print(f"Finished inserting up to {total} reviews.")
+        inserted = self._run_chunks(self._insert_reviews_chunk, self._split(total, workers), workers)
+        print(f"Inserted {inserted}/{total} reviews.")
+        return inserted
 
     # --- Enrollments ---
 
-    def _insert_enrollments_chunk(self, chunk_size):
-        inserted = 0
-        attempts = 0
-        max_attempts = chunk_size * 5
-        while inserted < chunk_size and attempts < max_attempts:
-            attempts += 1
-            sid   = random.randint(10000, 30000)
-            group = random.choice(self.student_group_ids)
-            try:
-                self.db.execute(
-                    "INSERT INTO enrollment (student_id, student_group_id) VALUES (%s, %s);",
-                    (sid, group)
-                )
-                inserted += 1
-            except Exception:
-                continue
-        if inserted < chunk_size:
-            print(f"⚠ Only inserted {inserted}/{chunk_size} enrollments after {attempts} attempts")
+    def _sample_enrollments(self, total):
+        """Случайные пары (student_id, student_group_id), которых ещё нет в enrollment."""
+        taken = {(r['student_id'], r['student_group_id']) for r in self.db.fetch_all(
+            "SELECT student_id, student_group_id FROM enrollment;")}
+        free = len(self.student_ids) * len(self.student_group_ids) - len(taken)
+        if total > free:
+            print(f"⚠ Only {free} free (student, group) pairs for {total} enrollments")
+            total = free
+        if total > free // 2:
+            # плотная выборка: перебираем все свободные пары
+            pool = [(s, g) for s in self.student_ids for g in self.student_group_ids
+                    if (s, g) not in taken]
+            return random.sample(pool, total)
+        pairs = set()
+        while len(pairs) < total:
+            pair = (random.choice(self.student_ids), random.choice(self.student_group_ids))
+            if pair not in taken:
+                pairs.add(pair)
+        return list(pairs)
+
+    def _insert_enrollments_chunk(self, pairs):
+        # ON CONFLICT страхует от пар, вставленных параллельно другими клиентами
+        return self.db.execute_many(
+            "INSERT INTO enrollment (student_id, student_group_id) VALUES %s "
+            "ON CONFLICT DO NOTHING;",
+            pairs
+        )
 
     def insert_enrollments(self, total=10000, workers=8):
-        base = total // workers
-        rem  = total % workers
-        chunks = [base+1 if i<rem else base for i in range(workers)]
-        with ThreadPoolExecutor(max_workers=workers) as ex:
-            futures = [ex.submit(self._insert_enrollments_chunk, c) for c in chunks]
-            for f in as_completed(futures):
-                f.result()
-        print(f"Finished inserting up to {total} enrollments.")
+        pairs = self._sample_enrollments(total)
+        sizes = self._split(len(pairs), workers)
+        bounds = [sum(sizes[:i]) for i in range(workers + 1)]
+        chunks = [pairs[bounds[i]:bounds[i+1]] for i in range(workers)]
+        inserted = self._run_chunks(self._insert_enrollments_chunk, chunks, workers)
+        print(f"Inserted {inserted}/{total} enrollments.")
+        return inserted
 
 if __name__ == '__main__':
     DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
@@ -1,63 +1,715 @@
+import io
+import re
+import select
+import itertools
+import threading
+import time
+import weakref
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, datetime, time as dtime
+from functools import lru_cache
+
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, QueryCanceledError
+from psycopg2.extras import RealDictCursor, execute_values
 
-class Database:
-    def __init__(self, dsn):
-        self.dsn = dsn
 
-    def connect(self):
-        return psycopg2.connect(self.dsn)
+PREPARED_STATEMENTS = 100  # подготовленных выражений на соединение (0 — не готовить)
 
-    def fetch_all(self, query, params=None):
-        with self.connect() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(query, params or ())
-                return cur.fetchall()
+_PREPARABLE = re.compile(r'^\s*(?:SELECT|INSERT|UPDATE|DELETE|WITH|VALUES)\b', re.I)
+_PLACEHOLDER = re.compile(r'%%|%\((\w+)\)s|%s')
 
-    def execute(self, query, params=None):
-        with self.connect() as conn:
+
+class PoolError(psycopg2.Error):
+    pass
+
+
+@lru_cache(maxsize=1024)
+def numbered(query):
+    """%s / %(имя)s -> $1..$n; возвращает текст и порядок имён (None для позиционных)."""
+    order = []
+
+    def sub(m):
+        if m.group(0) == '%%':
+            return '%'
+        name = m.group(1)
+        if name is None:
+            order.append(None)
+            return f"${len(order)}"
+        if name not in order:
+            order.append(name)
+        return f"${order.index(name) + 1}"
+    return _PLACEHOLDER.sub(sub, query), tuple(order)
+
+
+class StatementCache:
+    """Подготовленные выражения одного соединения: нормализованный текст -> имя, LRU."""
+
+    def __init__(self, capacity, generation):
+        self.capacity = capacity
+        self.generation = generation
+        self.names = OrderedDict()
+        self.plain = set()  # не готовятся: PostgreSQL не вывел типы параметров и т. п.
+        self._ids = itertools.count(1)
+
+    def get(self, key):
+        name = self.names.get(key)
+        if name is not None:
+            self.names.move_to_end(key)
+        return name
+
+    def add(self, key):
+        """Имя для нового выражения и список вытесненных имён для DEALLOCATE."""
+        self.names[key] = f"stmt_{next(self._ids)}"
+        evicted = []
+        while len(self.names) > self.capacity:
+            evicted.append(self.names.popitem(last=False)[1])
+        return self.names[key], evicted
+
+
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(v):
+    if v is None:
+        return '\\N'
+    if isinstance(v, bool):
+        return 't' if v else 'f'
+    if isinstance(v, (date, datetime, dtime)):
+        return v.isoformat()
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(v).hex()
+    return str(v).translate(_COPY_ESCAPES)
+
+
+class CopyStream(io.RawIOBase):
+    """Файлоподобный поток для COPY FROM STDIN в текстовом формате.
+
+    Строки берутся из итератора по мере чтения, поэтому весь набор
+    данных в памяти не собирается.
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buf = bytearray()
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._buf += ('\t'.join(map(_copy_value, row)) + '\n').encode('utf-8')
+        if size < 0:
+            size = len(self._buf)
+        chunk = bytes(self._buf[:size])
+        del self._buf[:size]
+        return chunk
+
+
+class QueryEvent:
+    """Сведения об одном выражении для хуков инструментирования."""
+
+    SAMPLE_ROWS = 100
+
+    def __init__(self, query, params, wait_ms):
+        self.query = query
+        self.params = params
+        self.wait_ms = wait_ms
+        self.started = time.time()
+        self.duration_ms = 0.0
+        self.rows = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0  # оценка по первым SAMPLE_ROWS строкам
+        self.error = None
+
+    def done(self, cur, rows=None):
+        self.bytes_sent = len(cur.query or b'')
+        if rows is None:
+            self.rows = max(cur.rowcount, 0)
+            return
+        self.rows = len(rows)
+        sample = rows[:self.SAMPLE_ROWS]
+        if sample:
+            size = sum(len(str(v)) for r in sample
+                       for v in (r.values() if hasattr(r, 'values') else r))
+            self.bytes_received = size * self.rows // len(sample)
+
+
+class ConnectionPool:
+    """Потокобезопасный пул соединений.
+
+    minconn соединений держатся всегда, остальные закрываются после
+    idle_timeout секунд простоя. Соединение, простоявшее дольше
+    check_interval, перед выдачей проверяется запросом SELECT 1.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, idle_timeout=300.0,
+                 check_interval=5.0, wait_timeout=30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Некорректные размеры пула")
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.wait_timeout = wait_timeout
+        self._idle = deque()  # (conn, время возврата в пул)
+        self._used = 0
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def _reap(self, now):
+        # вызывается под self._cond
+        stale = []
+        while (self._idle and len(self._idle) + self._used > self.minconn
+               and now - self._idle[0][1] > self.idle_timeout):
+            stale.append(self._idle.popleft()[0])
+        return stale
+
+    def _healthy(self, conn):
+        if conn.closed:
+            return False
+        try:
             with conn.cursor() as cur:
-                cur.execute(query, params or ())
-                conn.commit()
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+                now = time.monotonic()
+                stale = self._reap(now)
+                if self._idle:
+                    conn, returned = self._idle.pop()
+                    break
+                if self._used < self.maxconn:
+                    conn, returned = None, now
+                    break
+                left = deadline - now
+                if left <= 0:
+                    raise PoolError("Нет свободных соединений в пуле")
+                self._cond.wait(left)
+            self._used += 1
+        for c in stale:
+            c.close()
+        try:
+            if conn is not None and (time.monotonic() - returned > self.check_interval
+                                     and not self._healthy(conn)):
+                conn.close()
+                conn = None
+            if conn is None:
+                conn = psycopg2.connect(self.dsn)
+        except BaseException:
+            with self._cond:
+                self._used -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, close=False):
+        if not close and not conn.closed:
+            try:
+                if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                close = True
+        with self._cond:
+            self._used -= 1
+            keep = not (close or conn.closed or self._closed)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if not keep and not conn.closed:
+            conn.close()
+
+    def closeall(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = list(self._idle), deque()
+            self._cond.notify_all()
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self):
+        with self._cond:
+            return {'idle': len(self._idle), 'used': self._used, 'max': self.maxconn}
+
+
+class Listener(threading.Thread):
+    """Отдельное соединение в режиме autocommit для LISTEN.
+
+    Обработчики вызываются из потока слушателя с текстом уведомления.
+    При потере соединения слушатель переподключается, повторяет LISTEN
+    и вызывает обработчики с None: изменения за время разрыва неизвестны.
+    """
+
+    def __init__(self, dsn, timeout=1.0, retry=2.0):
+        super().__init__(name='listener', daemon=True)
+        self.dsn = dsn
+        self.timeout = timeout
+        self.retry = retry
+        self.handlers = {}  # канал -> список обработчиков
+        self.conn = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            for channel in self.handlers:
+                cur.execute(f'LISTEN "{channel}";')
+        self.conn = conn
+
+    def subscribe(self, channel, handler):
+        with self._lock:
+            first = channel not in self.handlers
+            self.handlers.setdefault(channel, []).append(handler)
+            if first and self.conn is not None:
+                with self.conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{channel}";')
+
+    def unsubscribe(self, channel, handler):
+        with self._lock:
+            handlers = self.handlers.get(channel, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            if not handlers and channel in self.handlers:
+                del self.handlers[channel]
+                if self.conn is not None:
+                    with self.conn.cursor() as cur:
+                        cur.execute(f'UNLISTEN "{channel}";')
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            handlers = list(self.handlers.get(channel, ()))
+        for handler in handlers:
+            handler(payload)
+
+    def run(self):
+        lost = False
+        while not self._closed:
+            try:
+                if self.conn is None:
+                    with self._lock:
+                        self._connect()
+                    if lost:
+                        lost = False
+                        for channel in list(self.handlers):
+                            self._dispatch(channel, None)
+                if select.select([self.conn], [], [], self.timeout)[0]:
+                    with self._lock:
+                        self.conn.poll()
+                        notifies, self.conn.notifies[:] = list(self.conn.notifies), []
+                    for n in notifies:
+                        self._dispatch(n.channel, n.payload)
+            except (psycopg2.Error, OSError, ValueError):
+                if self._closed:
+                    break
+                if self.conn is not None and not self.conn.closed:
+                    self.conn.close()
+                self.conn = None
+                lost = True
+                time.sleep(self.retry)
+
+    def close(self):
+        self._closed = True
+        self.join(self.timeout * 2)
+        if self.conn is not None and not self.conn.closed:
+            self.conn.close()
 
-import psycopg2
-from psycopg2.extras import RealDictCursor
 
 class Database:
-    def __init__(self, dsn):
+    def __init__(self, dsn, pool_min=1, pool_max=10, idle_timeout=300.0, pooled=True,
+                 prepared=PREPARED_STATEMENTS):
         self.dsn = dsn
+        self.pool = ConnectionPool(dsn, pool_min, pool_max, idle_timeout) if pooled else None
+        self._local = threading.local()
+        self._cursor_ids = itertools.count(1)
+        self._active = {}  # поток -> соединения, занятые им сейчас (вложенные — тоже)
+        self._owner = {}   # id(соединения) -> поток, который его взял
+        self.cache = None  # ResultCache для call_function, если включён
+        self.hooks = []    # вызываются с QueryEvent после каждого выражения
+        self._listener = None
+        self._listener_lock = threading.Lock()
+        # соединение -> StatementCache; новое соединение после переподключения
+        # начинает с пустого кэша, а сброс поколения заставляет все соединения
+        # выполнить DEALLOCATE ALL перед следующим выражением
+        self.prepared = prepared
+        self._statements = weakref.WeakKeyDictionary()
+        self._statement_generation = 0
+        self.prepare_stats = {'prepared': 0, 'executed': 0}
 
     def connect(self):
         return psycopg2.connect(self.dsn)
 
-    def fetch_all(self, query, params=None):
-        with self.connect() as conn:
-            with conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(query, params or ())
-                return cur.fetchall()
+    def close(self):
+        if self._listener is not None:
+            self._listener.close()
+        if self.pool is not None:
+            self.pool.closeall()
 
-    def execute(self, query, params=None):
-        with self.connect() as conn:
-            with conn.cursor() as cur:
+    def listen(self, channel, handler):
+        """Подписывает handler(payload) на NOTIFY канала; вызывается из потока слушателя."""
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = Listener(self.dsn)
+                self._listener.start()
+        self._listener.subscribe(channel, handler)
+
+    def unlisten(self, channel, handler):
+        if self._listener is not None:
+            self._listener.unsubscribe(channel, handler)
+
+    def _acquire(self):
+        start = time.perf_counter()
+        conn = self.pool.getconn() if self.pool is not None else self.connect()
+        self._local.wait_ms = (time.perf_counter() - start) * 1000
+        ident = threading.get_ident()
+        self._active.setdefault(ident, []).append(conn)
+        self._owner[id(conn)] = ident
+        return conn
+
+    def _release(self, conn):
+        # генератор iter_rows может закрыть соединение не тот поток, что его взял
+        ident = self._owner.pop(id(conn), None)
+        held = self._active.get(ident)
+        if held is not None:
+            held[:] = [c for c in held if c is not conn]
+            if not held:
+                del self._active[ident]
+        if self.pool is not None:
+            self.pool.putconn(conn)
+        else:
+            conn.close()
+
+    def cancel(self, thread_id):
+        """Прерывает запросы потока thread_id на всех его соединениях (аналог
+        pg_cancel_backend): iter_rows или execute_autocommit внутри открытой
+        транзакции держат второе соединение."""
+        cancelled = False
+        for conn in list(self._active.get(thread_id, ())):
+            if not conn.closed:
+                conn.cancel()
+                cancelled = True
+        return cancelled
+
+    def reset_prepared(self):
+        """Сбрасывает подготовленные выражения всех соединений (после смены схемы)."""
+        self._statement_generation += 1
+
+    def _run(self, cur, query, params, prepare=None):
+        """cur.execute, но повторяющийся запрос — через PREPARE/EXECUTE.
+
+        Разбор и план выполняются один раз на соединение; после пяти вызовов
+        PostgreSQL может перейти на общий план и не планировать вовсе.
+        """
+        if prepare is None:
+            prepare = bool(params)
+        if not (prepare and self.prepared and _PREPARABLE.match(query)):
+            cur.execute(query, params or ())
+            return
+        # нормализованный текст — только ключ кэша: в PREPARE идёт исходный, иначе
+        # склейка в одну строку закомментирует всё после «--» и изменит литералы
+        key = ' '.join(query.split()).rstrip(';')
+        cache = self._statements.get(cur.connection)
+        if cache is None or cache.generation != self._statement_generation:
+            if cache is not None:
+                cur.execute("DEALLOCATE ALL;")
+            cache = self._statements[cur.connection] = StatementCache(
+                self.prepared, self._statement_generation)
+        if key in cache.plain:
+            cur.execute(query, params or ())
+            return
+        sql, order = numbered(query.strip().rstrip(';'))
+        name = cache.get(key)
+        if name is None:
+            name, evicted = cache.add(key)
+            for old in evicted:
+                cur.execute(f"DEALLOCATE {old};")
+            try:
+                # точка сохранения: неудачный PREPARE (например, «could not determine
+                # data type of parameter») не должен обрывать транзакцию вызывающего;
+                # без параметров psycopg2 не форматирует текст, % уже раскрыты в numbered
+                # перевод строки после текста: «--» в последней строке не съест RELEASE
+                cur.execute(f"SAVEPOINT prepare_; PREPARE {name} AS {sql}\n; RELEASE SAVEPOINT prepare_;")
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT prepare_; RELEASE SAVEPOINT prepare_;")
+                cache.names.pop(key, None)
+                if isinstance(e, QueryCanceledError):
+                    # отмена пользователя, а не неподходящий запрос: не выполнять его снова
+                    raise
+                cache.plain.add(key)
                 cur.execute(query, params or ())
+                return
+            self.prepare_stats['prepared'] += 1
+        values = [params[n] for n in order] if isinstance(params, dict) else list(params or ())
+        try:
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(values))});" if values
+                        else f"EXECUTE {name};", values)
+        except psycopg2.errors.FeatureNotSupported:
+            # «cached plan must not change result type»: таблица изменилась под
+            # SELECT *, при следующем вызове соединение подготовит всё заново
+            cache.generation = None
+            raise
+        self.prepare_stats['executed'] += 1
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    @contextmanager
+    def _traced(self, query, params=None):
+        if not self.hooks:
+            yield None
+            return
+        event = QueryEvent(query, params, self._local.__dict__.pop('wait_ms', 0.0))
+        start = time.perf_counter()
+        try:
+            yield event
+        except BaseException as e:
+            event.error = f"{type(e).__name__}: {e}".strip()
+            raise
+        finally:
+            event.duration_ms = (time.perf_counter() - start) * 1000
+            for hook in list(self.hooks):
+                hook(event)
+
+    @contextmanager
+    def transaction(self):
+        """Одна транзакция на одном соединении для всех вызовов внутри блока.
+
+        Вложенные transaction() и методы fetch_all/execute/... в том же
+        потоке используют уже открытое соединение; фиксация выполняется
+        при выходе из внешнего блока, откат — при исключении.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            yield conn
+            return
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.dirty = False
+        try:
+            yield conn
+            conn.commit()
+            if self._local.dirty and self.cache is not None:
+                self.cache.invalidate()
+        except BaseException:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._local.conn = None
+            self._release(conn)
+
+    def fetch_all(self, query, params=None, prepare=None):
+        with self.transaction() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur, self._traced(query, params) as ev:
+                self._run(cur, query, params, prepare)
+                rows = cur.fetchall()
+                if ev:
+                    ev.done(cur, rows)
+                return rows
+
+    def iter_rows(self, query, params=None, itersize=2000):
+        """Потоковое чтение через именованный (серверный) курсор.
+
+        В памяти клиента одновременно находится не больше itersize строк.
+        Соединение удерживается, пока итератор не исчерпан или не закрыт.
+        """
+        pinned = getattr(self._local, 'conn', None)
+        conn = pinned if pinned is not None else self._acquire()
+        try:
+            name = f"stream_{next(self._cursor_ids)}"
+            with conn.cursor(name=name, cursor_factory=RealDictCursor) as cur:
+                cur.itersize = itersize
+                with self._traced(query, params) as ev:
+                    cur.execute(query, params or ())
+                    if ev:
+                        ev.done(cur)
+                yield from cur
+            if pinned is None:
                 conn.commit()
+        finally:
+            if pinned is None:
+                self._release(conn)
+
+    def _wrote(self):
+        self._local.dirty = True
+
+    def execute(self, query, params=None):
+        with self.transaction() as conn:
+            self._wrote()
+            with conn.cursor() as cur, self._traced(query, params) as ev:
+                self._run(cur, query, params)
+                if ev:
+                    ev.done(cur)
 
     def execute_returning(self, query, params=None):
-        with self.connect() as conn:
-            with conn.cursor() as cur:
-                cur.execute(query, params or ())
-                result = cur.fetchone()
-                conn.commit()
-                return result
+        with self.transaction() as conn:
+            self._wrote()
+            with conn.cursor() as cur, self._traced(query, params) as ev:
+                self._run(cur, query, params)
+                if ev:
+                    ev.done(cur)
+                return cur.fetchone()
 
     def call_function(self, func_name, params=None):
         placeholders = ','.join(['%s'] * (len(params) if params else 0))
         sql = f"SELECT * FROM {func_name}({placeholders});"
-        return self.fetch_all(sql, params)
-
-
+        # текст зависит только от имени и числа аргументов — готовим всегда
+        if self.cache is not None:
+            return self.cache.call(func_name, params,
+                                   lambda: self.fetch_all(sql, params, prepare=True))
+        return self.fetch_all(sql, params, prepare=True)
 
-    def call_function(self, func_name, params=None):
+    def call_function_columns(self, func_name, params=None):
+        """call_function, но результат по столбцам (ColumnarResult)."""
         placeholders = ','.join(['%s'] * (len(params) if params else 0))
         sql = f"SELECT * FROM {func_name}({placeholders});"
-        return self.fetch_all(sql, params)
\ No newline at end of file
+        if self.cache is not None:
+            return self.cache.call(func_name, params,
+                                   lambda: self.fetch_arrays(sql, params, prepare=True),
+                                   kind='columns')
+        return self.fetch_arrays(sql, params, prepare=True)
+
+    def copy_rows(self, table, columns, rows, size=65536):
+        """Загружает кортежи rows в table через COPY FROM STDIN, возвращает число строк."""
+        sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+        with self.transaction() as conn:
+            self._wrote()
+            with conn.cursor() as cur, self._traced(sql) as ev:
+                cur.copy_expert(sql, CopyStream(rows), size=size)
+                if ev:
+                    ev.done(cur)
+                return cur.rowcount
+
+    def copy_to(self, query, file, params=None, size=65536):
+        """Пишет результат query в file как CSV с заголовком через COPY TO STDOUT.
+
+        Строки идут в file порциями по мере прихода, в памяти результат не
+        собирается; возвращает число строк.
+        """
+        with self.transaction() as conn:
+            with conn.cursor() as cur:
+                select = cur.mogrify(query.strip().rstrip(';'), params).decode()
+                sql = f"COPY ({select}) TO STDOUT WITH (FORMAT csv, HEADER)"
+                with self._traced(sql) as ev:
+                    cur.copy_expert(sql, file, size=size)
+                    if ev:
+                        ev.done(cur)
+                return cur.rowcount
+
+    def insert_many_returning(self, table, columns, rows, id_column, page_size=1000):
+        """Многострочный INSERT ... RETURNING; id возвращаются в порядке rows."""
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s "
+               f"RETURNING {id_column};")
+        with self.transaction() as conn:
+            self._wrote()
+            with conn.cursor() as cur, self._traced(sql) as ev:
+                res = execute_values(cur, sql, rows, page_size=page_size, fetch=True)
+                if ev:
+                    ev.done(cur, res)
+        return [r[0] for r in res]
+
+    def execute_many(self, query, rows, page_size=1000):
+        """Многострочная вставка через execute_values (VALUES %s), возвращает число
+        затронутых строк — с ON CONFLICT DO NOTHING это точное число вставленных."""
+        total = 0
+        rows = iter(rows)
+        with self.transaction() as conn:
+            self._wrote()
+            with conn.cursor() as cur, self._traced(query) as ev:
+                while True:
+                    page = list(itertools.islice(rows, page_size))
+                    if not page:
+                        break
+                    execute_values(cur, query, page, page_size=len(page))
+                    total += cur.rowcount
+                if ev:
+                    ev.done(cur)
+                    ev.rows = total
+        return total
+
+    def execute_values_returning(self, query, rows, template=None):
+        """Одно выражение VALUES %s на все rows с RETURNING; возвращает (имена, кортежи)."""
+        rows = list(rows)
+        with self.transaction() as conn:
+            self._wrote()
+            with conn.cursor() as cur, self._traced(query) as ev:
+                res = execute_values(cur, query, rows, template=template,
+                                     page_size=max(len(rows), 1), fetch=True)
+                if ev:
+                    ev.done(cur, res)
+                return [d.name for d in cur.description], res
+
+    def fetch_columns(self, query, params=None):
+        """Возвращает (имена столбцов, строки-кортежи) — без словаря на каждую строку."""
+        with self.transaction() as conn:
+            with conn.cursor() as cur, self._traced(query, params) as ev:
+                cur.execute(query, params or ())
+                rows = cur.fetchall()
+                if ev:
+                    ev.done(cur, rows)
+                return [d.name for d in cur.description], rows
+
+    def describe(self, query, params=None):
+        """cursor.description результата query (имена, OID типов, точность) без чтения строк."""
+        with self.transaction() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT * FROM ({query.strip().rstrip(';')}) AS q LIMIT 0;",
+                            params or ())
+                return cur.description
+
+    def fetch_arrays(self, query, params=None, chunk_rows=10000, prepare=None):
+        """Результат по столбцам: массивы NumPy вместо словаря на каждую строку.
+
+        numeric и money приводятся к float64, date/timestamp — к datetime64;
+        массивы выделяются сразу на всё число строк и заполняются порциями
+        по chunk_rows, так что кортежи строк живут только в пределах порции.
+        """
+        from columnar_result import ColumnarBuilder, register_types
+        with self.transaction() as conn:
+            with conn.cursor() as cur, self._traced(query, params) as ev:
+                register_types(cur)
+                self._run(cur, query, params, prepare)
+                builder = ColumnarBuilder(cur.description, cur.rowcount)
+                while True:
+                    rows = cur.fetchmany(chunk_rows)
+                    if not rows:
+                        break
+                    builder.add(rows)
+                if ev:
+                    ev.done(cur)
+                return builder.result()
+
+    def execute_autocommit(self, query, params=None):
+        """Выполняет команду вне транзакции (CREATE INDEX CONCURRENTLY, VACUUM и т. п.)."""
+        conn = self._acquire()
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur, self._traced(query, params) as ev:
+                # без параметров текст не форматируется, и % в SQL-скриптах не мешает
+                cur.execute(query, params)
+                if ev:
+                    ev.done(cur)
+        finally:
+            if not conn.closed:
+                conn.autocommit = False
+            self._release(conn)
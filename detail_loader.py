@@ -0,0 +1,90 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+DETAIL_LIMIT = 5000   # строк детали на одну главную запись
+CACHED_MASTERS = 200  # главных записей в LRU-кэше деталей
+
+
+class DetailLoader:
+    """Строки детали связи 1-N по ключу главной записи.
+
+    Детали нескольких главных записей читаются одним параметризованным
+    запросом: ключи передаются массивами, и для каждого LATERAL-подзапрос
+    идёт по индексу внешнего ключа с LIMIT — большая таблица деталей не
+    читается целиком. Результаты хранятся в LRU-кэше, соседние главные
+    записи загружаются заранее в фоновом потоке.
+    """
+
+    def __init__(self, db, catalog, fk, limit=DETAIL_LIMIT, capacity=CACHED_MASTERS):
+        self.db = db
+        self.table = fk['table']
+        self.fk_columns = list(fk['columns'])
+        self.ref_columns = list(fk['ref_columns'])
+        self.limit = limit
+        self.capacity = capacity
+        self.columns = catalog.columns(self.table)
+        types = {c['name']: c['type'] for c in catalog.relations[self.table]['columns']}
+        order = ', '.join(f"t.{c}" for c in catalog.primary_key(self.table) or self.fk_columns)
+        keys = ', '.join(f"k{i}" for i in range(len(self.fk_columns)))
+        match = ' AND '.join(f"t.{c} = m.k{i}" for i, c in enumerate(self.fk_columns))
+        self.sql = (f"SELECT d.* FROM unnest({', '.join(f'%s::{types[c]}[]' for c in self.fk_columns)}) "
+                    f"AS m({keys}) CROSS JOIN LATERAL (SELECT t.* FROM {self.table} t "
+                    f"WHERE {match} ORDER BY {order} LIMIT {limit}) AS d;")
+        self._cache = OrderedDict()
+        self._pending = set()
+        self._generation = 0  # растёт при сбросе кэша; старые загрузки не сохраняются
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def master_key(self, row):
+        return tuple(row[c] for c in self.ref_columns)
+
+    def cached(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+        return None
+
+    def get(self, key):
+        rows = self.cached(key)
+        return rows if rows is not None else self._fetch([key])[key]
+
+    def prefetch(self, keys):
+        """Загружает в фоне детали ещё не прочитанных главных записей."""
+        with self._lock:
+            missing = list(dict.fromkeys(k for k in keys
+                                         if k not in self._cache and k not in self._pending))
+            self._pending.update(missing)
+        if missing:
+            self._executor.submit(self._fetch, missing)
+
+    def _fetch(self, keys):
+        try:
+            generation = self._generation
+            found = {k: [] for k in keys}
+            for r in self.db.fetch_all(self.sql, [list(col) for col in zip(*keys)]):
+                found[tuple(r[c] for c in self.fk_columns)].append(r)
+            with self._lock:
+                if generation == self._generation:
+                    self._cache.update(found)
+                    for k in found:
+                        self._cache.move_to_end(k)
+                    while len(self._cache) > self.capacity:
+                        self._cache.popitem(last=False)
+            return found
+        finally:
+            with self._lock:
+                self._pending.difference_update(keys)
+
+    def truncated(self, rows):
+        return len(rows) >= self.limit
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._cache.clear()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,215 @@
+# Потоковая выгрузка результатов запросов в CSV / Parquet / xlsx с ограниченной памятью
+import argparse
+import datetime
+import itertools
+import json
+import os
+import threading
+import time
+
+from db import Database
+
+FORMATS = ('csv', 'parquet', 'xlsx')
+CHUNK_ROWS = 10000          # строк в порции (и в группе строк Parquet)
+XLSX_SHEET_ROWS = 1048575   # предел строк листа Excel без заголовка
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+def format_for(path):
+    fmt = os.path.splitext(path)[1].lstrip('.').lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {path}")
+    return fmt
+
+
+def export(db, query, path, params=None, fmt=None, chunk_rows=CHUNK_ROWS,
+           progress=None, cancelled=None):
+    """Выгружает результат query в path, возвращает число строк.
+
+    Строки читаются с сервера потоком (COPY TO STDOUT для CSV, серверный
+    курсор для Parquet и xlsx), поэтому память не зависит от размера
+    результата. progress(n) вызывается после каждой порции; если
+    cancelled() вернул True, выгрузка прерывается с ExportCancelled.
+    Файл пишется во временный path + '.part' и переименовывается в конце,
+    так что прерванная выгрузка не оставляет неполного файла.
+    """
+    fmt = fmt or format_for(path)
+    writer = {'csv': _write_csv, 'parquet': _write_parquet, 'xlsx': _write_xlsx}[fmt]
+    tick = _Ticker(progress, cancelled)
+    tmp = path + '.part'
+    try:
+        n = writer(db, query, params, tmp, chunk_rows, tick)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    return n
+
+
+class _Ticker:
+    def __init__(self, progress, cancelled):
+        self.progress = progress
+        self.cancelled = cancelled
+
+    def __call__(self, n):
+        if self.cancelled is not None and self.cancelled():
+            raise ExportCancelled("Выгрузка отменена")
+        if self.progress is not None:
+            self.progress(n)
+
+
+class _CountingFile:
+    """Файл для copy_expert: считает строки CSV (по переводам строк) и вызывает tick.
+
+    Исключение из write оставило бы соединение посреди COPY, поэтому отмена
+    идёт через сервер: запрос прерывается, остаток данных отбрасывается.
+    """
+
+    def __init__(self, f, tick, every, db):
+        self.f = f
+        self.tick = tick
+        self.every = every
+        self.db = db
+        self.lines = 0
+        self.cancelled = False
+        self._next = every
+
+    def write(self, data):
+        if self.cancelled:
+            return
+        self.f.write(data)
+        self.lines += data.count(b'\n') if isinstance(data, bytes) else data.count('\n')
+        if self.lines >= self._next:
+            self._next = self.lines + self.every
+            try:
+                self.tick(self.lines - 1)
+            except ExportCancelled:
+                self.cancelled = True
+                self.db.cancel(threading.get_ident())
+
+
+def _write_csv(db, query, params, path, chunk_rows, tick):
+    with open(path, 'wb') as f:
+        out = _CountingFile(f, tick, chunk_rows, db)
+        try:
+            n = db.copy_to(query, out, params)
+        except Exception:
+            if out.cancelled:
+                raise ExportCancelled("Выгрузка отменена")
+            raise
+    tick(n)
+    return n
+
+
+def _chunks(rows, size):
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _arrow_column(pa, column):
+    """(тип Arrow, преобразование значения или None) по OID типа столбца из cursor.description."""
+    oid = column.type_code
+    if oid == 1700:
+        if column.precision and column.precision <= 38:
+            return pa.decimal128(column.precision, column.scale or 0), None
+        return pa.string(), str  # numeric без точности может не поместиться в decimal128
+    if oid in (114, 3802):       # json/jsonb psycopg2 уже разобрал в объекты
+        return pa.string(), lambda v: json.dumps(v, ensure_ascii=False)
+    if oid == 17:
+        return pa.binary(), bytes
+    types = {16: pa.bool_(), 21: pa.int16(), 23: pa.int32(), 20: pa.int64(), 26: pa.int64(),
+             700: pa.float32(), 701: pa.float64(), 1082: pa.date32(), 1083: pa.time64('us'),
+             1114: pa.timestamp('us'), 1184: pa.timestamp('us', tz='UTC'),
+             1186: pa.duration('us'), 19: pa.string(), 25: pa.string(), 1042: pa.string(),
+             1043: pa.string()}
+    if oid in types:
+        return types[oid], None
+    return pa.string(), str
+
+
+def _write_parquet(db, query, params, path, chunk_rows, tick):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # схема — по типам столбцов запроса, а не по первой порции: столбец из
+    # одних NULL или numeric с крупными значениями в конце не ломает запись
+    columns = [(d.name, *_arrow_column(pa, d)) for d in db.describe(query, params)]
+    schema = pa.schema([pa.field(name, typ) for name, typ, _ in columns])
+    writer, n = pq.ParquetWriter(path, schema), 0
+    try:
+        for chunk in _chunks(db.iter_rows(query, params, itersize=chunk_rows), chunk_rows):
+            arrays = [pa.array([r[name] for r in chunk] if conv is None else
+                               [None if r[name] is None else conv(r[name]) for r in chunk], typ)
+                      for name, typ, conv in columns]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema),
+                               row_group_size=chunk_rows)
+            n += len(chunk)
+            tick(n)
+    finally:
+        writer.close()
+    return n
+
+
+def _cell(value):
+    # Excel не хранит часовой пояс
+    if isinstance(value, (datetime.datetime, datetime.time)) and value.tzinfo is not None:
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _write_xlsx(db, query, params, path, chunk_rows, tick):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)  # строки сбрасываются во временные файлы листов
+    ws, n, header = None, 0, None
+    for row in db.iter_rows(query, params, itersize=chunk_rows):
+        if n % XLSX_SHEET_ROWS == 0:
+            header = header or list(row)
+            ws = wb.create_sheet(f"Лист{n // XLSX_SHEET_ROWS + 1}")
+            ws.append(header)
+        ws.append([_cell(v) for v in row.values()])
+        n += 1
+        if n % chunk_rows == 0:
+            tick(n)
+    if ws is None:
+        wb.create_sheet("Лист1")
+    wb.save(path)
+    tick(n)
+    return n
+
+
+def relation_query(relation, key=None):
+    order = f" ORDER BY {', '.join(key)}" if key else ""
+    return f"SELECT * FROM {relation}{order}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Потоковая выгрузка запроса или таблицы")
+    parser.add_argument('source', help="имя таблицы/представления или текст SELECT")
+    parser.add_argument('path', help="файл .csv, .parquet или .xlsx")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--dsn', default="host=localhost dbname=kurs_bd user=postgres password=admin2005")
+    args = parser.parse_args()
+    query = args.source if ' ' in args.source.strip() else relation_query(args.source)
+    db = Database(args.dsn)
+    start = time.perf_counter()
+    try:
+        n = export(db, query, args.path, chunk_rows=args.chunk_rows,
+                   progress=lambda n: print(f"\r{n} строк", end='', flush=True))
+    finally:
+        db.close()
+    elapsed = time.perf_counter() - start
+    print(f"\r{args.path}: {n} строк за {elapsed:.1f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import itertools
+import re
+from datetime import date, timedelta
+
+from write_engine import convert
+
+_RANGE = re.compile(r'^\s*(.+?)\s*\.\.\s*(.+?)\s*$')
+_SEP = re.compile(r'[;\n]')
+_SEP_COMMA = re.compile(r'[;,\n]')
+# запятая разделяет значения только там, где она не может быть частью значения
+_COMMA_TYPES = ('smallint', 'integer', 'bigint', 'date', 'boolean')
+_RANGE_TYPES = ('smallint', 'integer', 'bigint', 'date')
+
+
+def result_columns(result):
+    """Имена столбцов из pg_get_function_result: 'TABLE(a integer, b text)' -> [a, b]."""
+    m = re.match(r'^TABLE\((.*)\)$', result or '', re.S)
+    return [part.strip().split(' ')[0].strip('"') for part in m.group(1).split(',')] if m else []
+
+
+def parse_values(param, text):
+    """Поле формы в список значений: «1; 2; 5», диапазон «2019..2024», пусто — []."""
+    column = {'name': param['name'] or 'аргумент', 'type': param['type'], 'notnull': False}
+    text = text.strip()
+    if not text:
+        return []
+    m = _RANGE.match(text) if param['type'] in _RANGE_TYPES else None
+    if m:
+        lo, hi = convert(column, m.group(1)), convert(column, m.group(2))
+        if isinstance(lo, date):
+            return [lo + timedelta(days=i) for i in range((hi - lo).days + 1)]
+        return list(range(lo, hi + 1))
+    sep = _SEP_COMMA if param['type'] in _COMMA_TYPES else _SEP
+    return [convert(column, v) for v in sep.split(text) if v.strip()]
+
+
+def parameter_sets(params, texts):
+    """Декартово произведение значений полей: [[значения аргумента] ...] -> наборы.
+
+    Пустое поле у аргумента со значением по умолчанию пропускается (None в
+    наборе), у обязательного — ошибка.
+    """
+    lists = []
+    for p, text in zip(params, texts):
+        values = parse_values(p, text)
+        if not values:
+            if not p['default']:
+                raise ValueError(f"{p['name'] or 'аргумент'}: нужно значение")
+            values = [None]
+        lists.append(values)
+    return list(itertools.product(*lists))
+
+
+class FunctionCall:
+    """SQL для вызова функции на одном или многих наборах аргументов.
+
+    Много наборов уходят одним запросом: значения каждого аргумента
+    передаются массивом, unnest собирает из них строки наборов, и функция
+    вызывается через LATERAL для каждой — 50 школ × 5 лет это один запрос,
+    а не 250. Аргументы набора выводятся первыми столбцами результата.
+    """
+
+    def __init__(self, name, info):
+        self.name = name
+        self.params = info.get('params', [])
+        taken = set(result_columns(info.get('result')))
+        self.labels = []
+        for i, p in enumerate(self.params, 1):
+            label = p['name'] or f"arg{i}"
+            self.labels.append(label if label not in taken else f"arg_{label}")
+
+    def _args(self, used, ref):
+        # именованная запись, чтобы пропускать аргументы со значением по умолчанию
+        out = []
+        for i in used:
+            name = self.params[i]['name']
+            out.append(f"{name} => {ref(i)}" if name else ref(i))
+        return ', '.join(out)
+
+    def query(self, sets):
+        """(sql, params) для списка наборов аргументов одинаковой формы."""
+        used = [i for i in range(len(self.params)) if any(s[i] is not None for s in sets)]
+        if len(sets) == 1:
+            args = self._args(used, lambda i: f"%s::{self.params[i]['type']}")
+            return f"SELECT * FROM {self.name}({args});", [sets[0][i] for i in used]
+        if not used:
+            return f"SELECT * FROM {self.name}();", []
+        arrays = ', '.join(f"%s::{self.params[i]['type']}[]" for i in used)
+        names = ', '.join(self.labels[i] for i in used)
+        args = self._args(used, lambda i: f"b.{self.labels[i]}")
+        sql = (f"SELECT {', '.join(f'b.{self.labels[i]}' for i in used)}, r.* "
+               f"FROM unnest({arrays}) WITH ORDINALITY AS b({names}, set_no__) "
+               f"CROSS JOIN LATERAL {self.name}({args}) AS r ORDER BY b.set_no__;")
+        return sql, [[s[i] for s in sets] for i in used]
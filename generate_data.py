@@ -1,4 +1,5 @@
 from db import Database
+from partitioning import PARTITIONED_TABLES, PartitionManager
 from data_generator import (
     generate_driving_categories,
     generate_districts,
@@ -22,6 +23,7 @@ from data_generator import (
 
 DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
 db = Database(DSN)
+partitions = PartitionManager(db)
 
 CAT_PHOTO_BYTES = (
     b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01'
@@ -31,24 +33,27 @@ CAT_PHOTO_BYTES = (
 )
 
 def insert_and_return_ids(table, data_list, columns, id_column="id"):
-    ids = []
-    for data in data_list:
-        placeholders = ','.join(['%s'] * len(columns))
-        cols = ','.join(columns)
-        sql = f"INSERT INTO {table} ({cols}) VALUES ({placeholders}) RETURNING {id_column};"
-        params = tuple(data[col] for col in columns)
-        res = db.execute_returning(sql, params)
-        ids.append(res[0])
-    return ids
+    # один многострочный INSERT ... RETURNING на страницу, id в порядке data_list
+    rows = (tuple(data[col] for col in columns) for data in data_list)
+    return db.insert_many_returning(table, columns, rows, id_column)
 
 
 def insert_batch(table, rows, cols):
-    sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['%s']*len(cols))})"
-    for r in rows:
-        params = [r[c] for c in cols]
-        db.execute(sql, params)
+    # COPY FROM STDIN: строки сериализуются по мере чтения, без промежуточного списка;
+    # таблицы фактов раскладываются по секциям порциями (SPLIT_CHUNK) и пишутся прямо в них
+    rows = (tuple(r[c] for c in cols) for r in rows)
+    if table in PARTITIONED_TABLES:
+        return partitions.copy_rows(table, cols, rows)
+    return db.copy_rows(table, cols, rows)
 
 def main():
+    # Всё наполнение — одна транзакция на одном соединении
+    with db.transaction():
+        seed()
+    print("Data inserted successfully!")
+
+
+def seed():
     # Вставляем справочники и получаем id
     driving_categories = generate_driving_categories()
     driving_category_ids = insert_and_return_ids("driving_category", driving_categories, ["driving_category_name"], id_column="driving_category_id")
@@ -66,8 +71,7 @@ def main():
     car_type_ids = insert_and_return_ids("car_type", car_types, ["car_type_name"], id_column="car_type_id")
 
     # Получаем id студентов из базы (без вставки новых)
-    student_ids = db.execute("SELECT student_id FROM student;")
-    student_ids = [sid[0] for sid in student_ids]
+    student_ids = [r['student_id'] for r in db.fetch_all("SELECT student_id FROM student;")]
 
     # Инструкторы (нужно использовать корректные driving_category_id)
     instructors_raw = generate_instructors(len(student_ids))
@@ -186,7 +190,5 @@ def main():
         active_courses.append(ac)
     insert_batch("active_course", active_courses, ["student_id", "course_id", "start_date", "end_date"])
 
-    print("Data inserted successfully!")
-
 if __name__ == "__main__":
     main()
@@ -0,0 +1,350 @@
+# Советник по индексам: планы тел хранимых функций, поиск проблем, применение и замеры до/после
+import argparse
+import json
+import re
+import time
+
+from db import Database
+from schema_catalog import SchemaCatalog
+
+LARGE_TABLE = 10000  # reltuples, начиная с которого Seq Scan считается проблемой
+
+FUNCTIONS_SQL = """
+SELECT p.oid, p.proname, l.lanname, p.prosrc, p.proargnames, p.proargmodes::text[] AS proargmodes,
+       array(SELECT format_type(t, NULL) FROM unnest(p.proargtypes::oid[]) WITH ORDINALITY u(t, i)
+              ORDER BY i) AS argtypes
+  FROM pg_proc p
+  JOIN pg_namespace n ON n.oid = p.pronamespace
+  JOIN pg_language l ON l.oid = p.prolang
+ WHERE n.nspname = %s AND p.proname = ANY(%s);
+"""
+
+# Внешние ключи, у которых нет индекса с этими столбцами в начале
+MISSING_FK_SQL = """
+SELECT c.conrelid::regclass::text AS table_name,
+       array(SELECT a.attname FROM unnest(c.conkey) WITH ORDINALITY k(attnum, i)
+               JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+              ORDER BY k.i)::text[] AS columns,
+       c.confrelid::regclass::text AS referenced,
+       t.reltuples::bigint AS reltuples
+  FROM pg_constraint c
+  JOIN pg_class t ON t.oid = c.conrelid
+  JOIN pg_namespace n ON n.oid = t.relnamespace
+ WHERE c.contype = 'f' AND n.nspname = %s
+   AND NOT EXISTS (SELECT 1 FROM pg_index i
+                    WHERE i.indrelid = c.conrelid
+                      AND (string_to_array(i.indkey::text, ' ')::int2[])[1:array_length(c.conkey, 1)]
+                          = c.conkey)
+ ORDER BY t.reltuples DESC;
+"""
+
+_PARAM = '%({})s::{}'
+_FUNC_ON_COLUMN = r"(\w+)\s*\(\s*(?:\w+\s+FROM\s+|[^()]*?,\s*)?\(*(?:\w+\.)?{}\b"
+_COMPARE = r"\(+(?:\w+\.)?{}\)*(?:::[\w ]+)?\s*(?:=|<>|<=|>=|<|>|~~\*?|IS|= ANY)\s"
+_YEAR_FILTER = re.compile(
+    r"EXTRACT\s*\(\s*YEAR\s+FROM\s+([\w.]+)\s*\)\s*=\s*([\w$]+)", re.I)
+
+
+def function_sources(db, functions, schema='public'):
+    """{функция: (язык, тело, [(имя, тип)] входных аргументов)}."""
+    out = {}
+    for r in db.fetch_all(FUNCTIONS_SQL, [schema, list(functions)]):
+        modes = r['proargmodes'] or ['i'] * len(r['argtypes'])
+        names = [n for n, m in zip(r['proargnames'] or [], modes) if m in ('i', 'b', 'v')]
+        names += [None] * (len(r['argtypes']) - len(names))
+        out[r['proname']] = (r['lanname'], r['prosrc'], list(zip(names, r['argtypes'])))
+    return out
+
+
+def body_query(body, args):
+    """Последнее выражение тела SQL-функции с аргументами в виде %(aN)s::тип."""
+    sql = body.strip().rstrip(';').replace('%', '%%')
+    sql = sql[sql.rfind(';') + 1:].strip() if ';' in sql else sql
+    for i, (name, typ) in reversed(list(enumerate(args, 1))):
+        sql = re.sub(rf'\${i}\b', _PARAM.format(f'a{i}', typ), sql)
+        if name:
+            sql = re.sub(rf'(?<![.\w]){re.escape(name)}\b', _PARAM.format(f'a{i}', typ), sql)
+    return sql
+
+
+def explain(db, sql, params=None):
+    """EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) на отдельном соединении с откатом."""
+    conn = db.connect()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+            plan = cur.fetchone()[0]
+        return json.loads(plan) if isinstance(plan, str) else plan
+    finally:
+        conn.rollback()
+        conn.close()
+
+
+def walk(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from walk(child)
+
+
+def index_name(table, columns):
+    parts = [re.sub(r'\W+', '_', c).strip('_') for c in columns]
+    return f"idx_{table}_{'_'.join(parts)}"[:63]
+
+
+def index_sql(table, columns):
+    cols = ', '.join(c if re.fullmatch(r'\w+', c) else f'({c})' for c in columns)
+    return f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name(table, columns)} ON {table} ({cols});"
+
+
+class IndexAdvisor:
+    """Разбирает планы тел функций и предлагает индексы и переписывание предикатов.
+
+    У SQL-функций план вызова — только Function Scan, поэтому анализируется
+    последнее выражение тела с подставленными аргументами. Находки:
+    seq_scan — последовательное чтение большой таблицы с фильтром,
+    non_sargable — столбец под функцией в условии (индекс не применим),
+    missing_fk_index — внешний ключ без индекса у таблицы из плана.
+    """
+
+    def __init__(self, db, catalog, large_table=LARGE_TABLE):
+        self.db = db
+        self.catalog = catalog
+        self.large_table = large_table
+        self._sizes = None
+
+    def sizes(self):
+        if self._sizes is None:
+            self._sizes = {r['relname']: r['reltuples'] for r in self.db.fetch_all(
+                "SELECT c.relname, c.reltuples::bigint AS reltuples FROM pg_class c "
+                "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                "WHERE n.nspname = %s AND c.relkind IN ('r','p');", [self.catalog.schema])}
+        return self._sizes
+
+    def analyze(self, functions, args=None):
+        """{функция: {'plan_ms', 'findings', 'error'}} по списку функций."""
+        args = args or {}
+        sources = function_sources(self.db, functions, self.catalog.schema)
+        missing_fk = self.db.fetch_all(MISSING_FK_SQL, [self.catalog.schema])
+        report = {}
+        for func in functions:
+            if func not in sources:
+                report[func] = {'error': 'нет в схеме'}
+                continue
+            lang, body, arg_types = sources[func]
+            values = list(args.get(func) or [])
+            if len(values) < len(arg_types):
+                report[func] = {'error': 'нет значений аргументов'}
+                continue
+            params = {f'a{i}': v for i, v in enumerate(values, 1)}
+            if lang == 'sql':
+                sql = body_query(body, arg_types)
+            else:
+                placeholders = ', '.join(f'%(a{i})s' for i in range(1, len(arg_types) + 1))
+                sql = f"SELECT * FROM {func}({placeholders})"
+            try:
+                plan = explain(self.db, sql, params)
+            except Exception as e:
+                report[func] = {'error': str(e).strip()}
+                continue
+            findings = self._plan_findings(plan[0]['Plan'])
+            findings += self._rewrites(func, body)
+            tables = {n.get('Relation Name') for n in walk(plan[0]['Plan'])}
+            for fk in missing_fk:
+                if fk['table_name'] in tables and fk['reltuples'] >= self.large_table:
+                    findings.append({'kind': 'missing_fk_index', 'table': fk['table_name'],
+                                     'columns': fk['columns'],
+                                     'detail': f"FK -> {fk['referenced']} без индекса",
+                                     'sql': index_sql(fk['table_name'], fk['columns'])})
+            report[func] = {'language': lang, 'plan_ms': plan[0].get('Execution Time'),
+                            'findings': _unique(findings)}
+        return report
+
+    def _plan_findings(self, root):
+        findings = []
+        sizes = self.sizes()
+        for node in walk(root):
+            table = node.get('Relation Name')
+            cond = node.get('Filter') or ''
+            if not table or table not in self.catalog.relations or not cond:
+                continue
+            columns = self.catalog.columns(table)
+            for col in columns:
+                m = re.search(_FUNC_ON_COLUMN.format(re.escape(col)), cond, re.I)
+                if m and m.group(1).lower() not in ('and', 'or', 'not', 'any', 'all'):
+                    func = m.group(1).lower()
+                    expr = f"{func}({col})" if func in ('lower', 'upper') else None
+                    findings.append({'kind': 'non_sargable', 'table': table, 'columns': [col],
+                                     'detail': f"{m.group(0)} в условии: индекс по {col} не применим",
+                                     'sql': index_sql(table, [expr]) if expr else None})
+            if node['Node Type'] == 'Seq Scan' and sizes.get(table, 0) >= self.large_table:
+                cols = [c for c in columns
+                        if re.search(_COMPARE.format(re.escape(c)), cond)]
+                findings.append({'kind': 'seq_scan', 'table': table, 'columns': cols,
+                                 'detail': f"Seq Scan ({sizes[table]} строк), отброшено "
+                                           f"{node.get('Rows Removed by Filter', 0)}: {cond}",
+                                 'sql': index_sql(table, cols[:2]) if cols else None})
+        return findings
+
+    def _rewrites(self, func, body):
+        findings = []
+        for m in _YEAR_FILTER.finditer(body):
+            column, year = m.groups()
+            table = self._table_of(body, column)
+            findings.append({
+                'kind': 'non_sargable', 'table': table, 'columns': [column.split('.')[-1]],
+                'detail': f"{m.group(0)} -> диапазон по {column}",
+                'rewrite': {'function': func, 'old': m.group(0), 'new': year_range(column, year)},
+                'sql': index_sql(table, [column.split('.')[-1]]) if table else None})
+        return findings
+
+    def _table_of(self, body, column):
+        if '.' not in column:
+            return None
+        alias = column.split('.')[0]
+        m = re.search(rf'\b(\w+)\s+(?:AS\s+)?{re.escape(alias)}\b', body, re.I)
+        return m.group(1) if m and m.group(1) in self.catalog.relations else None
+
+    def suggestions(self, report):
+        """Уникальные CREATE INDEX и переписывания по всему отчёту."""
+        indexes, rewrites = {}, []
+        for res in report.values():
+            for f in res.get('findings', ()):
+                if f.get('sql'):
+                    indexes.setdefault(f['sql'], f)
+                if f.get('rewrite') and f['rewrite'] not in rewrites:
+                    rewrites.append(f['rewrite'])
+        return list(indexes), rewrites
+
+    def apply(self, indexes, rewrites=()):
+        """Создаёт индексы и переписывает функции; возвращает исходные определения для отката."""
+        originals = {}
+        for sql in indexes:
+            self.db.execute_autocommit(sql)
+        for table in {re.search(r'\bON (\w+)', sql).group(1) for sql in indexes}:
+            self.db.execute_autocommit(f"ANALYZE {table};")
+        for rw in rewrites:
+            definition = self.db.fetch_all(
+                "SELECT pg_get_functiondef(p.oid) AS def FROM pg_proc p "
+                "JOIN pg_namespace n ON n.oid = p.pronamespace "
+                "WHERE n.nspname = %s AND p.proname = %s;",
+                [self.catalog.schema, rw['function']])[0]['def']
+            originals.setdefault(rw['function'], definition)
+            self.db.execute_autocommit(definition.replace(rw['old'], rw['new']))
+        self._sizes = None
+        return originals
+
+    def revert(self, indexes, originals):
+        for sql in indexes:
+            name = re.search(r'IF NOT EXISTS (\w+)', sql).group(1)
+            self.db.execute_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+        for definition in originals.values():
+            self.db.execute_autocommit(definition)
+
+
+def year_range(column, year):
+    return (f"{column} >= make_date({year}::int, 1, 1) "
+            f"AND {column} < make_date({year}::int + 1, 1, 1)")
+
+
+def _unique(findings):
+    seen, out = set(), []
+    for f in findings:
+        key = (f['kind'], f['table'], tuple(f['columns']), f.get('sql'))
+        if key not in seen:
+            seen.add(key)
+            out.append(f)
+    return out
+
+
+def timings(db, functions, args, repeat):
+    from benchmark_suite import measure
+    return {f: measure(lambda: len(db.fetch_all(
+        f"SELECT * FROM {f}({', '.join(['%s'] * len(args.get(f) or []))});", args.get(f))), repeat)
+        for f in functions}
+
+
+def advise(db, apply=False, rewrite=False, revert=False, repeat=10, functions=None):
+    from benchmark_suite import bench_args, query_functions
+    from main import QueryTab
+    catalog = SchemaCatalog(db, cache_dir=None).load()
+    functions = functions or list(dict.fromkeys(QueryTab.ALLOWED + query_functions()))
+    functions = [f for f in functions if f in catalog.functions]
+    args = bench_args()
+    advisor = IndexAdvisor(db, catalog)
+    report = {'meta': {'started': time.strftime('%Y-%m-%dT%H:%M:%S')},
+              'before': advisor.analyze(functions, args)}
+    indexes, rewrites = advisor.suggestions(report['before'])
+    report['suggested'] = {'indexes': indexes, 'rewrites': rewrites}
+    if not apply:
+        return report
+    rewrites = rewrites if rewrite else []
+    report['timings_before'] = timings(db, functions, args, repeat)
+    originals = advisor.apply(indexes, rewrites)
+    try:
+        report['timings_after'] = timings(db, functions, args, repeat)
+        report['after'] = advisor.analyze(functions, args)
+    finally:
+        if revert:
+            advisor.revert(indexes, originals)
+    return report
+
+
+def print_report(report):
+    for func, res in report['before'].items():
+        if 'error' in res:
+            print(f"{func}: {res['error']}")
+            continue
+        print(f"{func}: {res['plan_ms']} мс")
+        for f in res['findings']:
+            print(f"  [{f['kind']}] {f['table']}: {f['detail']}")
+            if f.get('rewrite'):
+                print(f"    переписать: {f['rewrite']['new']}")
+            if f.get('sql'):
+                print(f"    {f['sql']}")
+    for func, after in report.get('timings_after', {}).items():
+        before = report['timings_before'][func]
+        if 'p50_ms' in before and 'p50_ms' in after:
+            print(f"{func:<45} p50 {before['p50_ms']:>9.2f} -> {after['p50_ms']:>9.2f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Советник по индексам для функций из Запросы.md")
+    parser.add_argument('--dsn', help="БД с данными; без него поднимается временный кластер "
+                                      "и наполняется как в benchmark_suite")
+    parser.add_argument('--schema-file', help="DDL таблиц для временного кластера")
+    parser.add_argument('--scale', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--apply', action='store_true', help="создать индексы и замерить до/после")
+    parser.add_argument('--rewrite', action='store_true', help="переписать функции с диапазонами")
+    parser.add_argument('--revert', action='store_true', help="после замеров вернуть схему как было")
+    parser.add_argument('--out', default='index_advice.json')
+    args = parser.parse_args()
+    opts = dict(apply=args.apply, rewrite=args.rewrite, revert=args.revert, repeat=args.repeat)
+
+    if args.dsn:
+        db = Database(args.dsn)
+        try:
+            report = advise(db, **opts)
+        finally:
+            db.close()
+    else:
+        from benchmark_suite import Seeder, create_database, throwaway_postgres
+        if not args.schema_file:
+            parser.error("нужен --dsn или --schema-file")
+        with throwaway_postgres() as dsn:
+            db = create_database(dsn, f"advisor_sf{args.scale}", args.schema_file)
+            try:
+                Seeder(db, SchemaCatalog(db, cache_dir=None).load(), args.seed, args.scale).run()
+                report = advise(db, **opts)
+            finally:
+                db.close()
+    report['meta'].update(seed=args.seed, scale=args.scale)
+    print_report(report)
+    with open(args.out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+    print(f"отчёт: {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logging.handlers import RotatingFileHandler
+
+from schema_catalog import CACHE_DIR
+
+SLOW_QUERY_MS = 200.0
+SLOW_LOG_PATH = os.path.join(CACHE_DIR, 'slow_queries.log')
+
+_SPACES = re.compile(r'\s+')
+_EXPLAINABLE = re.compile(r'\s*(SELECT|WITH)\b', re.I)
+
+
+def normalize(query):
+    return _SPACES.sub(' ', query).strip()
+
+
+class QueryStats:
+    """Хук Database: сводка по выражениям — число, время, строки, ожидание пула, байты."""
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        key = normalize(event.query)
+        with self._lock:
+            s = self._stats.setdefault(key, {'count': 0, 'errors': 0, 'total_ms': 0.0,
+                                             'max_ms': 0.0, 'rows': 0, 'wait_ms': 0.0,
+                                             'bytes_sent': 0, 'bytes_received': 0})
+            s['count'] += 1
+            s['errors'] += event.error is not None
+            s['total_ms'] += event.duration_ms
+            s['max_ms'] = max(s['max_ms'], event.duration_ms)
+            s['rows'] += event.rows
+            s['wait_ms'] += event.wait_ms
+            s['bytes_sent'] += event.bytes_sent
+            s['bytes_received'] += event.bytes_received
+
+    def snapshot(self):
+        """Копия сводки, самые долгие по суммарному времени — первыми."""
+        with self._lock:
+            items = [(q, dict(s)) for q, s in self._stats.items()]
+        for _, s in items:
+            s['avg_ms'] = s['total_ms'] / s['count']
+        return sorted(items, key=lambda i: i[1]['total_ms'], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class SlowQueryLog:
+    """Хук Database: выражения дольше threshold_ms пишутся в ротируемый журнал.
+
+    При explain=True для медленных SELECT/WITH в фоне снимается план
+    EXPLAIN (FORMAT JSON) — без повторного выполнения запроса. analyze=True
+    (переключается на ходу) добавляет ANALYZE и BUFFERS: запрос выполняется
+    заново на соединении из пула мимо хуков и откатывается, поэтому не
+    попадает в статистику и ничего не меняет в базе.
+    """
+
+    def __init__(self, db, threshold_ms=SLOW_QUERY_MS, path=SLOW_LOG_PATH, explain=False,
+                 analyze=False, max_bytes=1 << 20, backups=3, keep=100):
+        self.db = db
+        self.threshold_ms = threshold_ms
+        self.explain = explain
+        self.analyze = analyze
+        self.entries = deque(maxlen=keep)
+        self.logger = logging.getLogger(f'avtoshkola.slow.{id(self)}')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if path:
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                              encoding='utf-8')
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+                self.logger.addHandler(handler)
+            except OSError:
+                pass
+        self._explainer = ThreadPoolExecutor(max_workers=1)
+        self._lock = threading.Lock()
+
+    def __call__(self, event):
+        if event.duration_ms < self.threshold_ms:
+            return
+        entry = {'time': event.started, 'query': normalize(event.query),
+                 'params': None if event.params is None else repr(event.params),
+                 'duration_ms': round(event.duration_ms, 1), 'wait_ms': round(event.wait_ms, 1),
+                 'rows': event.rows, 'error': event.error, 'plan': None}
+        with self._lock:
+            self.entries.append(entry)
+        if self.explain and event.error is None and _EXPLAINABLE.match(event.query):
+            self._explainer.submit(self._explain, entry, event.query, event.params)
+        else:
+            self._write(entry)
+
+    def _explain(self, entry, query, params):
+        options = 'ANALYZE, BUFFERS, FORMAT JSON' if self.analyze else 'FORMAT JSON'
+        try:
+            with self.db.transaction() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"EXPLAIN ({options}) " + query.rstrip().rstrip(';'), params)
+                    plan = cur.fetchone()[0]
+                conn.rollback()
+            entry['plan'] = plan if not isinstance(plan, str) else json.loads(plan)
+        except Exception as e:
+            entry['plan'] = {'error': str(e).strip()}
+        self._write(entry)
+
+    def _write(self, entry):
+        self.logger.info(json.dumps(entry, ensure_ascii=False, default=str))
+
+    def recent(self):
+        with self._lock:
+            return list(self.entries)
+
+    def close(self):
+        self._explainer.shutdown(wait=False, cancel_futures=True)
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+
+
+def plan_summary(plan):
+    """Корневой узел плана одной строкой: тип, оценка и фактическое время."""
+    if not plan:
+        return ""
+    if isinstance(plan, dict):
+        return plan.get('error', '')
+    root = plan[0]['Plan']
+    if 'Actual Total Time' not in root:
+        return f"{root['Node Type']} cost={root['Total Cost']} rows={root['Plan Rows']} (оценка)"
+    return (f"{root['Node Type']} cost={root['Total Cost']} "
+            f"rows={root.get('Actual Rows')} time={root.get('Actual Total Time')} мс, "
+            f"выполнение {plan[0].get('Execution Time')} мс")
@@ -1,53 +1,228 @@
+import json
+import time
+from datetime import timedelta
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import pandas as pd
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from matplotlib.dates import date2num, num2date
+from matplotlib.figure import Figure
+from aggregates import MaterializedAggregates
+from chart_data import TIME_SERIES, date_range, load_series, top_bars
+from change_feed import ChangeFeed, ensure_triggers, view_tables
 from db import Database
+from detail_loader import DetailLoader
+from exporter import export, relation_query
+from function_runner import FunctionCall, parameter_sets
+from instrumentation import QueryStats, SlowQueryLog, plan_summary
+from query_executor import QueryExecutor
+from result_cache import ResultCache
+from schema_catalog import SchemaCatalog
+from table_search import TableSearch
+from virtual_grid import VirtualGrid, IterSource, KeysetSource, relation_source
+from write_engine import ValidationError, WriteConflict, WriteEngine
+
+CATALOG_CHECK_MS = 30000  # период проверки отпечатка схемы
+SEARCH_DEBOUNCE_MS = 300  # пауза ввода перед поиском
+AGGREGATE_REFRESH_MS = 60000  # период обновления устаревших агрегатов
+AGGREGATE_BACKOFF_MS = 3600000  # после ошибок период растёт вдвое, но не дольше
+VIEW_RELOAD_MS = 500  # пауза после изменения базовых таблиц перед перечиткой представления
+ZOOM_DEBOUNCE_MS = 200  # пауза после масштабирования графика перед запросом новых точек
 
 class App(tk.Tk):
     def __init__(self, db_dsn):
+        self.started = time.perf_counter()
         super().__init__()
         self.title("Автошкола")
         self.geometry("1000x700")
         self.db = Database(db_dsn)
+        self.db.cache = ResultCache(self.db)
+        self.query_stats = QueryStats()
+        self.slow_log = SlowQueryLog(self.db, explain=True)
+        self.db.add_hook(self.query_stats)
+        self.db.add_hook(self.slow_log)
+        self.catalog = SchemaCatalog(self.db).load()
+        self.aggregates = MaterializedAggregates(self.db)
+        self.feed = ChangeFeed(self.db, self)
+        self.writes = WriteEngine(self.db, self.catalog)
+        self.status = StatusBar(self)
+        self.executor = QueryExecutor(self, self.db, on_status=self._on_status,
+                                      on_error=lambda e: messagebox.showerror("Ошибка", str(e)))
+        self.status.on_cancel = self.executor.cancel_all
         self.create_widgets()
+        self.after(1, self._startup_done)
+        self.after(CATALOG_CHECK_MS, self._check_schema)
+        self._aggregate_delay = AGGREGATE_REFRESH_MS
+        self.after(AGGREGATE_REFRESH_MS, self._refresh_aggregates)
 
     def create_widgets(self):
+        self.status.pack(side='bottom', fill='x')
         tab = ttk.Notebook(self)
-        self.table_tab = TableTab(tab, self.db)
-        self.rel_tab   = RelationTab(tab, self.db)
-        self.view_tab  = ViewTab(tab, self.db)
-        self.chart_tab = ChartTab(tab, self.db)
-        self.query_tab = QueryTab(tab, self.db)
+        # содержимое вкладок создаётся при первом открытии
+        self.table_tab = LazyTab(tab, lambda p: TableTab(p, self.db, self.executor, self.catalog,
+                                                         self.feed, self.writes))
+        self.rel_tab   = LazyTab(tab, lambda p: RelationTab(p, self.db, self.executor, self.catalog,
+                                                            self.feed))
+        self.view_tab  = LazyTab(tab, lambda p: ViewTab(p, self.db, self.executor, self.catalog,
+                                                       self.feed))
+        self.chart_tab = LazyTab(tab, lambda p: ChartTab(p, self.db, self.executor, self.aggregates))
+        self.query_tab = LazyTab(tab, lambda p: QueryTab(p, self.db, self.executor, self.catalog))
+        self.diag_tab  = LazyTab(tab, lambda p: DiagnosticsTab(p, self.db, self.executor,
+                                                               self.query_stats, self.slow_log))
 
         tab.add(self.table_tab, text="Таблицы")
         tab.add(self.rel_tab,   text="Связи 1-N")
         tab.add(self.view_tab,  text="Представления")
         tab.add(self.chart_tab, text="Диаграмма")
         tab.add(self.query_tab, text="Запросы")
+        tab.add(self.diag_tab,  text="Диагностика")
+        tab.bind('<<NotebookTabChanged>>', lambda e: self.nametowidget(tab.select()).build())
         tab.pack(fill='both', expand=True)
+        self.table_tab.build()
+
+    def _on_status(self, running, job):
+        self.status.update_jobs(running, job)
+        self.status.show_cache(self.db.cache.stats())
+
+    def _startup_done(self):
+        self.startup_ms = (time.perf_counter() - self.started) * 1000
+        source = "кэш схемы" if self.catalog.from_cache else "каталог БД"
+        self.status.label['text'] = f"Запуск: {self.startup_ms:.0f} мс ({source})"
+
+    def _check_schema(self):
+        self.executor.submit(self.catalog.check, key='catalog', label='схема',
+                             on_done=self._schema_checked)
+        self.after(CATALOG_CHECK_MS, self._check_schema)
+
+    def _refresh_aggregates(self):
+        self.executor.submit(self.aggregates.refresh, key='aggregates', label='агрегаты',
+                             on_done=self._aggregates_refreshed, on_error=self._aggregates_failed)
+        self.after(self._aggregate_delay, self._refresh_aggregates)
+
+    def _aggregates_refreshed(self, _):
+        self._aggregate_delay = AGGREGATE_REFRESH_MS
+
+    def _aggregates_failed(self, error):
+        # обычно нет прав на REFRESH: без окна с ошибкой, реже с каждой неудачей
+        self._aggregate_delay = min(self._aggregate_delay * 2, AGGREGATE_BACKOFF_MS)
+        self.status.label['text'] = f"Агрегаты не обновлены: {str(error).strip()}"
+
+    def _schema_checked(self, changed):
+        if not changed:
+            return
+        self.db.reset_prepared()
+        for lazy in (self.table_tab, self.rel_tab, self.view_tab, self.query_tab):
+            if lazy.widget is not None:
+                lazy.widget.schema_changed()
+
+def export_dialog(tab, name, query, params=None, ext='.csv'):
+    """Спрашивает файл и выгружает query в фоне с ходом в строке состояния."""
+    path = filedialog.asksaveasfilename(
+        defaultextension=ext, initialfile=name + ext,
+        filetypes=[("CSV", "*.csv"), ("Parquet", "*.parquet"), ("Excel", "*.xlsx")])
+    if not path:
+        return
+    ex = tab.executor
+    ex.submit(lambda: export(tab.db, query, path, params,
+                             progress=lambda n: ex.report(f"{n} строк"),
+                             cancelled=lambda: ex.current().cancelled),
+              key=('export', path), label=f"экспорт {name}",
+              on_done=lambda n: messagebox.showinfo("Экспорт", f"Выгружено строк: {n}\n{path}"))
+
+def record_dialog(parent, title, columns, initial=None):
+    """Модальная форма «столбец — значение»; словарь введённого или None при отмене."""
+    win = tk.Toplevel(parent)
+    win.title(title)
+    win.transient(parent)
+    entries, result = {}, {}
+    for i, c in enumerate(columns):
+        ttk.Label(win, text=f"{c['name']} ({c['type']}{', обяз.' if c['notnull'] else ''})"
+                  ).grid(row=i, column=0, sticky='w', padx=5, pady=2)
+        var = tk.StringVar(value='' if not initial or initial.get(c['name']) is None
+                           else str(initial[c['name']]))
+        ttk.Entry(win, textvariable=var, width=40).grid(row=i, column=1, padx=5, pady=2)
+        entries[c['name']] = var
+
+    def ok():
+        result.update({n: v.get() for n, v in entries.items()})
+        win.destroy()
+    buttons = ttk.Frame(win); buttons.grid(row=len(columns), column=0, columnspan=2, pady=5)
+    ttk.Button(buttons, text="OK", command=ok).pack(side='left', padx=5)
+    ttk.Button(buttons, text="Отмена", command=win.destroy).pack(side='left', padx=5)
+    win.grab_set()
+    win.wait_window()
+    return result or None
+
+class LazyTab(ttk.Frame):
+    """Контейнер вкладки: содержимое строится фабрикой при первом показе."""
+
+    def __init__(self, parent, factory):
+        super().__init__(parent)
+        self.factory = factory
+        self.widget = None
+
+    def build(self):
+        if self.widget is None:
+            self.widget = self.factory(self)
+            self.widget.pack(fill='both', expand=True)
+        return self.widget
+
+class StatusBar(ttk.Frame):
+    """Выполняющиеся запросы, латентность последнего и кнопка отмены."""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.on_cancel = None
+        self.label = ttk.Label(self, text="Готово")
+        self.label.pack(side='left', padx=5)
+        self.cancel_btn = ttk.Button(self, text="Отмена", state='disabled',
+                                     command=lambda: self.on_cancel and self.on_cancel())
+        self.cancel_btn.pack(side='right', padx=5)
+        self.progress = ttk.Progressbar(self, mode='indeterminate', length=120)
+        self.progress.pack(side='right', padx=5)
+        self.cache_label = ttk.Label(self, text="")
+        self.cache_label.pack(side='right', padx=5)
+
+    def show_cache(self, stats):
+        total = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / total * 100 if total else 0
+        self.cache_label['text'] = (f"Кэш: {stats['hits']} попаданий / {stats['misses']} промахов "
+                                    f"({ratio:.0f}%), записей {stats['entries']}")
+
+    def update_jobs(self, running, job):
+        if running:
+            self.label['text'] = "Выполняется: " + ', '.join(
+                j.label + (f" ({j.progress})" if j.progress else "") for j in running)
+            self.progress.start(15); self.cancel_btn['state'] = 'normal'
+            return
+        self.progress.stop(); self.cancel_btn['state'] = 'disabled'
+        if job.cancelled:
+            self.label['text'] = f"{job.label}: отменено"
+        else:
+            self.label['text'] = (f"{job.label}: {job.run_ms:.0f} мс "
+                                  f"(ожидание {job.wait_ms:.0f} мс)")
 
 class TableTab(ttk.Frame):
-    def __init__(self, parent, db):
+    def __init__(self, parent, db, executor, catalog, feed, writes):
         super().__init__(parent)
         self.db = db
+        self.executor = executor
+        self.catalog = catalog
+        self.feed = feed
+        self.writes = writes
+        self._watched = None
+        self.searcher = TableSearch(db, catalog)
+        self._search_job = None
+        self._indexing = set()
         self.table_names = self._load_table_names()
-        self.current_data = []
         self.create_ui()
 
     def _load_table_names(self):
-        rows = self.db.fetch_all(
-            "SELECT table_name FROM information_schema.tables WHERE table_schema='public';"
-        )
-        allowed = []
-        for r in rows:
-            t = r['table_name']
-            cols = self.db.fetch_all(
-                "SELECT column_name FROM information_schema.columns WHERE table_name=%s;", [t]
-            )
-            if any(not c['column_name'].endswith('_id') for c in cols):
-                allowed.append(t)
-        return allowed
+        return [t for t in self.catalog.tables()
+                if any(not c.endswith('_id') for c in self.catalog.columns(t))]
+
+    def schema_changed(self):
+        self.table_names = self._load_table_names()
+        self.table_cb['values'] = self.table_names
 
     def create_ui(self):
         top = ttk.Frame(self); top.pack(fill='x', pady=5)
@@ -56,123 +231,508 @@ class TableTab(ttk.Frame):
         self.table_cb.pack(side='left', padx=5)
 
         self.search_var = tk.StringVar()
+        self.search_var.trace_add('write', self._search_typed)
         ttk.Entry(top, textvariable=self.search_var).pack(side='left', padx=5)
         ttk.Button(top, text="Поиск", command=self.search).pack(side='left', padx=5)
         ttk.Button(top, text="Добавить", command=self.add_record).pack(side='left', padx=5)
         ttk.Button(top, text="Редактировать", command=self.edit_record).pack(side='left', padx=5)
         ttk.Button(top, text="Удалить", command=self.delete_record).pack(side='left', padx=5)
+        self.save_btn = ttk.Button(top, text="Сохранить", command=self.save)
+        self.save_btn.pack(side='left', padx=5)
+        ttk.Button(top, text="Отменить сохранение", command=self.undo).pack(side='left', padx=5)
+        ttk.Button(top, text="Экспорт", command=self.export).pack(side='left', padx=5)
 
-        # Добавим скроллируемую таблицу
-        tree_frame = ttk.Frame(self)
-        tree_frame.pack(fill='both', expand=True)
-
-        y_scroll = ttk.Scrollbar(tree_frame, orient='vertical')
-        x_scroll = ttk.Scrollbar(tree_frame, orient='horizontal')
-
-        self.tree = ttk.Treeview(tree_frame, show='headings', yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
-        self.tree.pack(side='left', fill='both', expand=True)
-
-        y_scroll.config(command=self.tree.yview)
-        y_scroll.pack(side='right', fill='y')
-
-        x_scroll.config(command=self.tree.xview)
-        x_scroll.pack(side='bottom', fill='x')
+        # Виртуальная таблица: в Treeview только видимые строки
+        self.rows_view = VirtualGrid(self, lambda c: not c.endswith('_id'))
+        self.rows_view.pack(fill='both', expand=True)
 
         self.load_data()
 
     def load_data(self, event=None):
         table = self.table_cb.get()
-        self.current_data = self.db.fetch_all(f"SELECT * FROM {table};")
-        self._display(self.current_data)
-
-    def _display(self, data):
-        self.tree.delete(*self.tree.get_children())
-        if not data:
-            self.tree['columns'] = []; return
-        cols = [c for c in data[0].keys() if not c.endswith('_id')]
-        self.tree['columns'] = cols
-        for c in cols:
-            self.tree.heading(c, text=c)
-            self.tree.column(c, width=120)
-        for row in data:
-            self.tree.insert('', 'end', values=[row[c] for c in cols])
+        pk = self.catalog.primary_key(table)
+        self.executor.submit(relation_source, self.db, table, pk, key=self, label=table,
+                             on_done=self.rows_view.set_source, on_discard=lambda s: s.close())
+        self._watch(table, pk)
+        self._show_pending()
+
+    def _watch(self, table, pk):
+        if table == self._watched:
+            return
+        if self._watched is not None:
+            self.feed.unwatch(self._watched, self._changed)
+        self._watched = table
+        if pk:
+            self.feed.watch(table, self._changed)
+            self.executor.submit(ensure_triggers, self.db, table, pk, key=('triggers', table),
+                                 label=f"триггеры {table}", on_error=lambda e: None)
+
+    def _changed(self, changes):
+        # Поиск показывает другой источник — его обновит следующий поиск
+        source = self.rows_view.source
+        if not isinstance(source, KeysetSource) or source.relation != self._watched:
+            return
+        start, stop = self.rows_view.window()
+        self.executor.submit(lambda: source.apply_changes(changes) and source.rows(start, stop),
+                             label=f"изменения {self._watched}",
+                             on_done=lambda _: self.rows_view.source is source and self.rows_view.render())
+
+    def export(self):
+        table = self.table_cb.get()
+        export_dialog(self, table, relation_query(table, self.catalog.primary_key(table)))
+
+    def _search_typed(self, *args):
+        if self._search_job is not None:
+            self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DEBOUNCE_MS, self.search)
 
     def search(self):
+        self._search_job = None
         term, table = self.search_var.get().lower(), self.table_cb.get()
+        if not term:
+            self.load_data(); return
+        self._ensure_search_index(table)
+        self.executor.submit(self._search_source, table, term, key=self, label=f"поиск {table}",
+                             on_done=self.rows_view.set_source, on_discard=lambda s: s.close())
+
+    def _ensure_search_index(self, table):
+        # индекс строится своим заданием: следующий символ в поле поиска
+        # прерывает поиск, но не CREATE INDEX CONCURRENTLY
+        if self.searcher.known(table) or table in self._indexing:
+            return
+        self._indexing.add(table)
+        self.executor.submit(self._build_search_index, table, key=('search index', table),
+                             label=f"индекс поиска {table}", cancellable=False)
+
+    def _build_search_index(self, table):
         try:
-            rows = self.db.call_function(f"search_{table}_by_name", [f"%{term}%"])
-        except:
-            rows = [r for r in self.current_data
-                    if any(isinstance(v,str) and term in v.lower() for v in r.values())]
-        self._display(rows)
+            return self.searcher.build_index(table)
+        finally:
+            self._indexing.discard(table)
+
+    def _search_source(self, table, term):
+        func = f"search_{table}_by_name"
+        if func in self.catalog.functions:
+            return IterSource(self.db.call_function(func, [f"%{term}%"]))
+        if self.searcher.document(table) is None:
+            return IterSource([])
+        # ранжированный постраничный поиск по trigram-индексу на сервере
+        return self.searcher.source(table, term)
+
+    # Правки копятся в пакете таблицы и уходят на сервер одной транзакцией по «Сохранить»
+
+    def _batch(self):
+        try:
+            return self.writes.batch(self.table_cb.get())
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e))
+
+    def _show_pending(self):
+        batch = self.writes.batches.get(self.table_cb.get())
+        self.save_btn['text'] = f"Сохранить ({len(batch)})" if batch else "Сохранить"
+
+    def _selected_keys(self, batch):
+        try:
+            keys = [batch.key_of(r) for r in self.rows_view.selected_rows()]
+        except KeyError:
+            messagebox.showerror("Ошибка", "В результатах поиска нет первичного ключа")
+            return []
+        if not keys:
+            messagebox.showinfo("Правка", "Выберите строки")
+        return keys
 
     def add_record(self):
-        ...
+        batch = self._batch()
+        if batch is None:
+            return
+        columns = [c for n, c in batch.columns.items() if n not in batch.key]
+        values = record_dialog(self, f"Новая запись: {batch.table}", columns)
+        if values is None:
+            return
+        # пустое поле — значение по умолчанию
+        try:
+            batch.add({n: v for n, v in values.items() if v.strip()})
+        except ValidationError as e:
+            messagebox.showerror("Проверка", "\n".join(e.errors))
+        self._show_pending()
 
     def edit_record(self):
-        ...
+        batch = self._batch()
+        keys = self._selected_keys(batch) if batch else []
+        if keys:
+            self.executor.submit(batch.snapshot, keys, label=f"чтение {batch.table}",
+                                 on_done=lambda snap: self._edit(batch, snap))
+
+    def _edit(self, batch, snap):
+        if not snap:
+            messagebox.showwarning("Правка", "Строки уже удалены")
+            return
+        columns = [c for n, c in batch.columns.items() if n not in batch.key]
+        # одну строку правим по её значениям, несколько — только заполненными полями
+        initial = next(iter(snap.values()))[1] if len(snap) == 1 else None
+        values = record_dialog(self, f"Правка: {batch.table} ({len(snap)})", columns, initial)
+        if values is None:
+            return
+        before = {n: '' if not initial or initial[n] is None else str(initial[n]) for n in values}
+        values = {n: v for n, v in values.items() if v != before[n]}
+        try:
+            for key, (xmin, old) in snap.items():
+                batch.edit(key, xmin, old, values)
+        except ValidationError as e:
+            messagebox.showerror("Проверка", "\n".join(e.errors))
+        self._show_pending()
 
     def delete_record(self):
-        ...
+        batch = self._batch()
+        keys = self._selected_keys(batch) if batch else []
+        if keys and messagebox.askyesno("Удаление", f"Удалить строк: {len(keys)}?"):
+            self.executor.submit(batch.snapshot, keys, label=f"чтение {batch.table}",
+                                 on_done=lambda snap: self._delete(batch, snap))
+
+    def _delete(self, batch, snap):
+        for key, (xmin, old) in snap.items():
+            batch.delete(key, xmin, old)
+        self._show_pending()
+
+    def save(self):
+        table = self.table_cb.get()
+        if not self.writes.batches.get(table):
+            return
+        # фиксируется снятая очередь, новые правки копятся в пустой;
+        # прерывать нельзя — иначе очередь пропала бы вместе с заданием
+        queue = self.writes.detach(table)
+        self._show_pending()
+        self.executor.submit(self.writes.commit, queue, label=f"сохранение {table}",
+                             cancellable=False,
+                             on_done=lambda _: self._show_pending(),
+                             on_error=lambda e: self._save_failed(table, e, queue))
+
+    def undo(self):
+        if self.writes.last is None:
+            messagebox.showinfo("Отмена", "Нет сохранённого пакета для отмены")
+            return
+        self.executor.submit(self.writes.undo, key=('save', self.writes.last.table),
+                             label=f"отмена {self.writes.last.table}",
+                             on_error=lambda e: self._save_failed(None, e))
+
+    def _save_failed(self, table, error, queue=None):
+        if queue is not None:
+            self.writes.merge(queue)
+            self._show_pending()
+        if not isinstance(error, WriteConflict):
+            messagebox.showerror("Ошибка", str(error))
+            return
+        keys = '\n'.join(f"{op}: {', '.join(map(str, k))}" for op, k in error.conflicts[:20])
+        if table is None:
+            messagebox.showerror("Конфликт", f"Ничего не отменено, строки уже изменены:\n{keys}")
+            return
+        if messagebox.askyesno("Конфликт", f"Ничего не сохранено, строки изменены другим "
+                               f"пользователем:\n{keys}\n\nУбрать их из очереди и сохранить остальное позже?"):
+            batch = self.writes.batch(table)
+            for op, key in error.conflicts:
+                (batch.updates if op == 'update' else batch.deletes).pop(key, None)
+            self._show_pending()
 
 class RelationTab(ttk.Frame):
-    def __init__(self, parent, db):
+    """Главная таблица сверху, строки детали выбранной записи снизу.
+
+    Связи берутся из внешних ключей каталога. Детали видимых главных
+    записей загружаются заранее, так что переход по строкам не ждёт сервер.
+    """
+
+    def __init__(self, parent, db, executor, catalog, feed):
         super().__init__(parent)
-        ttk.Label(self, text="Составная форма 1-N пока не реализована").pack(padx=10, pady=10)
+        self.db = db
+        self.executor = executor
+        self.catalog = catalog
+        self.feed = feed
+        self.loader = None
+        self._watched = None
+        self.links = self._load_links()
+        self.create_ui()
+
+    def _load_links(self):
+        return [fk for fk in self.catalog.foreign_keys
+                if fk['table'] in self.catalog.relations and fk['ref_table'] in self.catalog.relations]
+
+    def _titles(self):
+        return [f"{fk['ref_table']} → {fk['table']} ({', '.join(fk['columns'])})" for fk in self.links]
+
+    def schema_changed(self):
+        self.links = self._load_links()
+        self.link_cb['values'] = self._titles()
+
+    def create_ui(self):
+        top = ttk.Frame(self); top.pack(fill='x', pady=5)
+        self.link_cb = ttk.Combobox(top, values=self._titles(), state='readonly', width=60)
+        self.link_cb.bind('<<ComboboxSelected>>', self.select_link)
+        self.link_cb.pack(side='left', padx=5)
+        self.info = ttk.Label(top)
+        self.info.pack(side='left', padx=5)
+
+        panes = ttk.PanedWindow(self, orient='vertical'); panes.pack(fill='both', expand=True)
+        self.master = VirtualGrid(panes)
+        self.detail = VirtualGrid(panes)
+        panes.add(self.master, weight=1)
+        panes.add(self.detail, weight=1)
+        self.master.tree.bind('<<TreeviewSelect>>', self._master_selected)
+        self.master.bind('<<GridScrolled>>', lambda e: self._prefetch())
+        if self.links:
+            self.link_cb.current(0)
+            self.select_link()
+
+    def select_link(self, event=None):
+        fk = self.links[self.link_cb.current()]
+        if self.loader is not None:
+            self.loader.close()
+        self.loader = DetailLoader(self.db, self.catalog, fk)
+        self.detail.clear()
+        self.info['text'] = ''
+        pk = self.catalog.primary_key(fk['ref_table'])
+        self.executor.submit(relation_source, self.db, fk['ref_table'], pk, key=self,
+                             label=fk['ref_table'], on_done=self._master_loaded,
+                             on_discard=lambda s: s.close())
+        self._watch(fk['table'])
+
+    def _master_loaded(self, source):
+        self.master.set_source(source)
+        self._prefetch()
+
+    def _prefetch(self):
+        try:
+            self.loader.prefetch([self.loader.master_key(r) for r in self.master.shown_rows()])
+        except KeyError:
+            pass  # главная таблица без ссылочных столбцов в выборке
+
+    def _master_selected(self, event=None):
+        rows = self.master.selected_rows()
+        if not rows:
+            return
+        loader, key = self.loader, self.loader.master_key(rows[0])
+        cached = loader.cached(key)
+        if cached is not None:
+            self._show(loader, cached)
+        else:
+            self.executor.submit(loader.get, key, key=('detail', self), label=loader.table,
+                                 on_done=lambda r: self._show(loader, r))
+
+    def _show(self, loader, rows):
+        if loader is not self.loader:
+            return
+        self.detail.set_source(IterSource(rows, loader.columns))
+        more = f", показаны первые {loader.limit}" if loader.truncated(rows) else ''
+        self.info['text'] = f"{loader.table}: {len(rows)} строк{more}"
+
+    def _watch(self, table):
+        if table == self._watched:
+            return
+        if self._watched is not None:
+            self.feed.unwatch(self._watched, self._changed)
+        self._watched = table
+        pk = self.catalog.primary_key(table)
+        if pk:
+            self.feed.watch(table, self._changed)
+            self.executor.submit(ensure_triggers, self.db, table, pk, key=('triggers', table),
+                                 label=f"триггеры {table}", on_error=lambda e: None)
+
+    def _changed(self, changes):
+        # в уведомлении ключи детали, а не главной записи: сбрасываем кэш целиком
+        self.loader.invalidate()
+        self._master_selected()
+        self._prefetch()
 
 class ViewTab(ttk.Frame):
-    def __init__(self, parent, db):
+    def __init__(self, parent, db, executor, catalog, feed):
         super().__init__(parent)
         self.db = db
-        views = [r['table_name'] for r in db.fetch_all(
-            "SELECT table_name FROM information_schema.views WHERE table_schema='public';"
-        )]
-        self.view_cb = ttk.Combobox(self, values=views, state='readonly')
+        self.executor = executor
+        self.catalog = catalog
+        self.feed = feed
+        self._watched = []
+        self._reload_job = None
+        self.view_cb = ttk.Combobox(self, values=catalog.views(), state='readonly')
         self.view_cb.current(0); self.view_cb.pack(padx=5, pady=5)
         ttk.Button(self, text="Показать", command=self.show).pack()
+        ttk.Button(self, text="Экспорт", command=lambda: export_dialog(
+            self, self.view_cb.get(), relation_query(self.view_cb.get()))).pack(pady=5)
 
-        # Слайдеры
-        frame = ttk.Frame(self)
-        frame.pack(fill='both', expand=True)
+        self.rows_view = VirtualGrid(self)
+        self.rows_view.pack(fill='both', expand=True)
 
-        y_scroll = ttk.Scrollbar(frame, orient='vertical')
-        x_scroll = ttk.Scrollbar(frame, orient='horizontal')
-
-        self.tree = ttk.Treeview(frame, show='headings', yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
-        self.tree.pack(side='left', fill='both', expand=True)
-
-        y_scroll.config(command=self.tree.yview)
-        y_scroll.pack(side='right', fill='y')
-
-        x_scroll.config(command=self.tree.xview)
-        x_scroll.pack(side='bottom', fill='x')
+    def schema_changed(self):
+        self.view_cb['values'] = self.catalog.views()
 
     def show(self):
         v = self.view_cb.get()
-        data = self.db.fetch_all(f"SELECT * FROM {v};")
-        self.tree.delete(*self.tree.get_children())
-        if not data: return
-        cols = list(data[0].keys()); self.tree['columns'] = cols
-        for c in cols: self.tree.heading(c, text=c)
-        for r in data: self.tree.insert('', 'end', values=[r[c] for c in cols])
+        self.executor.submit(relation_source, self.db, v, [], key=self, label=v,
+                             on_done=self.rows_view.set_source, on_discard=lambda s: s.close())
+        self.executor.submit(self._base_tables, v, key=('view tables', self), label=f"таблицы {v}",
+                             on_done=self._watch, on_error=lambda e: None)
+
+    def _base_tables(self, view):
+        tables = view_tables(self.db, view)
+        for t in tables:
+            pk = self.catalog.primary_key(t) if t in self.catalog.relations else []
+            if pk:
+                ensure_triggers(self.db, t, pk)
+        return tables
+
+    def _watch(self, tables):
+        for t in self._watched:
+            self.feed.unwatch(t, self._changed)
+        self._watched = tables
+        for t in tables:
+            self.feed.watch(t, self._changed)
+
+    def _changed(self, changes):
+        # у представления нет ключа для точечной правки: перечитываем после паузы,
+        # сохраняя позицию прокрутки
+        if self._reload_job is not None:
+            self.after_cancel(self._reload_job)
+        self._reload_job = self.after(VIEW_RELOAD_MS, self._reload)
+
+    def _reload(self):
+        self._reload_job = None
+        v, (offset, _) = self.view_cb.get(), self.rows_view.window()
+
+        def done(source):
+            self.rows_view.set_source(source)
+            self.rows_view.scroll_to(offset)
+        self.executor.submit(relation_source, self.db, v, [], key=self, label=v,
+                             on_done=done, on_discard=lambda s: s.close())
 
 class ChartTab(ttk.Frame):
-    def __init__(self, parent, db):
+    """Графики во вкладке (FigureCanvasTkAgg) вместо отдельного окна plt.show().
+
+    Данные приходят уже свёрнутыми под ширину холста: временные ряды
+    группируются на сервере и прореживаются LTTB, столбцов не больше, чем
+    помещается, — отрисовка не зависит от числа строк в таблицах. При
+    масштабировании перечитывается только видимый диапазон.
+    """
+
+    BARS = 'Статистика курсов'
+
+    def __init__(self, parent, db, executor, aggregates):
         super().__init__(parent)
         self.db = db
-        ttk.Button(self, text="Статистика курсов", command=self.plot).pack(pady=5)
-        ttk.Button(self, text="Экспорт в Excel", command=self.export).pack(pady=5)
+        self.executor = executor
+        self.aggregates = aggregates
+        self.series = {s[0]: s[1:] for s in TIME_SERIES}
+        top = ttk.Frame(self); top.pack(fill='x', pady=5)
+        self.chart_cb = ttk.Combobox(top, values=[self.BARS] + list(self.series), state='readonly')
+        self.chart_cb.current(0); self.chart_cb.bind('<<ComboboxSelected>>', lambda e: self.plot())
+        self.chart_cb.pack(side='left', padx=5)
+        ttk.Button(top, text="Построить", command=self.plot).pack(side='left', padx=5)
+        ttk.Button(top, text="Экспорт", command=self.export).pack(side='left', padx=5)
+        self.freshness = ttk.Label(top, text="")
+        self.freshness.pack(side='left', padx=5)
+
+        self.figure = Figure(figsize=(8, 5))
+        self.ax = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, self)
+        NavigationToolbar2Tk(self.canvas, self, pack_toolbar=False).pack(side='bottom', fill='x')
+        self.canvas.get_tk_widget().pack(fill='both', expand=True)
+        self._line = self._band = None
+        self._current = None     # (таблица, столбец, единица) показанного ряда
+        self._zoom_job = None
+        self._setting_xlim = False
+        self.ax.callbacks.connect('xlim_changed', self._zoomed)
+
+    def _width(self):
+        # одна точка на пиксель холста
+        return max(self.canvas.get_tk_widget().winfo_width(), 100)
 
     def plot(self):
-        df = pd.DataFrame(self.db.call_function('get_course_statistics'))
-        plt.figure(); plt.bar(df.index, df['total_courses']); plt.title("Всего курсов"); plt.show()
+        name = self.chart_cb.get()
+        if name == self.BARS:
+            self.executor.submit(self._load, 'get_course_statistics', key='plot',
+                                 label='get_course_statistics', on_done=self._draw)
+            return
+        table, column, unit = self.series[name]
+        width = self._width()
+
+        def load():
+            bounds = date_range(self.db, table, column)
+            return bounds, bounds and load_series(self.db, table, column, unit, *bounds, width)
+        self.executor.submit(load, key='plot', label=name,
+                             on_done=lambda r: self._draw_series(name, (table, column, unit), *r))
+
+    def _load(self, func):
+        return self.db.call_function_columns(func), self.aggregates.status().get(func)
+
+    def _show_freshness(self, status):
+        if status is None:
+            self.freshness['text'] = "Расчёт по текущим данным"
+        else:
+            self.freshness['text'] = (f"Данные на {status['refreshed_at']:%H:%M:%S}"
+                                      + (", ожидают обновления" if status['stale'] else ""))
+
+    def _reset(self, title):
+        self._current = None
+        self.ax.clear()
+        self._line = self._band = None
+        self.ax.set_title(title)
+
+    def _draw(self, result):
+        rows, status = result
+        self._show_freshness(status)
+        self._reset("Всего курсов")
+        # подписи — первый нечисловой столбец, иначе номер строки
+        text = [n for n in rows.names if rows[n].dtype == object]
+        labels = [str(v) for v in rows[text[0]]] if text else [str(i) for i in range(len(rows))]
+        labels, values = top_bars(labels, rows['total_courses'], self._width())
+        self.ax.bar(range(len(values)), values)
+        self.ax.set_xticks(range(len(values)), labels, rotation=90 if len(values) > 20 else 0,
+                           fontsize='small')
+        self.figure.tight_layout()
+        self.canvas.draw_idle()
+
+    def _draw_series(self, name, current, bounds, series):
+        self.freshness['text'] = ""
+        self._reset(name)
+        if bounds is None:
+            self.canvas.draw_idle()
+            return
+        self._current = current
+        (self._line,) = self.ax.plot(series.x, series.y, linewidth=1)
+        self._update(series)
+        self._setting_xlim = True
+        self.ax.set_xlim(date2num(bounds[0]), date2num(bounds[1]))
+        self._setting_xlim = False
+        self.figure.autofmt_xdate()
+
+    def _update(self, series):
+        # тот же Line2D с новыми данными: перерисовка без пересоздания осей
+        self._line.set_data(series.x, series.y)
+        if self._band is not None:
+            self._band.remove()
+            self._band = None
+        if series.mode == 'bins':
+            self._band = self.ax.fill_between(series.x, series.low, series.high, alpha=0.3, step='post')
+        self.ax.relim(); self.ax.autoscale_view(scalex=False)
+        mode = {'raw': "все точки", 'lttb': "прорежено LTTB",
+                'bins': "свёрнуто на сервере, min/max"}[series.mode]
+        self.freshness['text'] = f"{mode}, {len(series)} точек"
+        self.canvas.draw_idle()
+
+    def _zoomed(self, ax):
+        if self._setting_xlim or self._current is None:
+            return
+        if self._zoom_job is not None:
+            self.after_cancel(self._zoom_job)
+        self._zoom_job = self.after(ZOOM_DEBOUNCE_MS, self._reload_range)
+
+    def _reload_range(self):
+        self._zoom_job = None
+        current, (x0, x1) = self._current, self.ax.get_xlim()
+        lo, hi = num2date(x0).date(), num2date(x1).date() + timedelta(days=1)
+        self.executor.submit(load_series, self.db, *current, lo, hi, self._width(), key='plot',
+                             label=f"масштаб {current[0]}",
+                             on_done=lambda s: self._current == current and self._update(s))
 
     def export(self):
-        df = pd.DataFrame(self.db.call_function('get_school_course_stats'))
-        path = filedialog.asksaveasfilename(defaultextension='.xlsx')
-        if path:
-            df.to_excel(path, index=False)
-            messagebox.showinfo("Экспорт", "Данные экспортированы")
+        export_dialog(self, 'get_school_course_stats', "SELECT * FROM get_school_course_stats()",
+                      ext='.xlsx')
 
 class QueryTab(ttk.Frame):
     ALLOWED = [
@@ -201,49 +761,171 @@ class QueryTab(ttk.Frame):
         'get_applications_income',
         'get_review_summary'
     ]
-    def __init__(self, parent, db):
+    def __init__(self, parent, db, executor, catalog):
         super().__init__(parent)
         self.db = db
-        allf = [r['routine_name'] for r in db.fetch_all(
-            "SELECT routine_name FROM information_schema.routines "
-            "WHERE routine_schema='public' AND routine_type='FUNCTION';"
-        )]
-        self.functions = [f for f in allf if f in self.ALLOWED]
+        self.executor = executor
+        self.catalog = catalog
+        self.functions = [f for f in catalog.functions if f in self.ALLOWED]
         self.func_cb = ttk.Combobox(self, values=self.functions, state='readonly')
         if self.functions: self.func_cb.current(0)
+        self.func_cb.bind('<<ComboboxSelected>>', lambda e: self._build_form())
         self.func_cb.pack(padx=5, pady=5)
+        # поля аргументов по сигнатуре функции из каталога
+        self.form = ttk.Frame(self); self.form.pack(fill='x', padx=5)
+        self.fields = []
+        self._last = None  # (функция, sql, параметры) последнего запуска — для экспорта
         ttk.Button(self, text="Выполнить", command=self.run).pack(pady=5)
+        ttk.Button(self, text="Экспорт", command=self.export).pack(pady=5)
+        self.info = ttk.Label(self); self.info.pack()
+
+        self.rows_view = VirtualGrid(self)
+        self.rows_view.pack(fill='both', expand=True)
+        self._build_form()
+
+    def schema_changed(self):
+        self.functions = [f for f in self.catalog.functions if f in self.ALLOWED]
+        self.func_cb['values'] = self.functions
+        self._build_form()
+
+    def _build_form(self):
+        for w in self.form.winfo_children():
+            w.destroy()
+        self.fields = []
+        params = self.catalog.functions.get(self.func_cb.get(), {}).get('params', [])
+        for i, p in enumerate(params):
+            name = p['name'] or f"arg{i + 1}"
+            ttk.Label(self.form, text=f"{name} ({p['type']}{', необяз.' if p['default'] else ''})"
+                      ).grid(row=i, column=0, sticky='w')
+            var = tk.StringVar()
+            ttk.Entry(self.form, textvariable=var, width=50).grid(row=i, column=1, padx=5, pady=1)
+            self.fields.append(var)
+            source = self._id_source(p['name'])
+            if source:
+                ttk.Button(self.form, text="Все", command=lambda v=var, s=source: self._fill_all(v, s)
+                           ).grid(row=i, column=2)
+        if params:
+            ttk.Label(self.form, text="Несколько значений через «;», диапазон «2019..2024»: "
+                                      "все сочетания выполняются одним запросом"
+                      ).grid(row=len(params), column=0, columnspan=3, sticky='w')
+
+    def _id_source(self, name):
+        # p_school_id -> таблица, чей первичный ключ оканчивается на school_id
+        if not name.endswith('_id'):
+            return None
+        column = name[2:] if name.startswith('p_') else name
+        for t in self.catalog.tables():
+            pk = self.catalog.primary_key(t)
+            if len(pk) == 1 and pk[0].endswith(column):
+                return t, pk[0]
+        return None
+
+    def _fill_all(self, var, source):
+        table, pk = source
+        self.executor.submit(self.db.fetch_all, f"SELECT {pk} FROM {table} ORDER BY 1;",
+                             key=('ids', self), label=f"ключи {table}",
+                             on_done=lambda rows: var.set('; '.join(str(r[pk]) for r in rows)))
 
-        # Слайдеры
-        frame = ttk.Frame(self)
-        frame.pack(fill='both', expand=True)
-
-        y_scroll = ttk.Scrollbar(frame, orient='vertical')
-        x_scroll = ttk.Scrollbar(frame, orient='horizontal')
+    def run(self):
+        fn = self.func_cb.get()
+        call = FunctionCall(fn, self.catalog.functions.get(fn, {}))
+        try:
+            sets = parameter_sets(call.params, [v.get() for v in self.fields])
+        except ValueError as e:
+            messagebox.showerror("Аргументы", str(e))
+            return
+        sql, params = call.query(sets)
+        self._last = (fn, sql, params)
+        self.info['text'] = f"Наборов аргументов: {len(sets)}, один запрос" if len(sets) > 1 else ''
+        if not call.params:
+            load = lambda: IterSource(self.db.call_function(fn))
+        elif len(sets) == 1:
+            load = lambda: IterSource(self.db.fetch_all(sql, params))
+        else:
+            load = lambda: IterSource(self.db.iter_rows(sql, params))
+        self.executor.submit(load, key=self, label=fn,
+                             on_done=self.rows_view.set_source, on_discard=lambda s: s.close())
 
-        self.tree = ttk.Treeview(frame, show='headings', yscrollcommand=y_scroll.set, xscrollcommand=x_scroll.set)
-        self.tree.pack(side='left', fill='both', expand=True)
+    def export(self):
+        fn = self.func_cb.get()
+        if self._last is not None and self._last[0] == fn:
+            _, sql, params = self._last
+        else:
+            sql, params = f"SELECT * FROM {fn}()", None
+        export_dialog(self, fn, sql.rstrip(';'), params)
 
-        y_scroll.config(command=self.tree.yview)
-        y_scroll.pack(side='right', fill='y')
+class DiagnosticsTab(ttk.Frame):
+    """Сводка по выражениям, журнал медленных запросов с планами, пул и кэш."""
 
-        x_scroll.config(command=self.tree.xview)
-        x_scroll.pack(side='bottom', fill='x')
+    STAT_COLUMNS = ('count', 'avg_ms', 'max_ms', 'total_ms', 'rows', 'wait_ms',
+                    'bytes_sent', 'bytes_received', 'errors')
 
-    def run(self):
-        fn = self.func_cb.get()
-        try:
-            data = self.db.call_function(fn)
-        except Exception as e:
-            messagebox.showerror("Ошибка", str(e)); return
-        self.tree.delete(*self.tree.get_children())
-        if not data:
-            self.tree['columns'] = []; return
-        cols = list(data[0].keys()); self.tree['columns'] = cols
-        for c in cols:
-            self.tree.heading(c, text=c); self.tree.column(c, width=120)
-        for r in data:
-            self.tree.insert('', 'end', values=[r[c] for c in cols])
+    def __init__(self, parent, db, executor, query_stats, slow_log):
+        super().__init__(parent)
+        self.db = db
+        self.executor = executor
+        self.query_stats = query_stats
+        self.slow_log = slow_log
+        top = ttk.Frame(self); top.pack(fill='x', pady=5)
+        ttk.Button(top, text="Обновить", command=self.refresh).pack(side='left', padx=5)
+        ttk.Button(top, text="Сбросить", command=self.reset).pack(side='left', padx=5)
+        # план медленного запроса по умолчанию — без выполнения; ANALYZE повторяет запрос
+        self.analyze = tk.BooleanVar(value=slow_log.analyze)
+        ttk.Checkbutton(top, text="EXPLAIN ANALYZE", variable=self.analyze,
+                        command=lambda: setattr(slow_log, 'analyze', self.analyze.get())
+                        ).pack(side='left', padx=5)
+        self.summary = ttk.Label(top, text="")
+        self.summary.pack(side='left', padx=5)
+
+        panes = ttk.PanedWindow(self, orient='vertical'); panes.pack(fill='both', expand=True)
+        self.stats_tree = ttk.Treeview(panes, columns=('query',) + self.STAT_COLUMNS, show='headings')
+        for c in ('query',) + self.STAT_COLUMNS:
+            self.stats_tree.heading(c, text=c)
+            self.stats_tree.column(c, width=400 if c == 'query' else 70, stretch=c == 'query')
+        panes.add(self.stats_tree, weight=3)
+
+        self.slow_tree = ttk.Treeview(panes, columns=('time', 'duration_ms', 'rows', 'query', 'plan'),
+                                      show='headings')
+        for c, w in (('time', 70), ('duration_ms', 80), ('rows', 60), ('query', 400), ('plan', 300)):
+            self.slow_tree.heading(c, text=c); self.slow_tree.column(c, width=w, stretch=c == 'query')
+        self.slow_tree.bind('<<TreeviewSelect>>', self._show_plan)
+        panes.add(self.slow_tree, weight=2)
+
+        self.plan_text = tk.Text(panes, height=10, wrap='none')
+        panes.add(self.plan_text, weight=2)
+        self.refresh()
+
+    def refresh(self):
+        self.stats_tree.delete(*self.stats_tree.get_children())
+        for query, s in self.query_stats.snapshot():
+            self.stats_tree.insert('', 'end', values=[query] + [
+                f"{s[c]:.1f}" if isinstance(s[c], float) else s[c] for c in self.STAT_COLUMNS])
+        self._slow = self.slow_log.recent()[::-1]
+        self.slow_tree.delete(*self.slow_tree.get_children())
+        for i, e in enumerate(self._slow):
+            self.slow_tree.insert('', 'end', iid=str(i), values=(
+                time.strftime('%H:%M:%S', time.localtime(e['time'])), e['duration_ms'], e['rows'],
+                e['query'], e['error'] or plan_summary(e['plan'])))
+        pool = self.db.pool.stats() if self.db.pool is not None else {}
+        cache = self.db.cache.stats() if self.db.cache is not None else {}
+        jobs = self.executor.stats()
+        job_ms = sum(j['run_ms'] * j['count'] for j in jobs.values())
+        self.summary['text'] = (f"Пул: {pool}  Кэш: {cache}  Подготовлено: {self.db.prepare_stats}  "
+                                f"Заданий: {sum(j['count'] for j in jobs.values())}, {job_ms:.0f} мс")
+
+    def reset(self):
+        self.query_stats.reset()
+        self.refresh()
+
+    def _show_plan(self, event=None):
+        sel = self.slow_tree.selection()
+        if not sel:
+            return
+        e = self._slow[int(sel[0])]
+        self.plan_text.delete('1.0', 'end')
+        text = f"{e['query']}\n-- параметры: {e['params']}\n\n"
+        text += json.dumps(e['plan'], ensure_ascii=False, indent=2) if e['plan'] else "плана нет"
+        self.plan_text.insert('1.0', text)
 
 if __name__ == '__main__':
     DSN = "host=localhost dbname=kurs_bd user=postgres password=admin2005"
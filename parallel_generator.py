@@ -0,0 +1,160 @@
+# Параллельная генерация синтетических строк по процессам с потоковой загрузкой через COPY
+import argparse
+import os
+import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import data_generator
+from columnar_generator import ColumnarGenerator, columns_to_rows
+
+GENERATORS = {
+    'students': data_generator.generate_students,
+    'instructors': data_generator.generate_instructors,
+    'driving_schools': data_generator.generate_driving_schools,
+    'courses': data_generator.generate_courses,
+    'student_groups': data_generator.generate_student_groups,
+    'provided_courses': data_generator.generate_provided_courses,
+    'enrollments': data_generator.generate_enrollments,
+    'lessons': data_generator.generate_lessons,
+    'reviews': data_generator.generate_reviews,
+    'ordered_courses': data_generator.generate_ordered_courses,
+    'cars': data_generator.generate_cars,
+    'car_usage_stats': data_generator.generate_car_usage_stats,
+    'active_courses': data_generator.generate_active_courses,
+}
+
+# Виды, для которых есть векторизованный генератор (ColumnarGenerator)
+COLUMNAR = {
+    'courses': ('category_ids', 'instructor_ids', 'school_ids'),
+    'enrollments': ('student_ids', 'group_ids'),
+    'lessons': ('course_ids', 'instructor_ids', 'student_ids', 'car_ids'),
+    'reviews': ('course_ids',),
+    'cars': ('brand_ids', 'car_type_ids'),
+}
+COLUMNAR_FK = {
+    'category_ids': 'driving_category_id', 'instructor_ids': 'instructor_id',
+    'school_ids': 'driving_school_id', 'student_ids': 'student_id',
+    'group_ids': 'student_group_id', 'course_ids': 'course_id',
+    'car_ids': 'car_id', 'brand_ids': 'brand_id', 'car_type_ids': 'car_type_id',
+}
+
+_FK = {}
+
+
+def _init_worker(fk):
+    global _FK
+    _FK = fk
+
+
+def shard_seed(seed, shard):
+    return seed * 1000003 + shard
+
+
+def _columnar_shard(kind, n, seed, columns, text_pool):
+    gen = ColumnarGenerator(seed, text_pool)
+    fk = {arg: _FK[COLUMNAR_FK[arg]] for arg in COLUMNAR[kind] if COLUMNAR_FK[arg] in _FK}
+    chunk = getattr(gen, kind)(n, **fk)
+    return {c: chunk[c] for c in columns}
+
+
+def _shard(kind, n, seed, columns):
+    # Сид зависит только от номера шарда, а не от процесса, который его считает
+    random.seed(seed)
+    data_generator.fake.seed_instance(seed)
+    rows = GENERATORS[kind](n)
+    chunk = {c: [r[c] for r in rows] for c in columns}
+    for col, ids in _FK.items():
+        if col in chunk:
+            chunk[col] = [ids[v % len(ids)] for v in chunk[col]]
+    return chunk
+
+
+def generate_chunks(kind, total, columns, seed=0, workers=None, chunk_size=10000, fk=None,
+                    columnar=False, text_pool=0):
+    """Генерирует total строк kind столбцовыми порциями {столбец: список}.
+
+    Порции приходят в порядке шардов, одновременно в работе не больше
+    2 * workers шардов, поэтому весь набор данных в памяти не собирается.
+    fk — {столбец: список допустимых id}; значение генератора v заменяется
+    на ids[v % len(ids)], как в generate_data. При columnar=True порции
+    строит ColumnarGenerator (массивы NumPy), а fk задаёт множества для
+    выборки значений.
+    """
+    if columnar and kind not in COLUMNAR:
+        raise ValueError(f"Нет столбцового генератора для {kind}")
+    workers = workers or os.cpu_count() or 1
+    shards = ((i, min(chunk_size, total - i * chunk_size))
+              for i in range((total + chunk_size - 1) // chunk_size))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(fk or {},)) as ex:
+        pending = deque()
+
+        def submit():
+            shard = next(shards, None)
+            if shard is not None:
+                i, n = shard
+                if columnar:
+                    fut = ex.submit(_columnar_shard, kind, n, shard_seed(seed, i), columns, text_pool)
+                else:
+                    fut = ex.submit(_shard, kind, n, shard_seed(seed, i), columns)
+                pending.append(fut)
+
+        for _ in range(workers * 2):
+            submit()
+        while pending:
+            chunk = pending.popleft().result()
+            submit()
+            yield chunk
+
+
+def chunk_rows(chunks, columns):
+    for chunk in chunks:
+        yield from columns_to_rows(chunk, columns)
+
+
+def load(db, table, kind, columns, total, **kwargs):
+    """Генерирует и сразу загружает строки через COPY, возвращает число строк."""
+    return db.copy_rows(table, columns, chunk_rows(generate_chunks(kind, total, columns, **kwargs),
+                                                   columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параллельная генерация данных")
+    parser.add_argument('kind', choices=sorted(GENERATORS))
+    parser.add_argument('total', type=int)
+    parser.add_argument('--table')
+    parser.add_argument('--columns', help="через запятую; по умолчанию все поля генератора")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--columnar', action='store_true', help="векторизованная генерация NumPy")
+    parser.add_argument('--text-pool', type=int, default=0, help="размер пула имён/текстов")
+    parser.add_argument('--dsn', default="host=localhost dbname=kurs_bd user=postgres password=admin2005")
+    args = parser.parse_args()
+
+    # по умолчанию все поля, кроме суррогатного ключа (генератор оставляет его None)
+    columns = args.columns.split(',') if args.columns else [
+        c for c, v in GENERATORS[args.kind](1)[0].items() if v is not None]
+    start = time.perf_counter()
+    if args.table:
+        from db import Database
+        db = Database(args.dsn)
+        n = load(db, args.table, args.kind, columns, args.total, seed=args.seed,
+                 workers=args.workers, chunk_size=args.chunk_size,
+                 columnar=args.columnar, text_pool=args.text_pool)
+        db.close()
+    else:
+        # без --table только генерируем: так видно масштабирование по ядрам
+        n = sum(len(ch[columns[0]]) for ch in generate_chunks(
+            args.kind, args.total, columns, seed=args.seed,
+            workers=args.workers, chunk_size=args.chunk_size,
+            columnar=args.columnar, text_pool=args.text_pool))
+    elapsed = time.perf_counter() - start
+    print(f"{args.kind}: {n} строк за {elapsed:.1f} с, {n / elapsed:.0f} строк/с, "
+          f"процессов {args.workers}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,463 @@
+# Секционирование таблиц фактов по дате: перенос, новые секции, запись сразу в секцию, проверка отсечения
+import argparse
+import bisect
+import json
+import re
+import threading
+from datetime import date, datetime
+from itertools import islice
+
+from psycopg2 import errors
+
+from change_feed import clone_triggers
+from db import Database
+from index_advisor import body_query, explain, function_sources, walk
+
+# таблица -> (столбец даты, шаг секций)
+PARTITIONED_TABLES = {
+    'lesson': ('lesson_date', 'month'),
+    'review': ('review_date', 'month'),
+    'enrollment': ('enrollment_date', 'year'),
+}
+AHEAD = 3  # секций вперёд от текущей даты держится всегда
+HISTORY_YEARS = 20  # секции не старше этого; более ранние строки живут в секции по умолчанию
+OLD_SUFFIX = '_unpartitioned'
+LOCK_TIMEOUT = '5s'  # ATTACH ждёт ACCESS EXCLUSIVE на секции по умолчанию не дольше
+SPLIT_CHUNK = 50000  # строк генератора, раскладываемых по секциям за раз
+DATE_RANGE_FUNCTIONS = (
+    'get_lessons_by_date_range',
+    'get_reviews_by_date_range',
+    'get_applications_income',
+)
+_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+INDEXES_SQL = """
+SELECT c.relname AS name, pg_get_indexdef(i.indexrelid) AS def, i.indisprimary AS pk,
+       i.indisunique AS uniq, k.conname AS constraint_name,
+       array(SELECT a.attname FROM unnest(i.indkey) WITH ORDINALITY AS u(num, n)
+               JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = u.num
+              ORDER BY u.n)::text[] AS columns
+  FROM pg_index i
+  JOIN pg_class c ON c.oid = i.indexrelid
+  LEFT JOIN pg_constraint k ON k.conindid = i.indexrelid AND k.conrelid = i.indrelid
+ WHERE i.indrelid = %s::regclass;
+"""
+
+DEPENDENT_VIEWS_SQL = """
+SELECT DISTINCT v.oid::regclass::text AS name, v.relkind::text AS kind,
+       pg_get_viewdef(v.oid) AS def
+  FROM pg_depend d
+  JOIN pg_rewrite r ON r.oid = d.objid
+  JOIN pg_class v ON v.oid = r.ev_class
+ WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = %s::regclass AND v.oid <> d.refobjid;
+"""
+
+
+def floor(d, interval):
+    return date(d.year, d.month if interval == 'month' else 1, 1)
+
+
+def shift(d, interval, n=1):
+    """Начало секции через n шагов после d (d — начало секции)."""
+    if interval == 'year':
+        return date(d.year + n, 1, 1)
+    months = d.year * 12 + d.month - 1 + n
+    return date(months // 12, months % 12 + 1, 1)
+
+
+def window(interval, ahead, today=None):
+    """(начало первой, начало последней) допустимой секции: ошибочная дата
+    вроде 0001-01-01 или 2999-12-31 не порождает тысячи секций."""
+    today = today or date.today()
+    return (date(today.year - HISTORY_YEARS, 1, 1),
+            shift(floor(today, interval), interval, ahead))
+
+
+def partition_name(table, lo, interval):
+    return f"{table}_p{lo:%Y_%m}" if interval == 'month' else f"{table}_p{lo:%Y}"
+
+
+class PartitionManager:
+    """Секционирование по диапазону дат для lesson, review и enrollment.
+
+    migrate() переносит таблицу в секционированную (помесячно или по
+    годам) в одной транзакции; исходная остаётся как <таблица>_unpartitioned
+    до drop_old(). maintain() держит секции на AHEAD шагов вперёд, а
+    строки, попавшие в секцию по умолчанию, переносит в созданную для них
+    секцию. split()/copy_rows()/insert_many() раскладывают строки
+    генераторов по секциям заранее, и запись идёт прямо в секцию.
+    """
+
+    def __init__(self, db, tables=None, ahead=AHEAD):
+        self.db = db
+        self.tables = dict(tables or PARTITIONED_TABLES)
+        self.ahead = ahead
+        self._bounds = {}  # таблица -> отсортированные [(начало, конец, секция)]
+        self._lock = threading.Lock()
+
+    def is_partitioned(self, table):
+        return bool(self.db.fetch_all(
+            "SELECT 1 FROM pg_class WHERE oid = to_regclass(%s) AND relkind = 'p';", [table]))
+
+    def partitions(self, table):
+        if table not in self._bounds:
+            parts = []
+            for r in self.db.fetch_all(
+                    "SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound "
+                    "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                    "WHERE i.inhparent = %s::regclass;", [table]):
+                m = _BOUND.search(r['bound'])
+                if m:
+                    parts.append((date.fromisoformat(m.group(1)[:10]),
+                                  date.fromisoformat(m.group(2)[:10]), r['name']))
+            self._bounds[table] = sorted(parts)
+        return self._bounds[table]
+
+    def default_partition(self, table):
+        return f"{table}_default"
+
+    # --- перенос ---
+
+    def plan(self, table):
+        """Что мешает переносу: [{'kind', 'detail', 'forceable'}]; пусто — можно."""
+        column, _ = self.tables[table]
+        issues = []
+        for r in self.db.fetch_all(
+                "SELECT conrelid::regclass::text AS source, conname FROM pg_constraint "
+                "WHERE confrelid = %s::regclass AND contype = 'f';", [table]):
+            issues.append({'kind': 'referenced', 'forceable': False,
+                           'detail': f"{r['source']}.{r['conname']} ссылается на {table}: "
+                                     f"ключ без {column} не будет уникальным"})
+        for ix in self.db.fetch_all(INDEXES_SQL, [table]):
+            if not ix['uniq'] or ix['pk'] or column in ix['columns']:
+                continue
+            if ix['constraint_name']:
+                issues.append({'kind': 'unique', 'forceable': True,
+                               'detail': f"{ix['constraint_name']} ({', '.join(ix['columns'])}) "
+                                         f"станет уникальным только вместе с {column}"})
+            else:
+                issues.append({'kind': 'unique_index', 'forceable': False,
+                               'detail': f"уникальный индекс {ix['name']} без {column}"})
+        for v in self.db.fetch_all(DEPENDENT_VIEWS_SQL, [table]):
+            if v['kind'] == 'm':
+                issues.append({'kind': 'matview', 'forceable': False,
+                               'detail': f"материализованное представление {v['name']}"})
+        for r in self.db.fetch_all(
+                "SELECT tgname FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal "
+                "AND tgname NOT LIKE %s;", [table, f"{table}\\_notify\\_%"]):
+            issues.append({'kind': 'trigger', 'forceable': True,
+                           'detail': f"триггер {r['tgname']} останется на {table}{OLD_SUFFIX}"})
+        return issues
+
+    def migrate(self, table, force=False):
+        """Переносит table в секционированную; возвращает имена созданных секций."""
+        column, interval = self.tables[table]
+        if self.is_partitioned(table):
+            return []
+        blocking = [i for i in self.plan(table) if not (force and i['forceable'])]
+        if blocking:
+            raise ValueError(f"{table}: " + '; '.join(i['detail'] for i in blocking))
+        old = table + OLD_SUFFIX
+        with self.db.transaction():
+            self.db.execute(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE;")
+            bounds = self.db.fetch_all(
+                f"SELECT min({column})::date AS lo, max({column})::date AS hi FROM {table};")[0]
+            indexes = self.db.fetch_all(INDEXES_SQL, [table])
+            fks = self.db.fetch_all(
+                "SELECT conname, pg_get_constraintdef(oid) AS def FROM pg_constraint "
+                "WHERE conrelid = %s::regclass AND contype = 'f';", [table])
+            views = [v for v in self.db.fetch_all(DEPENDENT_VIEWS_SQL, [table]) if v['kind'] == 'v']
+            columns = self.db.fetch_all(
+                "SELECT attname, attidentity <> '' AS identity, "
+                "pg_get_serial_sequence(%s, attname) AS seq FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped "
+                "AND attgenerated = '' ORDER BY attnum;", [table, table])
+
+            self.db.execute(f"ALTER TABLE {table} RENAME TO {old};")
+            for ix in indexes:
+                self.db.execute(f"ALTER INDEX {ix['name']} RENAME TO "
+                                f"{ix['name'][:63 - len(OLD_SUFFIX)]}{OLD_SUFFIX};")
+            self.db.execute(
+                f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+                f"INCLUDING GENERATED INCLUDING IDENTITY INCLUDING STORAGE INCLUDING COMMENTS) "
+                f"PARTITION BY RANGE ({column});")
+            oldest, newest = window(interval, self.ahead)
+            first = max(floor(bounds['lo'] or date.today(), interval), oldest)
+            last = newest
+            created = []
+            while first <= last:
+                created.append(self._create_partition(table, first, interval))
+                first = shift(first, interval)
+            self.db.execute(f"CREATE TABLE {self.default_partition(table)} "
+                            f"PARTITION OF {table} DEFAULT;")
+
+            # первичный ключ и уникальность — только вместе со столбцом секционирования
+            for ix in indexes:
+                keys = ', '.join(ix['columns'] + ([column] if column not in ix['columns'] else []))
+                if ix['pk']:
+                    self.db.execute(f"ALTER TABLE {table} ADD CONSTRAINT {ix['constraint_name']} "
+                                    f"PRIMARY KEY ({keys});")
+                elif ix['uniq'] and ix['constraint_name']:
+                    self.db.execute(f"ALTER TABLE {table} ADD CONSTRAINT {ix['constraint_name']} "
+                                    f"UNIQUE ({keys});")
+                elif not ix['uniq']:
+                    # определение ссылается на имя table — теперь это новая таблица
+                    self.db.execute(ix['def'].replace('%', '%%') + ';')
+            for fk in fks:
+                self.db.execute(f"ALTER TABLE {table} ADD CONSTRAINT {fk['conname']} "
+                                f"{fk['def'].replace('%', '%%')};")
+
+            names = ', '.join(c['attname'] for c in columns)
+            self.db.execute(f"INSERT INTO {table} ({names}) OVERRIDING SYSTEM VALUE "
+                            f"SELECT {names} FROM {old};")
+            for c in columns:
+                if c['seq'] and not c['identity']:
+                    # serial: последовательность переходит к новой таблице
+                    self.db.execute(f"ALTER SEQUENCE {c['seq']} OWNED BY {table}.{c['attname']};")
+                if c['seq']:
+                    self.db.execute(
+                        f"SELECT setval(pg_get_serial_sequence(%s, %s), "
+                        f"coalesce((SELECT max({c['attname']}) FROM {table}), 0) + 1, false);",
+                        [table, c['attname']])
+            for v in views:
+                self.db.execute(f"CREATE OR REPLACE VIEW {v['name']} AS {v['def'].replace('%', '%%')}")
+            self.db.execute(f"ANALYZE {table};")
+        self._bounds.pop(table, None)
+        return created
+
+    def drop_old(self, table):
+        self.db.execute(f"DROP TABLE IF EXISTS {table}{OLD_SUFFIX};")
+
+    # --- секции ---
+
+    def _create_partition(self, table, lo, interval):
+        name = partition_name(table, lo, interval)
+        self.db.execute(f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM (%s) TO (%s);", [lo, shift(lo, interval)])
+        return name
+
+    def add_partition(self, table, lo):
+        """Секция, начинающаяся с lo; строки этого диапазона из секции по умолчанию
+        переносятся в неё (иначе PostgreSQL не даст её создать).
+
+        Секция создаётся и фиксируется на отдельном соединении: откат
+        транзакции вызывающего (например, всего наполнения generate_data)
+        её не отменяет, и кэш границ не расходится с базой. Повторный вызов
+        и гонка клиентов безопасны: создание секций таблицы идёт под
+        рекомендательной блокировкой, уже подключённая секция не трогается
+        (тогда возвращается None). Если секцию по умолчанию держат дольше
+        LOCK_TIMEOUT, бросается LockNotAvailable.
+        """
+        column, interval = self.tables[table]
+        lo = floor(lo, interval)
+        hi = shift(lo, interval)
+        name = partition_name(table, lo, interval)
+        default = self.default_partition(table)
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", [f"partition {table}"])
+                cur.execute("SELECT 1 FROM pg_inherits WHERE inhparent = %s::regclass "
+                            "AND inhrelid = to_regclass(%s);", [table, name])
+                if cur.fetchone():
+                    return None
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {name} (LIKE {table} INCLUDING DEFAULTS "
+                            f"INCLUDING CONSTRAINTS);")
+                cur.execute(
+                    f"WITH moved AS (DELETE FROM {default} WHERE {column} >= %(lo)s "
+                    f"AND {column} < %(hi)s RETURNING *) INSERT INTO {name} SELECT * FROM moved;",
+                    {'lo': lo, 'hi': hi})
+                cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} "
+                            f"FOR VALUES FROM (%s) TO (%s);", [lo, hi])
+                clone_triggers(cur, table, name)
+            conn.commit()
+            return name
+        finally:
+            conn.close()
+            self._bounds.pop(table, None)
+
+    def maintain(self, today=None):
+        """Создаёт недостающие секции до AHEAD шагов вперёд; возвращает созданные.
+
+        Запускается по расписанию (partitioning.py maintain из cron) под
+        владельцем таблиц. Таблица, секцию по умолчанию которой не удалось
+        заблокировать, пропускается до следующего запуска.
+        """
+        today = today or date.today()
+        created = []
+        with self._lock:
+            for table, (_, interval) in self.tables.items():
+                if not self.is_partitioned(table):
+                    continue
+                self._bounds.pop(table, None)
+                have = {p[0] for p in self.partitions(table)}
+                lo = floor(today, interval)
+                try:
+                    for i in range(self.ahead + 1):
+                        start = shift(lo, interval, i)
+                        if start not in have:
+                            name = self.add_partition(table, start)
+                            if name:
+                                created.append(name)
+                except errors.LockNotAvailable:
+                    print(f"{table}: секция по умолчанию занята, пропуск")
+        return created
+
+    # --- запись генераторов ---
+
+    def _locate(self, table, value):
+        """Секция для даты value по кэшу границ; None — подходящей нет."""
+        parts = self.partitions(table)
+        i = bisect.bisect_right(parts, (value, date.max, '')) - 1
+        return parts[i][2] if i >= 0 and value < parts[i][1] else None
+
+    def split(self, table, columns, rows):
+        """Итератор (секция или table, строки): строки разложены по секциям диапазона дат.
+
+        Запись прямо в секцию обходит маршрутизацию строк в родительской
+        таблице. Строки читаются порциями по SPLIT_CHUNK, так что поток
+        генератора не собирается в памяти целиком; недостающие секции порции
+        создаются до её записи, каждая своей транзакцией (см. add_partition).
+        Если секция по умолчанию заблокирована — в том числе записью этой
+        же транзакции, — строки идут в неё, и maintain() перенесёт их позже.
+        Для несекционированной таблицы или строк без столбца даты —
+        один (table, rows).
+        """
+        column, interval = self.tables.get(table, (None, None))
+        if column not in columns or not self.is_partitioned(table):
+            yield table, rows
+            return
+        idx = list(columns).index(column)
+        oldest, newest = window(interval, self.ahead)
+        limit = shift(newest, interval)
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, SPLIT_CHUNK))
+            if not chunk:
+                return
+            dates = [r[idx].date() if isinstance(r[idx], datetime) else r[idx] for r in chunk]
+            missing = {floor(d, interval) for d in dates
+                       if d is not None and oldest <= d < limit and self._locate(table, d) is None}
+            for lo in sorted(missing):
+                try:
+                    self.add_partition(table, lo)
+                except errors.LockNotAvailable:
+                    pass
+            out = {}
+            for r, d in zip(chunk, dates):
+                target = self._locate(table, d) if d is not None else None
+                out.setdefault(target or self.default_partition(table), []).append(r)
+            yield from out.items()
+
+    def copy_rows(self, table, columns, rows):
+        return sum(self.db.copy_rows(target, columns, part)
+                   for target, part in self.split(table, columns, rows))
+
+    def insert_many(self, table, columns, rows, suffix=''):
+        """execute_values по секциям; suffix — например, ' ON CONFLICT DO NOTHING'."""
+        return sum(self.db.execute_many(
+            f"INSERT INTO {target} ({', '.join(columns)}) VALUES %s{suffix};", part)
+            for target, part in self.split(table, columns, rows))
+
+    # --- проверка отсечения секций ---
+
+    def explain_generic(self, sql, values):
+        """EXPLAIN ANALYZE запроса с параметрами по общему плану (PREPARE/EXECUTE).
+
+        Так выполняется тело функции при вызове: значения аргументов при
+        планировании неизвестны, и секции могут отсекаться только при
+        запуске (Subplans Removed). sql — результат body_query.
+        """
+        names = sorted(values, key=lambda n: int(n[1:]))
+        text = re.sub(r'%\(a(\d+)\)s', r'$\1', sql).replace('%%', '%')
+        args = f" ({', '.join(['%s'] * len(names))})" if names else ''
+        conn = self.db.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET LOCAL plan_cache_mode = force_generic_plan;")
+                cur.execute(f"PREPARE verify_pruning AS {text};")
+                cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) EXECUTE verify_pruning{args};",
+                            [values[n] for n in names])
+                plan = cur.fetchone()[0]
+            return json.loads(plan) if isinstance(plan, str) else plan
+        finally:
+            conn.rollback()
+            conn.close()
+
+    def verify(self, functions=DATE_RANGE_FUNCTIONS, args=None, generic=False):
+        """EXPLAIN ANALYZE тел функций: сколько секций читается из всех.
+
+        [{'function', 'table', 'scanned', 'total', 'removed', 'pruned'}];
+        removed — секции, отсечённые при выполнении (Subplans Removed).
+        generic=False — аргументы подставлены значениями (отсечение при
+        планировании), True — переданы параметрами, как при вызове функции.
+        Прочитанной считается секция, узел которой выполнялся хотя бы раз.
+        """
+        if args is None:
+            from benchmark_suite import bench_args
+            args = bench_args()
+        report = []
+        for func, (lang, body, params) in function_sources(self.db, functions).items():
+            if lang != 'sql' or func not in args:
+                continue
+            values = {f"a{i}": v for i, v in enumerate(args[func], 1)}
+            sql = body_query(body, params)
+            plan = (self.explain_generic(sql, values) if generic
+                    else explain(self.db, sql, values))[0]['Plan']
+            nodes = list(walk(plan))
+            for table in self.tables:
+                if not re.search(rf'\b{table}\b', body) or not self.is_partitioned(table):
+                    continue
+                names = {p[2] for p in self.partitions(table)} | {self.default_partition(table)}
+                scanned = sorted({n['Relation Name'] for n in nodes
+                                  if n.get('Relation Name') in names and n.get('Actual Loops', 1)})
+                report.append({'function': func, 'table': table, 'scanned': scanned,
+                               'total': len(names), 'generic': generic,
+                               'removed': sum(n.get('Subplans Removed', 0) for n in nodes),
+                               'pruned': len(scanned) < len(names)})
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Секционирование таблиц фактов по дате")
+    parser.add_argument('action', choices=['plan', 'migrate', 'maintain', 'verify', 'drop-old'])
+    parser.add_argument('--table', action='append', choices=list(PARTITIONED_TABLES),
+                        help="таблица (по умолчанию все)")
+    parser.add_argument('--force', action='store_true',
+                        help="расширить уникальные ограничения столбцом даты")
+    parser.add_argument('--dsn', default="host=localhost dbname=kurs_bd user=postgres password=admin2005")
+    args = parser.parse_args()
+    db = Database(args.dsn)
+    try:
+        pm = PartitionManager(db)
+        tables = args.table or list(PARTITIONED_TABLES)
+        if args.action == 'plan':
+            for t in tables:
+                issues = pm.plan(t)
+                print(f"{t}: {'готова к переносу' if not issues else ''}")
+                for i in issues:
+                    print(f"  {'(--force) ' if i['forceable'] else ''}{i['detail']}")
+        elif args.action == 'migrate':
+            for t in tables:
+                print(f"{t}: секций {len(pm.migrate(t, args.force))}")
+        elif args.action == 'maintain':
+            print("создано:", ', '.join(pm.maintain()) or "ничего")
+        elif args.action == 'drop-old':
+            for t in tables:
+                pm.drop_old(t)
+        else:
+            failed = False
+            for r in pm.verify() + pm.verify(generic=True):
+                failed |= not r['pruned']
+                print(f"{r['function']:<30} {'параметры' if r['generic'] else 'значения':<9} "
+                      f"{r['table']:<11} читается {len(r['scanned'])} из "
+                      f"{r['total']} секций, отсечено при выполнении {r['removed']}"
+                      f"{'' if r['pruned'] else '  — НЕТ ОТСЕЧЕНИЯ'}")
+            raise SystemExit(1 if failed else 0)
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
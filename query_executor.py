@@ -0,0 +1,173 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from psycopg2.extensions import QueryCanceledError
+
+
+class Job:
+    def __init__(self, label, key):
+        self.label = label
+        self.key = key
+        self.submitted = time.monotonic()
+        self.started = None
+        self.finished = None
+        self.thread = None
+        self.cancelled = False
+        self.error = None
+        self.future = None
+        self.cancellable = True
+        self.progress = None  # текст хода выполнения, задаётся из рабочего потока
+        self._progress_shown = None
+
+    @property
+    def wait_ms(self):
+        return ((self.started or self.finished or time.monotonic()) - self.submitted) * 1000
+
+    @property
+    def run_ms(self):
+        if self.started is None:
+            return 0.0
+        return ((self.finished or time.monotonic()) - self.started) * 1000
+
+
+class QueryExecutor:
+    """Выполняет запросы в пуле потоков и возвращает результаты в поток Tk.
+
+    Рабочие потоки кладут результаты в очередь, которую поток Tk разбирает
+    по after(). Задание с тем же key, что и новое, считается устаревшим:
+    его запрос прерывается, а результат отбрасывается.
+    """
+
+    def __init__(self, widget, db, workers=4, poll_ms=30, on_status=None, on_error=None):
+        self.widget = widget
+        self.db = db
+        self.poll_ms = poll_ms
+        self.on_status = on_status
+        self.on_error = on_error
+        self.running = []
+        self.history = deque(maxlen=500)
+        self._latest = {}
+        self._results = queue.Queue()
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='query')
+        widget.after(poll_ms, self._poll)
+
+    def submit(self, fn, *args, key=None, label=None,
+               on_done=None, on_error=None, on_discard=None, cancellable=True):
+        """cancellable=False — задание не прерывается ни новым с тем же key,
+        ни cancel_all (например, CREATE INDEX CONCURRENTLY)."""
+        job = Job(label or getattr(fn, '__name__', 'query'), key)
+        job.on_done, job.on_error, job.on_discard = on_done, on_error, on_discard
+        job.cancellable = cancellable
+        if key is not None:
+            old = self._latest.get(key)
+            if old is not None:
+                self.cancel(old)
+            self._latest[key] = job
+        self.running.append(job)
+        job.future = self._pool.submit(self._run, job, fn, args)
+        self._status(job)
+        return job
+
+    def _run(self, job, fn, args):
+        job.thread = threading.get_ident()
+        job.started = time.monotonic()
+        self._local.job = job
+        result = None
+        try:
+            if not job.cancelled:
+                result = fn(*args)
+        except BaseException as e:
+            job.error = e
+        finally:
+            self._local.job = None
+        job.finished = time.monotonic()
+        self._results.put((job, result))
+
+    def current(self):
+        """Задание, которое выполняет текущий рабочий поток (None вне пула)."""
+        return getattr(self._local, 'job', None)
+
+    def report(self, progress):
+        """Сообщает ход текущего задания; строка состояния обновится при опросе."""
+        job = self.current()
+        if job is not None:
+            job.progress = progress
+
+    def cancel(self, job):
+        if not job.cancellable:
+            return
+        job.cancelled = True
+        if job.future is not None and job.future.cancel():
+            job.finished = time.monotonic()
+            self._results.put((job, None))
+        elif job.thread is not None and job.finished is None:
+            self.db.cancel(job.thread)
+
+    def cancel_all(self):
+        for job in list(self.running):
+            self.cancel(job)
+
+    def shutdown(self):
+        self.cancel_all()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    job, result = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                self._deliver(job, result)
+            moved = [j for j in self.running if j.progress != j._progress_shown]
+            for j in moved:
+                j._progress_shown = j.progress
+            if moved:
+                self._status(moved[-1])
+        finally:
+            self.widget.after(self.poll_ms, self._poll)
+
+    def _deliver(self, job, result):
+        if job in self.running:
+            self.running.remove(job)
+        self.history.append(job)
+        stale = job.cancelled
+        if job.key is not None and self._latest.get(job.key) is job:
+            del self._latest[job.key]
+        elif job.key is not None:
+            stale = True
+        if stale or isinstance(job.error, QueryCanceledError):
+            job.cancelled = True
+            if result is not None and job.on_discard:
+                job.on_discard(result)
+        elif job.error is not None:
+            handler = job.on_error or self.on_error
+            if handler:
+                handler(job.error)
+        elif job.on_done:
+            job.on_done(result)
+        self._status(job)
+
+    def _status(self, job):
+        if self.on_status:
+            self.on_status(self.running, job)
+
+    def stats(self):
+        """Латентность по меткам заданий: число, среднее и максимум, мс."""
+        out = {}
+        for job in self.history:
+            if job.cancelled or job.started is None:
+                continue
+            s = out.setdefault(job.label, {'count': 0, 'wait_ms': 0.0, 'run_ms': 0.0, 'max_ms': 0.0})
+            s['count'] += 1
+            s['wait_ms'] += job.wait_ms
+            s['run_ms'] += job.run_ms
+            s['max_ms'] = max(s['max_ms'], job.run_ms)
+        for s in out.values():
+            s['wait_ms'] /= s['count']
+            s['run_ms'] /= s['count']
+        return out
@@ -0,0 +1,109 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Тяжёлые агрегаты живут дольше, остальные функции — DEFAULT_TTL секунд
+FUNCTION_TTLS = {
+    'get_course_statistics': 300.0,
+    'get_school_course_stats': 300.0,
+    'get_review_summary': 300.0,
+    'get_course_counts_by_district': 300.0,
+    'get_school_year_stats': 300.0,
+    'get_top_instructors': 300.0,
+}
+DEFAULT_TTL = 30.0
+
+_IDENT = re.compile(r'[a-z_][a-z0-9_]*')
+
+
+class ResultCache:
+    """LRU-кэш результатов хранимых функций.
+
+    Запись действительна, пока не истёк TTL функции и не изменились счётчики
+    n_tup_ins/upd/del (pg_stat_user_tables) таблиц, упомянутых в её теле.
+    Статистика PostgreSQL обновляется с задержкой, поэтому TTL остаётся
+    верхней границей устаревания.
+    """
+
+    def __init__(self, db, max_entries=128, default_ttl=DEFAULT_TTL, ttls=None,
+                 stats_interval=1.0):
+        self.db = db
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(FUNCTION_TTLS if ttls is None else ttls)
+        self.stats_interval = stats_interval
+        self.hits = self.misses = self.invalidations = 0
+        self._entries = OrderedDict()  # ключ -> (результат, истекает, версия)
+        self._deps = {}
+        self._stats = {}
+        self._stats_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def call(self, func, params, loader, kind='rows'):
+        try:
+            key = (func, tuple(params or ()), kind)
+            hash(key)
+        except TypeError:
+            return loader()
+        version = self._version(func)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now and entry[2] == version:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.invalidations += 1
+            self.misses += 1
+        value = loader()
+        with self._lock:
+            self._entries[key] = (value, now + self.ttls.get(func, self.default_ttl), version)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, func=None):
+        with self._lock:
+            if func is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == func]:
+                    del self._entries[key]
+            self._stats_at = float('-inf')
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations, 'entries': len(self._entries)}
+
+    def _version(self, func):
+        tables = self._dependencies(func)
+        if not tables:
+            return None
+        stats = self._table_stats()
+        return tuple(stats.get(t) for t in tables)
+
+    def _table_stats(self):
+        now = time.monotonic()
+        if now - self._stats_at > self.stats_interval:
+            # у секционированной таблицы счётчики ведут секции — они суммируются
+            # под именем корневой таблицы
+            self._stats = {r['relname']: r['n'] for r in self.db.fetch_all(
+                "SELECT c.relname, sum(s.n_tup_ins + s.n_tup_upd + s.n_tup_del)::bigint AS n "
+                "FROM pg_stat_user_tables s "
+                "JOIN pg_class c ON c.oid = coalesce(pg_partition_root(s.relid), s.relid) "
+                "WHERE s.schemaname = 'public' GROUP BY c.relname;")}
+            self._stats_at = now
+        return self._stats
+
+    def _dependencies(self, func):
+        if func not in self._deps:
+            rows = self.db.fetch_all(
+                "SELECT p.prosrc FROM pg_proc p JOIN pg_namespace n ON n.oid = p.pronamespace "
+                "WHERE n.nspname = 'public' AND p.proname = %s;", [func])
+            words = set(_IDENT.findall(' '.join(r['prosrc'] for r in rows).lower()))
+            self._deps[func] = tuple(sorted(words & set(self._table_stats())))
+        return self._deps[func]
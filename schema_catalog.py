@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'avtoshkola')
+CACHE_VERSION = 2  # растёт при изменении состава кэша
+
+# Отпечаток схемы: xmin строк каталога меняется при любом DDL над ними
+FINGERPRINT_SQL = """
+SELECT md5(
+  coalesce((SELECT string_agg(c.oid::text || ':' || c.xmin::text, ',' ORDER BY c.oid)
+              FROM pg_class c WHERE c.relnamespace = n.oid AND c.relkind IN ('r','p','v','m')), '') || '|' ||
+  coalesce((SELECT string_agg(a.attrelid::text || '.' || a.attnum || ':' || a.xmin::text, ','
+                              ORDER BY a.attrelid, a.attnum)
+              FROM pg_attribute a JOIN pg_class c ON c.oid = a.attrelid
+             WHERE c.relnamespace = n.oid AND c.relkind IN ('r','p','v','m') AND a.attnum > 0), '') || '|' ||
+  coalesce((SELECT string_agg(p.oid::text || ':' || p.xmin::text, ',' ORDER BY p.oid)
+              FROM pg_proc p WHERE p.pronamespace = n.oid), '') || '|' ||
+  coalesce((SELECT string_agg(k.oid::text || ':' || k.xmin::text, ',' ORDER BY k.oid)
+              FROM pg_constraint k WHERE k.connamespace = n.oid AND k.contype = 'f'), '')
+) AS fingerprint
+FROM pg_namespace n WHERE n.nspname = %s;
+"""
+
+# Таблицы, представления, столбцы, первичные ключи и функции — одним запросом
+CATALOG_SQL = """
+SELECT 'rel' AS kind, c.relname AS name, c.relkind::text AS relkind,
+       a.attnum AS pos, a.attname AS column_name,
+       format_type(a.atttypid, a.atttypmod) AS type, a.attnotnull AS notnull,
+       coalesce(a.attnum = ANY(i.indkey), false) AS is_pk,
+       array_position(i.indkey::int2[], a.attnum) AS pk_pos,
+       NULL::text AS args, NULL::text AS result
+  FROM pg_class c
+  JOIN pg_namespace n ON n.oid = c.relnamespace
+  LEFT JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+  LEFT JOIN pg_index i ON i.indrelid = c.oid AND i.indisprimary
+ WHERE n.nspname = %(schema)s AND c.relkind IN ('r','p','v','m') AND NOT c.relispartition
+UNION ALL
+SELECT 'func', p.proname, NULL, NULL, NULL, NULL, NULL, NULL, NULL,
+       pg_get_function_arguments(p.oid), pg_get_function_result(p.oid)
+  FROM pg_proc p
+  JOIN pg_namespace n ON n.oid = p.pronamespace
+ WHERE n.nspname = %(schema)s AND p.prokind = 'f'
+ ORDER BY 1, 2, 4;
+"""
+
+# Внешние ключи схемы: столбцы в порядке ключа
+FOREIGN_KEYS_SQL = """
+SELECT t.relname AS table, r.relname AS ref_table,
+       array(SELECT a.attname FROM unnest(k.conkey) WITH ORDINALITY AS u(num, i)
+               JOIN pg_attribute a ON a.attrelid = k.conrelid AND a.attnum = u.num
+              ORDER BY u.i) AS columns,
+       array(SELECT a.attname FROM unnest(k.confkey) WITH ORDINALITY AS u(num, i)
+               JOIN pg_attribute a ON a.attrelid = k.confrelid AND a.attnum = u.num
+              ORDER BY u.i) AS ref_columns
+  FROM pg_constraint k
+  JOIN pg_namespace n ON n.oid = k.connamespace
+  JOIN pg_class t ON t.oid = k.conrelid
+  JOIN pg_class r ON r.oid = k.confrelid
+ WHERE n.nspname = %s AND k.contype = 'f'
+ ORDER BY 2, 1, 3;
+"""
+
+# Входные аргументы функций по pg_proc: имя, тип и наличие значения по умолчанию
+FUNCTION_ARGS_SQL = """
+SELECT p.oid, p.proname AS func, p.pronargdefaults AS defaults, a.ord,
+       coalesce(p.proargnames[a.ord], '') AS name, format_type(a.typ, NULL) AS type
+  FROM pg_proc p
+  JOIN pg_namespace n ON n.oid = p.pronamespace
+ CROSS JOIN LATERAL unnest(coalesce(p.proallargtypes, p.proargtypes::oid[]))
+       WITH ORDINALITY AS a(typ, ord)
+ WHERE n.nspname = %s AND p.prokind = 'f'
+   AND coalesce(p.proargmodes[a.ord], 'i') IN ('i', 'b', 'v')
+ ORDER BY p.proname, p.oid, a.ord;
+"""
+
+
+class SchemaCatalog:
+    """Метаданные схемы с дисковым кэшем.
+
+    Кэш привязан к отпечатку схемы: при старте выполняется один лёгкий
+    запрос к pg_catalog, и полная загрузка нужна только после DDL.
+    """
+
+    def __init__(self, db, schema='public', cache_dir=CACHE_DIR):
+        self.db = db
+        self.schema = schema
+        key = hashlib.md5(f"{db.dsn}|{schema}".encode()).hexdigest()[:16]
+        self.cache_path = os.path.join(cache_dir, f"schema_{key}.json") if cache_dir else None
+        self.fingerprint = None
+        self.relations = {}
+        self.functions = {}
+        self.foreign_keys = []
+        self.from_cache = False
+
+    def load(self):
+        fp = self._fingerprint()
+        cached = self._read_cache()
+        if cached and cached.get('fingerprint') == fp and cached.get('version') == CACHE_VERSION:
+            self.fingerprint = fp
+            self.relations, self.functions = cached['relations'], cached['functions']
+            self.foreign_keys = cached.get('foreign_keys', [])
+            self.from_cache = True
+        else:
+            self._load_full(fp)
+        return self
+
+    def check(self):
+        """Перечитывает схему, если она изменилась; возвращает True при изменении."""
+        fp = self._fingerprint()
+        if fp == self.fingerprint:
+            return False
+        self._load_full(fp)
+        return True
+
+    def _fingerprint(self):
+        return self.db.fetch_all(FINGERPRINT_SQL, [self.schema])[0]['fingerprint']
+
+    def _load_full(self, fp):
+        relations, functions = {}, {}
+        for r in self.db.fetch_all(CATALOG_SQL, {'schema': self.schema}):
+            if r['kind'] == 'func':
+                functions.setdefault(r['name'], {'args': r['args'], 'result': r['result']})
+                continue
+            rel = relations.setdefault(r['name'], {'kind': r['relkind'], 'columns': [], 'pk': []})
+            if r['column_name'] is None:
+                continue
+            rel['columns'].append({'name': r['column_name'], 'type': r['type'],
+                                   'notnull': r['notnull']})
+            if r['is_pk']:
+                rel['pk'].append((r['pk_pos'], r['column_name']))
+        for rel in relations.values():
+            rel['pk'] = [name for _, name in sorted(rel['pk'])]
+        self.foreign_keys = [dict(r) for r in self.db.fetch_all(FOREIGN_KEYS_SQL, [self.schema])]
+        for f in functions.values():
+            f['params'] = []
+        owner = {}  # у перегруженной функции берём первую по oid
+        for r in self.db.fetch_all(FUNCTION_ARGS_SQL, [self.schema]):
+            if r['func'] in functions and owner.setdefault(r['func'], r['oid']) == r['oid']:
+                functions[r['func']]['params'].append(
+                    {'name': r['name'], 'type': r['type'], 'defaults': r['defaults']})
+        for f in functions.values():
+            params = f['params']
+            for i, p in enumerate(params):
+                p['default'] = i >= len(params) - p.pop('defaults')
+        self.fingerprint, self.relations, self.functions = fp, relations, functions
+        self.from_cache = False
+        self._write_cache()
+
+    def _read_cache(self):
+        if not self.cache_path:
+            return None
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self):
+        if not self.cache_path:
+            return
+        data = {'version': CACHE_VERSION, 'fingerprint': self.fingerprint,
+                'relations': self.relations, 'functions': self.functions,
+                'foreign_keys': self.foreign_keys}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp = self.cache_path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.cache_path)
+        except OSError:
+            pass
+
+    def tables(self):
+        return sorted(n for n, r in self.relations.items() if r['kind'] in ('r', 'p'))
+
+    def views(self):
+        return sorted(n for n, r in self.relations.items() if r['kind'] in ('v', 'm'))
+
+    def columns(self, relation):
+        return [c['name'] for c in self.relations[relation]['columns']]
+
+    def primary_key(self, relation):
+        return list(self.relations[relation]['pk'])
+
+    def children(self, relation):
+        """Внешние ключи, ссылающиеся на relation: связи 1-N, где она главная."""
+        return [fk for fk in self.foreign_keys if fk['ref_table'] == relation]
@@ -0,0 +1,124 @@
+from psycopg2 import errors
+
+from virtual_grid import RowSource
+
+TEXT_TYPES = ('text', 'character varying', 'character', 'varchar', 'citext')
+
+
+def _is_text(type_name):
+    return type_name.split('(')[0].strip() in TEXT_TYPES
+
+
+class TableSearch:
+    """Поиск по текстовым столбцам таблицы на сервере.
+
+    Для каждой таблицы приложение создаёт GiST-индекс pg_trgm по выражению
+    lower(col1 || ' ' || col2 ...): он обслуживает и LIKE '%терм%', и
+    упорядочивание по близости (документ <->> терм), так что
+    ранжированная страница результатов читается прямо из индекса.
+    """
+
+    def __init__(self, db, catalog):
+        self.db = db
+        self.catalog = catalog
+        self._ready = {}
+
+    def columns(self, table):
+        return [c['name'] for c in self.catalog.relations[table]['columns']
+                if _is_text(c['type']) and not c['name'].endswith('_id')]
+
+    def document(self, table):
+        cols = self.columns(table)
+        if not cols:
+            return None
+        joined = " || ' ' || ".join(f"coalesce({c}::text, '')" for c in cols)
+        return f"lower({joined})"
+
+    def index_name(self, table):
+        return f"{table}_search_trgm"
+
+    def known(self, table):
+        """Состояние индекса уже выяснено (build_index выполнен)."""
+        return table in self._ready
+
+    def index_valid(self, table):
+        """True/False — индекс есть и годен/недостроен; None — индекса нет."""
+        rows = self.db.fetch_all(
+            "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%s);",
+            [self.index_name(table)])
+        return rows[0]['indisvalid'] if rows else None
+
+    def build_index(self, table):
+        """Создаёт индекс поиска, если его нет; False — pg_trgm недоступен.
+
+        Отдельное задание: прерванный CREATE INDEX CONCURRENTLY оставляет
+        индекс INVALID, поэтому такой сначала удаляется и строится заново.
+        """
+        if table in self._ready:
+            return self._ready[table]
+        doc = self.document(table)
+        if doc is None:
+            self._ready[table] = False
+            return False
+        valid = self.index_valid(table)
+        if not valid:
+            try:
+                if valid is False:
+                    self.db.execute_autocommit(
+                        f"DROP INDEX CONCURRENTLY IF EXISTS {self.index_name(table)};")
+                self.db.execute_autocommit("CREATE EXTENSION IF NOT EXISTS pg_trgm;")
+                self.db.execute_autocommit(
+                    f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {self.index_name(table)} "
+                    f"ON {table} USING gist (({doc}) gist_trgm_ops);")
+            except (errors.InsufficientPrivilege, errors.UndefinedFile, errors.FeatureNotSupported):
+                self._ready[table] = False
+                return False
+            valid = self.index_valid(table)
+        self._ready[table] = bool(valid)
+        return self._ready[table]
+
+    def drop_index(self, table):
+        self.db.execute_autocommit(f"DROP INDEX CONCURRENTLY IF EXISTS {self.index_name(table)};")
+        self._ready.pop(table, None)
+
+    def source(self, table, term):
+        """Ранжированные результаты поиска постранично (см. SearchSource).
+
+        Индекс здесь не строится: пока build_index не завершился, результаты
+        идут без ранжирования.
+        """
+        ranked = self._ready.get(table, False)
+        return SearchSource(self.db, table, self.document(table), term.lower(), ranked)
+
+
+class SearchSource(RowSource):
+    def __init__(self, db, table, document, term, ranked):
+        super().__init__()
+        self.db = db
+        like = '%' + term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        # <->> — расстояние от терма до ближайшего слова документа; порядок
+        # «индексируемое выражение <->> константа» обслуживается GiST-индексом
+        order = f"{document} <->> %(term)s" if ranked else "1"
+        self._sql = (f"SELECT t.* FROM {table} AS t WHERE {document} LIKE %(like)s "
+                     f"ORDER BY {order} LIMIT %(limit)s OFFSET %(offset)s;")
+        self._params = {'term': term, 'like': like, 'limit': self.page_size}
+        self._done = False
+        self.columns, rows = self._query(0)
+        self._pages[0] = rows
+        self._record(0, rows)
+        if not self._done:
+            self.prefetch(1)
+
+    def _query(self, page):
+        params = dict(self._params, offset=page * self.page_size)
+        return self.db.fetch_columns(self._sql, params)
+
+    def _record(self, page, rows):
+        seen = page * self.page_size + len(rows)
+        self._done = len(rows) < self.page_size
+        self.total = seen if self._done else max(self.total, seen + self.page_size)
+
+    def _load(self, page):
+        _, rows = self._query(page)
+        self._record(page, rows)
+        return rows
@@ -0,0 +1,457 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from tkinter import ttk
+
+PAGE_SIZE = 200
+CACHED_PAGES = 16           # страниц в памяти у KeysetSource
+EXACT_COUNT_LIMIT = 200000  # ниже этой оценки pg_class считаем строки точно
+HEADER_HEIGHT = 25
+PAGE_POLL_MS = 30           # как часто сетка проверяет, дочитались ли страницы
+PLACEHOLDER = '…'
+MAX_PATCH_KEYS = 1000       # больше изменённых строк — страницы перечитываются
+
+
+class RowSource:
+    """Постраничный источник строк для VirtualGrid.
+
+    Страницы читаются одним фоновым потоком: rows() ждёт только недостающие
+    страницы, peek() не ждёт вовсе, а следующая за видимой загружается заранее.
+    """
+
+    page_size = PAGE_SIZE
+    cached_pages = CACHED_PAGES
+
+    def __init__(self):
+        self.columns = []
+        self.total = 0
+        self._pages = OrderedDict()
+        self._pending = {}
+        self._generation = 0  # растёт при сбросе страниц; старые загрузки не сохраняются
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _load(self, page):
+        raise NotImplementedError
+
+    def _fetch(self, page):
+        try:
+            generation = self._generation
+            rows = self._load(page)
+            with self._lock:
+                if generation != self._generation:
+                    return rows
+                self._pages[page] = rows
+                while self.cached_pages and len(self._pages) > self.cached_pages:
+                    self._pages.popitem(last=False)
+            return rows
+        finally:
+            with self._lock:
+                self._pending.pop(page, None)
+
+    def _submit(self, page):
+        # вызывается под self._lock
+        fut = self._pending.get(page)
+        if fut is None:
+            fut = self._pending[page] = self._executor.submit(self._fetch, page)
+        return fut
+
+    def page(self, page):
+        with self._lock:
+            if page in self._pages:
+                self._pages.move_to_end(page)
+                return self._pages[page]
+            fut = self._submit(page)
+        return fut.result()
+
+    def prefetch(self, page):
+        with self._lock:
+            if page not in self._pages:
+                self._submit(page)
+
+    def rows(self, start, stop):
+        out = []
+        page = start // self.page_size
+        while start < stop:
+            data = self.page(page)
+            base = page * self.page_size
+            out.extend(data[start - base:stop - base])
+            if len(data) < self.page_size:
+                return out
+            page += 1
+            start = page * self.page_size
+        if page * self.page_size < self.total:
+            self.prefetch(page)
+        return out
+
+    def peek(self, start, stop):
+        """Строки [start, stop) из кэша, не дожидаясь чтения: вместо строк
+        недостающих страниц — None, их загрузки возвращаются вторым значением."""
+        out, waiting = [], []
+        page = start // self.page_size
+        while start < stop:
+            with self._lock:
+                data = self._pages.get(page)
+                if data is None:
+                    waiting.append(self._submit(page))
+                else:
+                    self._pages.move_to_end(page)
+            base = page * self.page_size
+            if data is None:
+                n = min(stop, base + self.page_size, self.total) - start
+                if n <= 0:
+                    break
+                out.extend([None] * n)
+            else:
+                out.extend(data[start - base:stop - base])
+                if len(data) < self.page_size:
+                    return out, waiting
+            page += 1
+            start = page * self.page_size
+        if not waiting and page * self.page_size < self.total:
+            self.prefetch(page)
+        return out, waiting
+
+    def apply_changes(self, changes):
+        """Учитывает изменения строк [(op, keys)]; True, если нужно перерисовать."""
+        self.invalidate(0)
+        return True
+
+    def invalidate(self, first_page):
+        """Сбрасывает страницы начиная с first_page; они перечитаются при показе."""
+        with self._lock:
+            self._generation += 1
+            for page in [p for p in self._pages if p >= first_page]:
+                del self._pages[page]
+
+    def _cancel_pending(self):
+        with self._lock:
+            for fut in self._pending.values():
+                fut.cancel()
+
+    def close(self):
+        self._cancel_pending()
+        self._executor.shutdown(wait=False)
+
+
+class KeysetSource(RowSource):
+    """Таблица с первичным ключом: страницы по условию (pk) > (последний ключ)."""
+
+    def __init__(self, db, relation, key):
+        super().__init__()
+        self.db, self.relation, self.key = db, relation, key
+        self._keys = ', '.join(key)
+        self._bounds = {}  # страница -> ключ её последней строки
+        self.columns, rows = db.fetch_columns(
+            f"SELECT * FROM {relation} ORDER BY {self._keys} LIMIT %s;", [self.page_size])
+        self._key_idx = [self.columns.index(k) for k in key]
+        self.total = len(rows) if len(rows) < self.page_size else self._estimate()
+        self._record(0, rows)
+        self._pages[0] = rows
+        if self.total > self.page_size:
+            self.prefetch(1)
+
+    def _estimate(self):
+        n = self.db.fetch_all(
+            "SELECT reltuples::bigint AS n FROM pg_class WHERE oid = %s::regclass;",
+            [self.relation])[0]['n']
+        if 0 <= n < EXACT_COUNT_LIMIT:
+            n = self.db.fetch_all(f"SELECT count(*) AS n FROM {self.relation};")[0]['n']
+        return max(n, self.page_size + 1)
+
+    def _key(self, row):
+        return tuple(row[i] for i in self._key_idx)
+
+    def invalidate(self, first_page):
+        super().invalidate(first_page)
+        with self._lock:
+            for page in [p for p in self._bounds if p >= first_page]:
+                del self._bounds[page]
+
+    def _first_page(self, keys):
+        # первая страница, в диапазон которой попадает наименьший из keys;
+        # границы пишет поток загрузки страниц, поэтому читаются под блокировкой
+        with self._lock:
+            bounds = sorted(self._bounds.items())
+        try:
+            key = min(keys)
+            for page, last in bounds:
+                if last >= key:
+                    return page
+        except TypeError:
+            return 0
+        return bounds[-1][0] if bounds else 0
+
+    def apply_changes(self, changes):
+        """Обновлённые строки перечитываются по ключу и заменяются в кэше на месте;
+        вставка и удаление сдвигают позиции, поэтому сбрасываются страницы
+        начиная с первой затронутой."""
+        first = None
+        for op, keys in changes:
+            if keys is None:
+                first = 0
+                continue
+            keys = [tuple(k) for k in keys]
+            if op == 'U' and len(keys) <= MAX_PATCH_KEYS and self._patch(keys):
+                continue
+            page = self._first_page(keys)
+            first = page if first is None else min(first, page)
+            if op == 'I':
+                self.total += len(keys)
+            elif op == 'D':
+                self.total = max(0, self.total - len(keys))
+        if first is not None:
+            self.invalidate(first)
+        return True
+
+    def _patch(self, keys):
+        row_ph = '(' + ', '.join(['%s'] * len(self.key)) + ')'
+        _, rows = self.db.fetch_columns(
+            f"SELECT * FROM {self.relation} WHERE ({self._keys}) IN "
+            f"({', '.join([row_ph] * len(keys))});", [v for k in keys for v in k])
+        fresh = {self._key(r): r for r in rows}
+        if len(fresh) < len(keys):
+            return False  # ключ изменён или строка удалена следом — сдвиг позиций
+        with self._lock:
+            for data in self._pages.values():
+                for i, row in enumerate(data):
+                    new = fresh.get(self._key(row))
+                    if new is not None:
+                        data[i] = new
+        return True
+
+    def _record(self, page, rows):
+        if rows:
+            with self._lock:
+                self._bounds[page] = self._key(rows[-1])
+        seen = page * self.page_size + len(rows)
+        if len(rows) < self.page_size:
+            self.total = seen
+        elif self.total <= seen:
+            self.total = seen + 1
+
+    def _anchor(self, page):
+        # Прыжок ползунком дальше прочитанного: граничный ключ ищется от
+        # ближайшей известной границы по индексу первичного ключа.
+        with self._lock:
+            known = {p: k for p, k in self._bounds.items() if p < page - 1}
+        base = max(known) if known else None
+        skip = (page - (base + 1 if base is not None else 0)) * self.page_size - 1
+        where, params = '', []
+        if base is not None:
+            where = f"WHERE ({self._keys}) > ({', '.join(['%s'] * len(self.key))})"
+            params = list(known[base])
+        _, rows = self.db.fetch_columns(
+            f"SELECT {self._keys} FROM {self.relation} {where} "
+            f"ORDER BY {self._keys} LIMIT 1 OFFSET %s;", params + [skip])
+        return rows[0] if rows else None
+
+    def _load(self, page):
+        generation = self._generation
+        after = self._bounds.get(page - 1) if page else None
+        if page and after is None:
+            after = self._anchor(page)
+            if after is None:
+                return []
+        where, params = '', []
+        if after is not None:
+            where = f"WHERE ({self._keys}) > ({', '.join(['%s'] * len(self.key))})"
+            params = list(after)
+        _, rows = self.db.fetch_columns(
+            f"SELECT * FROM {self.relation} {where} ORDER BY {self._keys} LIMIT %s;",
+            params + [self.page_size])
+        if generation == self._generation:
+            self._record(page, rows)
+        return rows
+
+
+class IterSource(RowSource):
+    """Произвольный поток строк (представление, результат функции, поиск).
+
+    Перемотать итератор назад нельзя, поэтому прочитанные строки хранятся;
+    объём памяти растёт только с глубиной прокрутки.
+    """
+
+    cached_pages = None
+
+    def __init__(self, rows, columns=None):
+        super().__init__()
+        self._it = iter(rows)
+        self._data = []
+        self._done = False
+        self.columns = list(columns or [])
+        # генератор iter_rows берёт соединение при первом чтении: оно должно
+        # произойти в потоке источника, где потом читаются страницы и вызывается close
+        self.page(0)
+        if not self._done:
+            self.prefetch(1)
+
+    def _pull(self, upto):
+        while not self._done and len(self._data) < upto:
+            chunk = list(islice(self._it, self.page_size))
+            if chunk and not self.columns and hasattr(chunk[0], 'keys'):
+                self.columns = list(chunk[0].keys())
+            if chunk and hasattr(chunk[0], 'keys'):
+                chunk = [tuple(r[c] for c in self.columns) for r in chunk]
+            self._data.extend(chunk)
+            self._done = len(chunk) < self.page_size
+        self.total = len(self._data) + (0 if self._done else self.page_size)
+
+    def _load(self, page):
+        start = page * self.page_size
+        self._pull(start + self.page_size)
+        return self._data[start:start + self.page_size]
+
+    def close(self):
+        # генератор закрывается в том же потоке, который его читал
+        self._cancel_pending()
+        close = getattr(self._it, 'close', None)
+        if close:
+            self._executor.submit(close)
+        self._executor.shutdown(wait=False)
+
+
+def primary_key(db, relation):
+    rows = db.fetch_all(
+        "SELECT a.attname FROM pg_index i "
+        "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+        "WHERE i.indrelid = %s::regclass AND i.indisprimary "
+        "ORDER BY array_position(i.indkey::int2[], a.attnum);", [relation])
+    return [r['attname'] for r in rows]
+
+
+def relation_source(db, relation, key=None):
+    if key is None:
+        key = primary_key(db, relation)
+    if key:
+        return KeysetSource(db, relation, key)
+    return IterSource(db.iter_rows(f"SELECT * FROM {relation};"))
+
+
+class VirtualGrid(ttk.Frame):
+    """Treeview, в котором существуют только видимые строки.
+
+    При прокрутке элементы не создаются заново, а получают значения
+    следующего окна строк из источника.
+    """
+
+    def __init__(self, parent, col_filter=None):
+        super().__init__(parent)
+        self.col_filter = col_filter or (lambda c: True)
+        self.source = None
+        self.offset = 0
+        self._visible = 20
+        self._idx = []
+        self._shown = []
+        self._loading = []   # загрузки страниц, которых ждёт текущее окно
+        self._poll_id = None
+
+        self.y_scroll = ttk.Scrollbar(self, orient='vertical', command=self._on_scroll)
+        x_scroll = ttk.Scrollbar(self, orient='horizontal')
+        self.tree = ttk.Treeview(self, show='headings', xscrollcommand=x_scroll.set)
+        x_scroll.config(command=self.tree.xview)
+        x_scroll.pack(side='bottom', fill='x')
+        self.y_scroll.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', lambda e: self.scroll_by(-3 if e.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda e: self.scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda e: self.scroll_by(3))
+        self.tree.bind('<Prior>', lambda e: self.scroll_by(-self._visible))
+        self.tree.bind('<Next>', lambda e: self.scroll_by(self._visible))
+
+    def set_source(self, source):
+        if self.source is not None:
+            self.source.close()
+        self.source = source
+        self.offset = 0
+        self._loading = []
+        cols = [c for c in source.columns if self.col_filter(c)] if source else []
+        self._idx = [source.columns.index(c) for c in cols] if source else []
+        self.tree.delete(*self.tree.get_children())
+        self.tree['columns'] = cols
+        for c in cols:
+            self.tree.heading(c, text=c)
+            self.tree.column(c, width=120)
+        self.render()
+
+    def clear(self):
+        self.set_source(None)
+
+    def render(self):
+        # поток Tk не ждёт чтения: недочитанные строки показываются заглушками,
+        # а окно перерисовывается, когда загрузятся их страницы
+        rows, self._loading = (self.source.peek(self.offset, self.offset + self._visible)
+                               if self.source else ([], []))
+        if self._loading and self._poll_id is None:
+            self._poll_id = self.after(PAGE_POLL_MS, self._await_pages)
+        items = self.tree.get_children()
+        if len(items) > len(rows):
+            self.tree.delete(*items[len(rows):])
+        for i, row in enumerate(rows):
+            values = [PLACEHOLDER] * len(self._idx) if row is None else [row[j] for j in self._idx]
+            if i < len(items):
+                self.tree.item(items[i], values=values)
+            else:
+                self.tree.insert('', 'end', values=values)
+        self._shown = rows
+        total = self.source.total if self.source else 0
+        if total:
+            self.y_scroll.set(self.offset / total, min(1.0, (self.offset + len(rows)) / total))
+        else:
+            self.y_scroll.set(0, 1)
+
+    def _await_pages(self):
+        self._poll_id = None
+        if not self._loading:
+            return
+        if not all(f.done() for f in self._loading):
+            self._poll_id = self.after(PAGE_POLL_MS, self._await_pages)
+            return
+        failed = any(f.cancelled() or f.exception() for f in self._loading)
+        self._loading = []
+        if not failed:  # иначе страница перечитается при следующей прокрутке
+            self.render()
+
+    def window(self):
+        """Диапазон строк источника, который сейчас на экране."""
+        return self.offset, self.offset + self._visible
+
+    def scroll_to(self, offset):
+        total = self.source.total if self.source else 0
+        offset = max(0, min(int(offset), total - self._visible))
+        if offset != self.offset:
+            self.offset = offset
+            self.tree.selection_remove(self.tree.selection())
+            self.render()
+            self.event_generate('<<GridScrolled>>')
+
+    def scroll_by(self, n):
+        self.scroll_to(self.offset + n)
+        return 'break'
+
+    def shown_rows(self):
+        cols = self.source.columns if self.source else []
+        return [dict(zip(cols, row)) for row in self._shown if row is not None]
+
+    def selected_rows(self):
+        cols = self.source.columns if self.source else []
+        rows = [self._shown[self.tree.index(iid)] for iid in self.tree.selection()]
+        return [dict(zip(cols, row)) for row in rows if row is not None]
+
+    def _on_scroll(self, *args):
+        if args[0] == 'moveto':
+            total = self.source.total if self.source else 0
+            self.scroll_to(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = self._visible if args[2] == 'pages' else 1
+            self.scroll_by(int(args[1]) * step)
+
+    def _on_resize(self, event):
+        rowheight = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        visible = max(1, (event.height - HEADER_HEIGHT) // rowheight)
+        if visible != self._visible:
+            self._visible = visible
+            self.render()
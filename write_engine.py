@@ -0,0 +1,263 @@
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+_INT = ('smallint', 'integer', 'bigint')
+_NUM = ('numeric', 'money', 'real', 'double precision')
+_LENGTH = re.compile(r'^(?:character varying|character|varchar|char)\((\d+)\)$')
+_TRUE = {'1', 't', 'true', 'да', 'y', 'yes'}
+_FALSE = {'0', 'f', 'false', 'нет', 'n', 'no'}
+
+
+class ValidationError(ValueError):
+    def __init__(self, errors):
+        super().__init__('; '.join(errors))
+        self.errors = errors
+
+
+class WriteConflict(Exception):
+    """Строки изменены или удалены другим пользователем после чтения.
+
+    conflicts — [(операция, ключ)], пакет целиком откатан.
+    """
+
+    def __init__(self, conflicts):
+        super().__init__(f"Конфликт записи: {len(conflicts)} строк изменены другим пользователем")
+        self.conflicts = conflicts
+
+
+def convert(column, value):
+    """Значение из формы (строка) в тип столбца по описанию каталога."""
+    typ = column['type']
+    if isinstance(value, str):
+        value = value.strip()
+        if value == '' and not _LENGTH.match(typ) and typ != 'text':
+            value = None
+    if value is None:
+        if column['notnull']:
+            raise ValueError(f"{column['name']}: обязательное поле")
+        return None
+    if not isinstance(value, str):
+        return value
+    base = typ.split('(')[0]
+    try:
+        if base in _INT:
+            return int(value)
+        if base in _NUM:
+            return Decimal(value.replace(' ', '').replace(',', '.'))
+        if base == 'date':
+            return date.fromisoformat(value)
+        if base.startswith('timestamp'):
+            return datetime.fromisoformat(value)
+        if base == 'boolean':
+            if value.lower() in _TRUE:
+                return True
+            if value.lower() in _FALSE:
+                return False
+            raise ValueError(value)
+    except (ValueError, InvalidOperation):
+        raise ValueError(f"{column['name']}: «{value}» не подходит для типа {typ}") from None
+    m = _LENGTH.match(typ)
+    if m and len(value) > int(m.group(1)):
+        raise ValueError(f"{column['name']}: длиннее {m.group(1)} символов")
+    return value
+
+
+class WriteBatch:
+    """Очередь правок одной таблицы, фиксируемая одной транзакцией.
+
+    Обновление и удаление запоминают xmin строки на момент чтения: при
+    фиксации строка меняется, только если xmin тот же (оптимистическая
+    блокировка). Вставки, обновления и удаления уходят на сервер по одному
+    выражению execute_values на вид операции (и набор столбцов) — сотня
+    правок занимает несколько обращений к серверу, а не сотню.
+    """
+
+    def __init__(self, db, catalog, table):
+        self.db = db
+        self.table = table
+        self.columns = {c['name']: c for c in catalog.relations[table]['columns']}
+        self.key = catalog.primary_key(table)
+        if not self.key:
+            raise ValueError(f"У таблицы {table} нет первичного ключа")
+        self.inserts = []
+        self.updates = {}  # ключ -> (xmin, старая строка, новые значения)
+        self.deletes = {}  # ключ -> (xmin, старая строка)
+
+    def __len__(self):
+        return len(self.inserts) + len(self.updates) + len(self.deletes)
+
+    def clear(self):
+        self.inserts, self.updates, self.deletes = [], {}, {}
+
+    def detach(self):
+        """Забирает очередь в отдельный пакет, оставляя эту пустой.
+
+        Вызывается в потоке Tk перед фиксацией в рабочем потоке: правки,
+        сделанные во время сохранения, копятся в новой очереди и не
+        теряются и не меняют фиксируемую.
+        """
+        queue = WriteBatch.__new__(WriteBatch)
+        queue.db, queue.table, queue.columns, queue.key = self.db, self.table, self.columns, self.key
+        queue.inserts, queue.updates, queue.deletes = self.inserts, self.updates, self.deletes
+        self.clear()
+        return queue
+
+    def merge(self, queue):
+        """Возвращает несохранённую очередь detach(); более поздние правки главнее."""
+        self.inserts = queue.inserts + self.inserts
+        for key, (xmin, old, values) in queue.updates.items():
+            if key in self.deletes:
+                continue
+            if key in self.updates:
+                values = {**values, **self.updates[key][2]}
+            self.updates[key] = (xmin, old, values)
+        for key, entry in queue.deletes.items():
+            self.updates.pop(key, None)
+            self.deletes.setdefault(key, entry)
+
+    def key_of(self, row):
+        return tuple(row[k] for k in self.key)
+
+    def snapshot(self, keys):
+        """{ключ: (xmin, строка)} — текущее состояние строк для правки."""
+        if not keys:
+            return {}
+        ph = '(' + ', '.join(['%s'] * len(self.key)) + ')'
+        rows = self.db.fetch_all(
+            f"SELECT xmin::text AS xmin__, * FROM {self.table} "
+            f"WHERE ({', '.join(self.key)}) IN ({', '.join([ph] * len(keys))});",
+            [v for k in keys for v in k])
+        return {self.key_of(r): (r.pop('xmin__'), dict(r)) for r in rows}
+
+    def validate(self, values, partial=False):
+        out, errors = {}, []
+        for name, value in values.items():
+            if name not in self.columns:
+                errors.append(f"{name}: нет такого столбца")
+                continue
+            try:
+                out[name] = convert(self.columns[name], value)
+            except ValueError as e:
+                errors.append(str(e))
+        if not partial:
+            # ключ со значением по умолчанию (serial/identity) можно не задавать
+            errors += [f"{n}: обязательное поле" for n, c in self.columns.items()
+                       if c['notnull'] and n not in out and n not in self.key]
+        if errors:
+            raise ValidationError(errors)
+        return out
+
+    def add(self, values):
+        self.inserts.append(self.validate(values))
+
+    def edit(self, key, xmin, old, values):
+        values = self.validate(values, partial=True)
+        if key in self.updates:
+            xmin, old, queued = self.updates[key]
+            values = {**queued, **values}
+        if values:
+            self.updates[key] = (xmin, old, values)
+
+    def delete(self, key, xmin, old):
+        self.updates.pop(key, None)
+        self.deletes[key] = (xmin, old)
+
+    def _typed(self, names, extra=()):
+        return '(' + ', '.join([f"%s::{self.columns[n]['type']}" for n in names]
+                               + [f"%s::{t}" for t in extra]) + ')'
+
+    def _run(self, sql, rows, template):
+        names, res = self.db.execute_values_returning(sql, rows, template)
+        return [dict(zip(names, r)) for r in res]
+
+    def commit(self):
+        """Фиксирует очередь; возвращает пакет для отмены или бросает WriteConflict."""
+        if not len(self):
+            return None
+        undo = WriteBatch.__new__(WriteBatch)
+        undo.db, undo.table, undo.columns, undo.key = self.db, self.table, self.columns, self.key
+        undo.clear()
+        conflicts = []
+        keys = ', '.join(self.key)
+        match = ' AND '.join(f"t.{k} = v.{k}" for k in self.key)
+        with self.db.transaction():
+            if self.deletes:
+                rows = self._run(
+                    f"DELETE FROM {self.table} AS t USING (VALUES %s) AS v({keys}, xmin__) "
+                    f"WHERE {match} AND t.xmin::text = v.xmin__ RETURNING t.*",
+                    [k + (x,) for k, (x, _) in self.deletes.items()],
+                    self._typed(self.key, ['text']))
+                done = {self.key_of(r) for r in rows}
+                conflicts += [('delete', k) for k in self.deletes if k not in done]
+                undo.inserts += rows
+            groups = {}
+            for k, (x, old, values) in self.updates.items():
+                groups.setdefault(tuple(sorted(values)), []).append((k, x, old, values))
+            for names, items in groups.items():
+                rows = self._run(
+                    f"UPDATE {self.table} AS t SET {', '.join(f'{n} = v.{n}' for n in names)} "
+                    f"FROM (VALUES %s) AS v({keys}, {', '.join(names)}, xmin__) "
+                    f"WHERE {match} AND t.xmin::text = v.xmin__ RETURNING t.xmin::text AS xmin__, t.*",
+                    [k + tuple(v[n] for n in names) + (x,) for k, x, _, v in items],
+                    self._typed(self.key + list(names), ['text']))
+                fresh = {self.key_of(r): r for r in rows}
+                for k, _, old, values in items:
+                    if k not in fresh:
+                        conflicts.append(('update', k))
+                        continue
+                    new = fresh[k]
+                    undo.updates[k] = (new.pop('xmin__'), new, {n: old[n] for n in values})
+            for names in dict.fromkeys(tuple(sorted(v)) for v in self.inserts):
+                items = [v for v in self.inserts if tuple(sorted(v)) == names]
+                # строка из одних значений по умолчанию: (DEFAULT) в первый столбец ключа
+                rows = self._run(
+                    f"INSERT INTO {self.table} ({', '.join(names or self.key[:1])}) VALUES %s "
+                    f"RETURNING xmin::text AS xmin__, *",
+                    [tuple(v[n] for n in names) for v in items],
+                    self._typed(names) if names else '(DEFAULT)')
+                for r in rows:
+                    undo.deletes[self.key_of(r)] = (r.pop('xmin__'), r)
+            if conflicts:
+                raise WriteConflict(conflicts)
+        self.clear()
+        return undo
+
+
+class WriteEngine:
+    """Очереди правок по таблицам и отмена последнего зафиксированного пакета."""
+
+    def __init__(self, db, catalog):
+        self.db = db
+        self.catalog = catalog
+        self.batches = {}
+        self.last = None  # пакет, отменяющий последнюю фиксацию
+
+    def batch(self, table):
+        if table not in self.batches:
+            self.batches[table] = WriteBatch(self.db, self.catalog, table)
+        return self.batches[table]
+
+    def pending(self):
+        return sum(len(b) for b in self.batches.values())
+
+    def detach(self, table):
+        """Очередь таблицы для commit(); вызывается в потоке Tk."""
+        return self.batch(table).detach()
+
+    def merge(self, queue):
+        self.batch(queue.table).merge(queue)
+
+    def commit(self, queue):
+        undo = queue.commit()
+        if undo is not None:
+            self.last = undo
+        return undo
+
+    def undo(self):
+        """Отменяет последний пакет той же оптимистической проверкой xmin."""
+        if self.last is None:
+            return None
+        redo = self.last.commit()
+        self.last = None
+        return redo